@@ -0,0 +1,77 @@
+"""
+小说归档的基准测试：把同一批模拟章节分别写成纯文本和各种压缩方式的归档，比较文件大小、写入耗时、
+随机读取单章的耗时，并检查从归档导出的纯文本与直接写入的纯文本完全一致。
+
+模拟章节的正文重复度远高于真实小说，压缩率只能用来比较各压缩方式，不代表真实语料的压缩率。
+
+用法：python -m mytest.archive_benchmark [章节数]
+"""
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+
+from novel_crawler.NovelArchive import NovelArchiveReader, NovelArchiveWriter, create_chapter_codec
+from novel_crawler.NovelArchive import index_path_for, train_dictionary
+
+
+def chapter_text(chapter_id: int, lines: int = 60) -> str:
+    """与mock_pages.chapter_page解析后的正文相同的格式"""
+    rnd = random.Random(chapter_id)
+    return '\n'.join(f'第{chapter_id}章第{i}段，{"这是正文内容" * rnd.randint(3, 12)}。' for i in range(lines))
+
+
+def codecs(chapters: list[tuple[str, str]]) -> list[tuple[str, object]]:
+    result = [('zlib', create_chapter_codec('zlib'))]
+    samples = [content.encode('utf-8') for _, content in chapters[:2000]]
+    try:
+        dictionary = train_dictionary(samples)
+    except ImportError as e:
+        # 没有安装zstandard时，用样本章节的末尾作为zlib的预设字典
+        print(f"跳过zstd：{e}")
+        result.append(('zlib+字典', create_chapter_codec('zlib', b''.join(samples)[-32768:])))
+        return result
+    result.append(('zlib+字典', create_chapter_codec('zlib', dictionary)))
+    result.append(('zstd', create_chapter_codec('zstd')))
+    result.append(('zstd+字典', create_chapter_codec('zstd', dictionary)))
+    return result
+
+
+def main(count: int = 5000, reads: int = 2000):
+    chapters = [(f'第{i}章', chapter_text(i)) for i in range(count)]
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, 'novel.txt')
+    start = time.perf_counter()
+    with open(text_path, 'wb') as f:
+        for title, content in chapters:
+            f.write(f"{title}\n{content}\n\n".encode('utf-8'))
+    text_seconds = time.perf_counter() - start
+    text_bytes = os.path.getsize(text_path)
+
+    print(f"{'格式':<12}{'字节数':>12}{'压缩率':>8}{'写入 章/秒':>14}{'随机读 章/秒':>14}{'导出一致':>10}")
+    print(f"{'txt':<14}{text_bytes:>14}{1:>10.2f}{count / text_seconds:>16.0f}{'-':>16}{'-':>12}")
+    order = [random.randrange(count) for _ in range(reads)]
+    for name, codec in codecs(chapters):
+        path = os.path.join(directory, f'{name}.nca')
+        start = time.perf_counter()
+        with NovelArchiveWriter(path, codec) as writer:
+            for title, content in chapters:
+                writer.append(title, content)
+        write_seconds = time.perf_counter() - start
+        size = os.path.getsize(path) + os.path.getsize(index_path_for(path))
+        with NovelArchiveReader(path, codec) as reader:
+            start = time.perf_counter()
+            for index in order:
+                reader.chapter(index)
+            read_seconds = time.perf_counter() - start
+            export_path = path + '.txt'
+            reader.export_text(export_path)
+        identical = filecmp.cmp(text_path, export_path, shallow=False)
+        print(f"{name:<12}{size:>14}{text_bytes / size:>10.2f}{count / write_seconds:>16.0f}"
+              f"{reads / read_seconds:>16.0f}{str(identical):>12}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
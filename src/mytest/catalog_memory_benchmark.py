@@ -0,0 +1,101 @@
+"""
+小说目录内存占用的基准测试：分别用旧版的普通dataclass、当前的NovelMetadata和NovelCatalog保存同样的小说，
+用tracemalloc统计每本小说占用的字节数，并比较NovelCatalog与逐行对象上筛选、取前N名的耗时和结果。
+
+用法：python -m mytest.catalog_memory_benchmark [小说数量]
+"""
+import gc
+import heapq
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from mytest import mock_pages
+from novel_crawler.NovelCatalog import NovelCatalog
+from novel_crawler.NovelCrawlerFactory import NovelMetadata
+from novel_crawler.impl.UjPageParser import novel_status_from_update_time, parse_word_count
+
+BASE_URL = 'http://www.ujxsw.org/'
+
+
+@dataclass
+class LegacyNovelMetadata:
+    """改为__slots__和不可变之前的NovelMetadata"""
+    id: str
+    title: str
+    author: str
+    tag: str
+    status: str
+    word_count: int
+    update_time: str
+    description: str
+    cover_url: str
+    catalog_url: str
+    clicks: int = 0
+    recommends: int = 0
+    favorites: int = 0
+
+
+def metadata_fields(book_id: int) -> dict:
+    """模拟解析详情页得到的字段，每个字符串都是新创建的对象，和真实解析的结果一样"""
+    info = mock_pages.book_info(book_id)
+    tag = mock_pages.TAGS[info['tag']]
+    return dict(
+        id=str(book_id),
+        title=info['title'],
+        author=info['author'],
+        tag=tag.encode().decode(),
+        status=novel_status_from_update_time(info['update_time']).encode().decode(),
+        word_count=parse_word_count(info['word_count']),
+        update_time=info['update_time'],
+        description=f'{info["title"]}是一部{tag}小说。主角一路逆袭，踏上巅峰。' * 3,
+        cover_url=f'{BASE_URL}files/article/image/{book_id // 1000}/{book_id}/{book_id}s.jpg',
+        catalog_url=f'{BASE_URL}read/{book_id}/',
+        clicks=info['clicks'],
+        recommends=info['recommends'],
+        favorites=info['favorites']
+    )
+
+
+def measure(build) -> tuple[object, int]:
+    """返回build()的结果和构建期间净增的内存字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main(count: int = 20000):
+    book_ids = range(1, count + 1)
+    # 每种表示都从解析结果重新构建，字符串对象各自独立，统计的是该表示真正持有的全部内存
+    legacy, legacy_bytes = measure(lambda: [LegacyNovelMetadata(**metadata_fields(i)) for i in book_ids])
+    del legacy
+    catalog, catalog_bytes = measure(lambda: NovelCatalog(NovelMetadata(**metadata_fields(i)) for i in book_ids))
+    novels, novels_bytes = measure(lambda: [NovelMetadata(**metadata_fields(i)) for i in book_ids])
+
+    print(f"{'表示方式':<24}{'总字节数':>14}{'字节/本':>10}")
+    for name, total in (('dataclass（旧版）', legacy_bytes), ('NovelMetadata', novels_bytes),
+                        ('NovelCatalog', catalog_bytes)):
+        print(f"{name:<26}{total:>16}{total / count:>12.1f}")
+
+    start = time.perf_counter()
+    expected = heapq.nlargest(10, (novel for novel in novels if novel.tag == '玄幻' and novel.status == '完结'),
+                              key=lambda novel: novel.word_count)
+    rows_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    selected = catalog.filter(tag='玄幻', status='完结')
+    top = list(catalog.rows(catalog.top_n('word_count', 10, selected)))
+    catalog_seconds = time.perf_counter() - start
+    print(f"筛选玄幻完结并取字数前10：逐行对象 {rows_seconds * 1000:.1f}ms，"
+          f"NovelCatalog {catalog_seconds * 1000:.1f}ms，"
+          f"结果一致 {[novel.word_count for novel in top] == [novel.word_count for novel in expected]}")
+    print(f"还原后与原对象一致：{all(catalog.row(i) == novels[i] for i in range(0, count, max(1, count // 1000)))}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,161 @@
+"""
+爬虫的端到端基准测试：在本地模拟站点上依次运行爬虫的各个方法和整本小说的下载，每个场景报告
+请求数/秒、章节数/秒、请求延迟的p50/p95/p99、解析占用的CPU时间与其余CPU时间（网络I/O、事件循环、写文件），
+以及到该场景结束为止的进程峰值RSS。场景按内存占用从小到大排列，整本下载放在最后。
+
+模拟站点运行在独立的子进程中，可以注入延迟、抖动、错误和限流，相同参数的多次运行结果可以直接比较。
+
+用法：python -m mytest.crawler_benchmark [--latency 秒] [--jitter 秒] [--error-rate 比例] [--throttle 每秒请求数]
+                                         [--slow-rate 比例] [--slow-latency 秒] [--hedge] [--stream]
+                                         [--parser bs4|lxml] [--rounds 每个场景的调用次数]
+
+--hedge开启对冲请求，结束时打印各接口类型的对冲次数和胜率；配合--slow-rate比较开启前后的p99和整本下载耗时。
+--stream开启目录页、标签页和作者页的流式解析，比较峰值RSS和整本下载耗时。
+"""
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+import aiohttp
+
+from mytest.mock_site import MockSite, MockSiteOptions, mock_crawler_class
+from novel_crawler.HedgePolicy import HedgePolicy
+from novel_crawler.RateLimiter import RateLimiter
+from novel_crawler.impl.UjNovelCrawler import UjNovelCrawler
+
+
+@dataclass
+class ScenarioStats:
+    """一个场景的统计"""
+    requests: int = 0
+    chapters: int = 0           # 解析成功的章节页数
+    latencies: list[float] = field(default_factory=list)     # 每个HTTP请求从发出到收到响应头的秒数
+    parse_cpu: float = 0.0      # 解析页面占用的CPU秒数
+
+
+class BenchmarkCrawler(UjNovelCrawler):
+    """记录请求延迟和解析耗时的爬虫，统计写入当前场景的stats"""
+    stats = ScenarioStats()
+
+    def _trace_configs(self) -> list[aiohttp.TraceConfig]:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.start = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            self.stats.requests += 1
+            self.stats.latencies.append(time.perf_counter() - context.start)
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        return super()._trace_configs() + [trace_config]
+
+    async def _parse(self, kind: str, method: str, *args):
+        start = time.thread_time()
+        try:
+            result = await super()._parse(kind, method, *args)
+        finally:
+            # 没有配置parse_executor时解析在事件循环线程中同步执行，线程CPU时间就是解析时间
+            self.stats.parse_cpu += time.thread_time() - start
+        if method == 'parse_chapter_content':
+            self.stats.chapters += 1
+        return result
+
+    def _stream_parse(self, session, url: str, kind: str, parser, semaphore=None):
+        # 流式解析的页面不经过_parse，解析发生在增量解析器的feed_bytes和close中，同样统计线程CPU时间
+        def timed(step):
+            def run(*args):
+                start = time.thread_time()
+                try:
+                    return step(*args)
+                finally:
+                    self.stats.parse_cpu += time.thread_time() - start
+            return run
+
+        parser.feed_bytes, parser.close = timed(parser.feed_bytes), timed(parser.close)
+        return super()._stream_parse(session, url, kind, parser, semaphore)
+
+
+def percentile(values: list[float], q: int) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+async def run_scenario(crawler: BenchmarkCrawler, name: str, job) -> None:
+    """运行一个场景并打印统计"""
+    crawler.stats = ScenarioStats()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await job()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    stats = crawler.stats
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    latencies = [latency * 1000 for latency in stats.latencies]
+    print(f"{name:<16}{stats.requests / elapsed:>10.1f}{stats.chapters / elapsed:>10.1f}"
+          f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}"
+          f"{stats.parse_cpu:>10.2f}{cpu - stats.parse_cpu:>10.2f}{elapsed:>9.2f}{peak_rss_mb:>10.1f}")
+
+
+async def benchmark(site_url: str, parser: str, rounds: int, book_id: int, hedge: bool = False,
+                    stream: bool = False) -> None:
+    crawler_class = mock_crawler_class(BenchmarkCrawler, site_url)
+    # 不让客户端限流成为瓶颈，测的是爬虫本身的吞吐
+    hedge_policy = HedgePolicy() if hedge else None
+    crawler = crawler_class(parser=parser, rate_limiter=RateLimiter(rate=10000), hedge_policy=hedge_policy,
+                            stream_pages=stream)
+    book_ids = range(1, rounds + 1)
+    async with crawler:
+        print(f"{'场景':<14}{'请求/秒':>9}{'章节/秒':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}"
+              f"{'解析CPU':>8}{'其余CPU':>8}{'耗时s':>8}{'峰值RSSMB':>10}")
+        await run_scenario(crawler, 'metadata', lambda: asyncio.gather(
+            *(crawler.get_novel_metadata_async(f'{site_url}book/{i}/') for i in book_ids)))
+        await run_scenario(crawler, 'chapters_list', lambda: asyncio.gather(
+            *(crawler.get_novel_chapters_list_async(f'{site_url}read/{i}/') for i in book_ids)))
+        await run_scenario(crawler, 'chapter', lambda: asyncio.gather(
+            *(crawler.get_novel_chapter_content_async(f'{site_url}read/{book_id}/{i}.html') for i in book_ids)))
+        await run_scenario(crawler, 'tag', lambda: asyncio.gather(
+            *(crawler.get_novel_list_by_tag_async(tag, 300) for tag in crawler.tags_list)))
+        await run_scenario(crawler, 'author', lambda: asyncio.gather(
+            *(crawler.get_novel_list_by_author_async(f'作者{i % 97}') for i in book_ids)))
+        await run_scenario(crawler, 'keyword', lambda: asyncio.gather(
+            *(crawler.get_novel_list_by_keyword_async(f'模拟小说{i}') for i in book_ids)))
+        with tempfile.TemporaryDirectory() as directory:
+            await run_scenario(crawler, 'download', lambda: crawler.write_novel_content_to_file(
+                f'{site_url}book/{book_id}/', directory + '/'))
+    if hedge_policy is not None:
+        print(json.dumps(hedge_policy.snapshot(), ensure_ascii=False, indent=2))
+
+
+def main(argv: list[str] = None):
+    arg_parser = argparse.ArgumentParser(description='在本地模拟站点上测试爬虫的端到端吞吐')
+    arg_parser.add_argument('--latency', type=float, default=0.01, help='模拟站点的固定延迟（秒）')
+    arg_parser.add_argument('--jitter', type=float, default=0.01, help='模拟站点的随机抖动（秒）')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='模拟站点返回500的比例')
+    arg_parser.add_argument('--throttle', type=float, default=None, help='模拟站点每秒请求数上限')
+    arg_parser.add_argument('--slow-rate', type=float, default=0.0, help='模拟站点长尾请求的比例')
+    arg_parser.add_argument('--slow-latency', type=float, default=1.0, help='长尾请求额外的延迟（秒）')
+    arg_parser.add_argument('--hedge', action='store_true', help='开启对冲请求')
+    arg_parser.add_argument('--stream', action='store_true', help='流式解析目录页和列表页')
+    arg_parser.add_argument('--parser', default='bs4', help='解析后端')
+    arg_parser.add_argument('--rounds', type=int, default=200, help='每个场景的调用次数')
+    arg_parser.add_argument('--book', type=int, default=1022, help='章节和整本下载场景使用的小说ID')
+    args = arg_parser.parse_args(argv)
+    options = MockSiteOptions(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                              throttle_rate=args.throttle, slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    with MockSite(options) as site:
+        asyncio.run(benchmark(site.url, args.parser, args.rounds, args.book, args.hedge, args.stream))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
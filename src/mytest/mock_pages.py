@@ -0,0 +1,131 @@
+"""
+按悠久小说网（ujxsw.org）页面结构生成的模拟页面，用于解析器基准测试和本地模拟站点。
+
+页面里刻意加入了注释、脚本、&nbsp;、多余空白和广告行，尽量贴近真实页面的复杂度。
+"""
+import random
+
+TAGS = {
+    "xuanhuan": "玄幻", "dushi": "都市", "lishi": "历史", "youxi": "游戏",
+    "kehuan": "科幻", "yanqing": "言情", "wuxia": "武侠",
+}
+NOVELS_PER_TAG_PAGE = 30
+
+
+def book_info(book_id: int) -> dict:
+    """根据小说ID确定性地生成小说信息"""
+    rnd = random.Random(book_id)
+    tag = list(TAGS)[book_id % len(TAGS)]
+    return {
+        'id': book_id,
+        'title': f'模拟小说{book_id}',
+        'author': f'作者{book_id % 97}',
+        'tag': tag,
+        'clicks': rnd.randint(0, 10 ** 7),
+        'recommends': rnd.randint(0, 10 ** 5),
+        'favorites': rnd.randint(0, 10 ** 5),
+        'word_count': f'{rnd.randint(10, 9999)}K',
+        'update_time': f'20{rnd.randint(18, 25)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+        'chapters': rnd.randint(50, 3000),
+    }
+
+
+def detail_page(book_id: int) -> str:
+    info = book_info(book_id)
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{info["title"]}最新章节_悠久小说网</title>
+<script type="text/javascript">var bookid = {book_id}; document.write('<div>广告</div>');</script>
+<style>.pd_r {{ padding-right: 10px; }}</style></head>
+<body><div class="header"><a href="/">首页</a> &gt; <a href="/{info["tag"]}/">{TAGS[info["tag"]]}</a></div>
+<div id="maininfo">
+  <div id="bookinfo">
+    <div class="bookleft"><img src="/files/article/image/{book_id // 1000}/{book_id}/{book_id}s.jpg" alt="{info["title"]}"/></div>
+    <div class="bookright">
+      <h1>{info["title"]}
+        <em>作者：<a href="/author/{info["author"]}">{info["author"]}</a></em></h1>
+      <div id="count">
+        <span class="pd_r">{TAGS[info["tag"]]}</span>
+        <span class="pd_r">{info["clicks"]}</span>
+        <span class="pd_r">{info["recommends"]}</span>
+        <span class="pd_r">{info["favorites"]}</span>
+        <span class="pd_r">{info["word_count"]}</span>
+      </div>
+      <div id="bookintro"><p>　　{info["title"]}是一部{TAGS[info["tag"]]}小说&nbsp;。</p>
+        <!-- 简介下方广告位 -->
+        <p>　　主角一路逆袭，<b>踏上巅峰</b>。</p></div>
+      <div class="new">
+        <span class="new_t">最新章节：<a href="/read/{book_id}/{info["chapters"]}.html">第{info["chapters"]}章 终章</a></span>
+        <span class="new_p">更新时间：{info["update_time"]}</span>
+      </div>
+      <div class="motion"><a href="/read/{book_id}/1.html">开始阅读</a><a href="/read/{book_id}/">目录列表</a></div>
+    </div>
+  </div>
+</div></body></html>'''
+
+
+def catalog_page(book_id: int, chapters: int = None) -> str:
+    chapters = book_info(book_id)['chapters'] if chapters is None else chapters
+    items = ''.join(
+        f'<li><a href="/read/{book_id}/{c}.html" title="第{c}章"> 第{c}章 风起云涌{c} </a></li>\n'
+        for c in range(1, chapters + 1))
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>模拟小说{book_id}目录</title></head>
+<body><div id="readerlist"><ul>
+<li class="fj"><h3>最新章节</h3></li>
+<li class="fj"><h3>正文</h3></li>
+{items}</ul></div></body></html>'''
+
+
+def chapter_page(book_id: int, chapter_id: int, lines: int = 60) -> str:
+    rnd = random.Random(book_id * 100003 + chapter_id)
+    body = ''.join(
+        f'&nbsp;&nbsp;&nbsp;&nbsp;第{chapter_id}章第{i}段，{"这是正文内容" * rnd.randint(3, 12)}。<br/>\n'
+        for i in range(lines))
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>第{chapter_id}章</title></head>
+<body><div class="read-content">
+<p>最新网址：www.ujxsw.org</p>
+{body}<script>ad_bottom();</script>
+<p>悠久小説網全集TXT电子书免费下载</p>
+</div></body></html>'''
+
+
+def tag_page(tag: str, page: int, total_pages: int, site_url: str = 'http://www.ujxsw.org') -> str:
+    tag_index = list(TAGS).index(tag)
+    items = []
+    for i in range(NOVELS_PER_TAG_PAGE):
+        book_id = ((page - 1) * NOVELS_PER_TAG_PAGE + i) * len(TAGS) + tag_index + 1
+        info = book_info(book_id)
+        items.append(f'''<dl>
+<dt><a href="{site_url}/book/{book_id}/"><img src="/files/{book_id}s.jpg"/></a></dt>
+<dd><h3><span class="uptime">{info["update_time"]}</span><a href="{site_url}/book/{book_id}/">{info["title"]}</a></h3></dd>
+<dd class="book_other">作者：<span><a href="/author/{info["author"]}">{info["author"]}</a></span>状态：<span>连载中</span>字数：<span>{info["word_count"]}</span></dd>
+<dd class="book_des">{info["title"]}的简介……</dd>
+</dl>''')
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{TAGS[tag]}小说</title></head>
+<body><div id="sitembox">{''.join(items)}</div>
+<div id="pagelink"><em id="pagestats">第 {page} / {total_pages} 页</em><a href="/{tag}/1/">首页</a></div>
+</body></html>'''
+
+
+def author_page(author: str, book_ids: list[int], site_url: str = 'http://www.ujxsw.org') -> str:
+    rows = ''.join(
+        f'<tr><td>[{TAGS[book_info(b)["tag"]]}]</td><td><a href="{site_url}/book/{b}/">{book_info(b)["title"]}</a></td>'
+        f'<td>{author}</td><td>{book_info(b)["update_time"]}</td></tr>\n'
+        for b in book_ids)
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{author}的作品</title></head>
+<body><table class="booklists"><thead><tr><th>类型</th><th>书名</th><th>作者</th><th>更新</th></tr></thead>
+<tbody>{rows}</tbody></table></body></html>'''
+
+
+def search_page(book_ids: list[int]) -> str:
+    items = ''.join(
+        f'<ul><li class="one">{i + 1}</li><li class="two">[{TAGS[book_info(b)["tag"]]}]</li>'
+        f'<li class="three"><a href="/book/{b}/">{book_info(b)["title"]}</a></li>'
+        f'<li class="four"><a href="/author/{book_info(b)["author"]}">{book_info(b)["author"]}</a></li></ul>\n'
+        for i, b in enumerate(book_ids))
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>搜索结果</title></head>
+<body><div class="shulist">{items}</div></body></html>'''
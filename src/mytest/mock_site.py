@@ -0,0 +1,172 @@
+"""
+本地模拟站点：用aiohttp按悠久小说网的URL结构提供mock_pages生成的页面，用于可重复的端到端基准测试。
+
+可以注入固定延迟、随机抖动、长尾延迟、随机错误和限流（超过速率上限时返回429），模拟真实站点的各种状况。
+站点运行在独立的子进程中，不与被测的爬虫争抢事件循环和CPU：
+
+    with MockSite(MockSiteOptions(latency=0.02)) as site:
+        crawler = mock_crawler_class(UjNovelCrawler, site.url)()
+
+用法：python -m mytest.mock_site [端口]，直接运行时在前台提供服务
+"""
+import asyncio
+import multiprocessing
+import random
+import socket
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import unquote
+
+from aiohttp import web
+
+from mytest import mock_pages
+
+
+@dataclass
+class MockSiteOptions:
+    """模拟站点的行为"""
+    latency: float = 0.0        # 每个响应的固定延迟（秒）
+    jitter: float = 0.0         # 在固定延迟之上再加0~jitter秒的均匀随机延迟
+    slow_rate: float = 0.0      # 以该概率再加slow_latency秒的延迟，模拟长尾
+    slow_latency: float = 0.0
+    error_rate: float = 0.0     # 以该概率返回500
+    throttle_rate: Optional[float] = None   # 每秒请求数上限，超过时返回429和Retry-After；None表示不限流
+    tag_pages: int = 50         # 每个标签的列表页数
+    books: int = 10000          # 小说ID的范围，作者作品页和搜索结果从中选取
+    chapter_lines: int = 60     # 每章的段落数
+    seed: int = 0               # 随机数种子，相同的种子注入相同的错误和抖动
+
+
+def create_app(options: MockSiteOptions, site_url: str) -> web.Application:
+    """
+    创建模拟站点的应用。
+
+    参数:
+        options (MockSiteOptions): 模拟站点的行为
+        site_url (str): 站点根URL（以/结尾），列表页中的绝对链接指向它
+    """
+    rnd = random.Random(options.seed)
+    window_start = time.monotonic()
+    window_requests = 0
+
+    @web.middleware
+    async def inject_faults(request, handler):
+        nonlocal window_start, window_requests
+        if options.throttle_rate is not None:
+            now = time.monotonic()
+            if now - window_start >= 1.0:
+                window_start, window_requests = now, 0
+            window_requests += 1
+            if window_requests > options.throttle_rate:
+                return web.Response(status=429, headers={'Retry-After': '1'})
+        delay = options.latency + rnd.uniform(0, options.jitter)
+        if options.slow_rate and rnd.random() < options.slow_rate:
+            delay += options.slow_latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if options.error_rate and rnd.random() < options.error_rate:
+            return web.Response(status=500, text='模拟的服务器错误')
+        return await handler(request)
+
+    def html(text: str) -> web.Response:
+        return web.Response(text=text, content_type='text/html', charset='utf-8')
+
+    async def detail(request):
+        return html(mock_pages.detail_page(int(request.match_info['book_id'])))
+
+    async def catalog(request):
+        return html(mock_pages.catalog_page(int(request.match_info['book_id'])))
+
+    async def chapter(request):
+        return html(mock_pages.chapter_page(int(request.match_info['book_id']), int(request.match_info['chapter_id']),
+                                            options.chapter_lines))
+
+    async def tag(request):
+        tag_name = request.match_info['tag']
+        if tag_name not in mock_pages.TAGS:
+            raise web.HTTPNotFound()
+        page = int(request.match_info.get('page', 1))
+        if page > options.tag_pages:
+            raise web.HTTPNotFound()
+        return html(mock_pages.tag_page(tag_name, page, options.tag_pages, site_url[:-1]))
+
+    async def author(request):
+        name = unquote(request.match_info['author'])
+        # mock_pages中作者为'作者{小说ID % 97}'
+        if not name.startswith('作者') or not name[2:].isdigit():
+            return html(mock_pages.author_page(name, []))
+        return html(mock_pages.author_page(name, list(range(int(name[2:]) or 97, options.books + 1, 97))))
+
+    async def search(request):
+        keyword = (await request.post()).get('searchkey', '')
+        digits = ''.join(c for c in keyword if c.isdigit())
+        book_ids = [int(digits)] if digits and 0 < int(digits) <= options.books else list(range(1, 11))
+        return html(mock_pages.search_page(book_ids))
+
+    app = web.Application(middlewares=[inject_faults])
+    app.router.add_get('/book/{book_id:\\d+}/', detail)
+    app.router.add_get('/read/{book_id:\\d+}/', catalog)
+    app.router.add_get('/read/{book_id:\\d+}/{chapter_id:\\d+}.html', chapter)
+    app.router.add_get('/author/{author}', author)
+    app.router.add_post('/searchbooks.php', search)
+    app.router.add_get('/{tag}/', tag)
+    app.router.add_get('/{tag}/{page:\\d+}/', tag)
+    return app
+
+
+async def serve(options: MockSiteOptions, port: int = 0, ready=None) -> None:
+    """在127.0.0.1上提供服务直到被取消，port为0时随机选择端口；ready为队列时把站点根URL放入其中"""
+    # 先绑定端口，列表页中的绝对链接需要知道实际监听的端口
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', port))
+    site_url = f'http://127.0.0.1:{sock.getsockname()[1]}/'
+    runner = web.AppRunner(create_app(options, site_url), access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    if ready is not None:
+        ready.put(site_url)
+    else:
+        print(f"模拟站点已启动：{site_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def _serve_main(options: MockSiteOptions, port: int, ready) -> None:
+    asyncio.run(serve(options, port, ready))
+
+
+class MockSite:
+    """在子进程中运行的模拟站点，作为上下文管理器使用，退出时终止子进程"""
+
+    def __init__(self, options: MockSiteOptions = None, port: int = 0):
+        self.options = options if options is not None else MockSiteOptions()
+        self.port = port
+        self.url: Optional[str] = None
+        self._process = None
+
+    def __enter__(self) -> 'MockSite':
+        context = multiprocessing.get_context('spawn')
+        ready = context.Queue()
+        self._process = context.Process(target=_serve_main, args=(self.options, self.port, ready), daemon=True)
+        self._process.start()
+        self.url = ready.get(timeout=30)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._process.terminate()
+        self._process.join()
+
+
+def mock_crawler_class(crawler_class: type, site_url: str) -> type:
+    """把爬虫的站点根URL换成模拟站点的子类"""
+    headers = dict(crawler_class.headers, Referer=site_url)
+    return type(f'Mock{crawler_class.__name__}', (crawler_class,), {'base_url': site_url, 'headers': headers})
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(MockSiteOptions(), int(sys.argv[1]) if len(sys.argv) > 1 else 8000))
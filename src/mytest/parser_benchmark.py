@@ -0,0 +1,51 @@
+"""
+解析后端的微基准测试：对每种页面分别统计各解析后端每秒能解析多少个页面，并检查各后端的解析结果完全一致。
+
+用法：python -m mytest.parser_benchmark [每种页面的解析次数]
+"""
+import sys
+import time
+
+from mytest import mock_pages
+from novel_crawler.impl.UjPageParser import PARSER_BACKENDS, create_uj_page_parser
+
+BASE_URL = 'http://www.ujxsw.org/'
+
+
+def sample_pages():
+    """(页面类型, 解析方法名, 页面字节, 额外参数)"""
+    return [
+        ('metadata', 'parse_metadata', mock_pages.detail_page(1022).encode(), (BASE_URL + 'book/1022/',)),
+        ('catalog', 'parse_chapters_list', mock_pages.catalog_page(1022, 3000).encode(), ()),
+        ('chapter', 'parse_chapter_content', mock_pages.chapter_page(1022, 7).encode(), ()),
+        ('tag', 'parse_tag_page', mock_pages.tag_page('xuanhuan', 3, 120).encode(), ()),
+        ('author', 'parse_author_page', mock_pages.author_page('作者1', list(range(1, 400, 97))).encode(), ('作者1',)),
+        ('search', 'parse_keyword_page', mock_pages.search_page(list(range(1, 30))).encode(), (10,)),
+    ]
+
+
+def main(rounds: int = 50):
+    parsers = []
+    for backend in PARSER_BACKENDS:
+        try:
+            parsers.append(create_uj_page_parser(backend, BASE_URL))
+        except ImportError as e:
+            print(f"跳过解析后端 {backend}：{e}")
+
+    print(f"{'页面类型':<10}" + ''.join(f'{parser.name + " 页/秒":>16}' for parser in parsers) + f"{'结果一致':>10}")
+    for kind, method, body, args in sample_pages():
+        results = []
+        speeds = []
+        for parser in parsers:
+            parse = getattr(parser, method)
+            results.append(parse(body, *args))
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parse(body, *args)
+            speeds.append(rounds / (time.perf_counter() - start))
+        identical = all(result == results[0] for result in results)
+        print(f"{kind:<12}" + ''.join(f'{speed:>18.1f}' for speed in speeds) + f"{str(identical):>12}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
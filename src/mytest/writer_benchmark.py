@@ -0,0 +1,91 @@
+"""
+写文件的基准测试：模拟同时下载很多本小说，章节交替到达，分别用逐章aiofiles写入（爬虫原来的写法）
+和BulkFileWriter的各种fsync模式写入，比较每秒写入的章节数、系统调用次数，并检查写出的文件完全一致。
+
+aiofiles每章的write和flush各在线程池中往返一次，flush时一次write系统调用；
+BulkFileWriter的章节交给写入线程时不经过线程池，只有队列满时才等待（反压）。
+
+用法：python -m mytest.writer_benchmark [小说数] [每本章节数]
+"""
+import asyncio
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+import aiofiles
+
+from mytest.archive_benchmark import chapter_text
+from novel_crawler.BulkFileWriter import BulkFileWriter, FsyncMode
+
+
+def novel_chapters(novel_id: int, count: int) -> list[bytes]:
+    return [f"第{i}章\n{chapter_text(novel_id * count + i, 40)}\n\n".encode('utf-8') for i in range(count)]
+
+
+async def write_with_aiofiles(path: str, chapters: list[bytes]) -> None:
+    async with aiofiles.open(path, 'ab') as f:
+        await f.truncate(0)
+        for data in chapters:
+            await f.write(data)
+            await f.flush()
+
+
+async def write_with_bulk_writer(writer: BulkFileWriter, path: str, chapters: list[bytes]) -> None:
+    async with writer.open(path, truncate=0) as f:
+        for data in chapters:
+            await f.write(data)
+
+
+async def run(directory: str, novels: list[list[bytes]], writer: BulkFileWriter = None) -> float:
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    if writer is None:
+        await asyncio.gather(*(write_with_aiofiles(os.path.join(directory, f'{i}.txt'), chapters)
+                               for i, chapters in enumerate(novels)))
+    else:
+        async with writer:
+            await asyncio.gather(*(write_with_bulk_writer(writer, os.path.join(directory, f'{i}.txt'), chapters)
+                                   for i, chapters in enumerate(novels)))
+    return time.perf_counter() - start
+
+
+def same_files(expected: str, actual: str, count: int) -> bool:
+    names = [f'{i}.txt' for i in range(count)]
+    match, mismatch, errors = filecmp.cmpfiles(expected, actual, names, shallow=False)
+    return len(match) == count
+
+
+async def main(novel_count: int = 200, chapter_count: int = 100):
+    novels = [novel_chapters(i, chapter_count) for i in range(novel_count)]
+    total_chapters = novel_count * chapter_count
+    total_bytes = sum(len(data) for chapters in novels for data in chapters)
+    root = tempfile.mkdtemp()
+    print(f"{novel_count}本小说，共{total_chapters}章，{total_bytes / 1e6:.1f}MB")
+    print(f"{'写法':<28}{'耗时(秒)':>10}{'章/秒':>10}{'MB/秒':>8}{'系统调用':>10}{'章/调用':>8}{'fsync':>7}"
+          f"{'反压':>6}{'一致':>6}")
+
+    baseline = os.path.join(root, 'aiofiles')
+    seconds = await run(baseline, novels)
+    print(f"{'aiofiles逐章写入':<26}{seconds:>12.2f}{total_chapters / seconds:>12.0f}"
+          f"{total_bytes / 1e6 / seconds:>10.1f}{total_chapters:>12}{1:>10.1f}{'-':>8}{'-':>8}{'-':>8}")
+
+    configs = [
+        ('bulk fsync=none', BulkFileWriter()),
+        ('bulk fsync=none 1线程', BulkFileWriter(threads=1)),
+        ('bulk fsync=none 最多32个文件', BulkFileWriter(max_open_files=32)),
+        ('bulk fsync=periodic', BulkFileWriter(fsync=FsyncMode.PERIODIC, fsync_interval=1.0)),
+        ('bulk fsync=per_novel', BulkFileWriter(fsync=FsyncMode.PER_NOVEL)),
+    ]
+    for i, (name, writer) in enumerate(configs):
+        directory = os.path.join(root, f'bulk{i}')
+        seconds = await run(directory, novels, writer)
+        stats = writer.stats()
+        print(f"{name:<26}{seconds:>12.2f}{total_chapters / seconds:>12.0f}{total_bytes / 1e6 / seconds:>10.1f}"
+              f"{stats.syscalls:>12}{stats.writes / max(stats.syscalls, 1):>10.1f}{stats.fsyncs:>8}"
+              f"{writer.backpressure_waits:>8}{str(same_files(baseline, directory, novel_count)):>8}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main(*map(int, sys.argv[1:3])))
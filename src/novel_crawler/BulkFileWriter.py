@@ -0,0 +1,437 @@
+import asyncio
+import concurrent.futures
+import itertools
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from enum import Enum
+from typing import Optional
+
+# 一次writev最多提交的缓冲区数，超过系统的IOV_MAX会失败
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 16
+# 工作线程一批最多处理的操作数，处理完一批后检查缓冲是否需要写出
+_BATCH_SIZE = 256
+_STOP = object()
+
+
+class FsyncMode(Enum):
+    NONE = 'none'               # 只写入操作系统的页缓存，由操作系统决定何时落盘
+    PER_NOVEL = 'per_novel'     # 每个文件关闭时fsync，关闭完成即表示这本小说已经落盘
+    PERIODIC = 'periodic'       # 每隔fsync_interval秒fsync一次期间写过的文件，断电最多丢失这段时间的写入
+
+
+@dataclass
+class WriterStats:
+    """一个工作线程的写入统计，只由该线程更新"""
+    writes: int = 0         # 交给工作线程的写入次数（通常每次一章）
+    bytes: int = 0          # 写入文件的字节数
+    syscalls: int = 0       # write/writev系统调用次数，writes / syscalls即合并的倍数
+    fsyncs: int = 0
+    opens: int = 0          # 打开文件描述符的次数，包括被淘汰后重新打开
+    evictions: int = 0      # 打开的文件数达到上限时关闭最久没有使用的文件的次数
+    errors: int = 0
+
+
+class _FileState:
+    """一个打开的文件在写入线程中的状态，除了error都只由写入线程访问"""
+
+    def __init__(self, file_id: int, path: str, truncate: Optional[int]):
+        self.file_id = file_id
+        self.path = path
+        self.truncate = truncate    # 第一次打开时截断到这个长度，None表示不截断
+        self.fd: Optional[int] = None
+        self.created = False        # 是否已经打开过，关闭时保证文件存在
+        self.chunks: list[bytes] = []
+        self.size = 0               # 缓冲中的字节数
+        self.buffered_at = 0.0      # 缓冲中最早的数据是什么时候写入的（time.monotonic）
+        self.unsynced = False       # 写出后还没有fsync，被淘汰后重新打开也保留，fsync针对的是文件本身
+        self.error: Optional[OSError] = None
+
+
+class _Worker:
+    """
+    一个写入线程及其操作队列。同一个文件的所有操作都交给同一个线程，按提交的顺序执行，不需要加锁。
+    """
+
+    def __init__(self, writer: 'BulkFileWriter', index: int):
+        self.writer = writer
+        self.queue = queue.Queue(writer.queue_size)
+        self.stats = WriterStats()
+        self.files: dict[int, _FileState] = {}
+        self.dirty: OrderedDict[int, _FileState] = OrderedDict()        # 缓冲中有数据的文件，按buffered_at排序
+        self.open_files: OrderedDict[int, _FileState] = OrderedDict()   # 持有文件描述符的文件，按最近使用排序
+        self.unsynced: dict[int, _FileState] = {}
+        self.closed_unsynced: set[str] = set()      # 已经关闭、等待下一次定期fsync的文件
+        self.buffered = 0           # 所有文件缓冲中的字节数
+        self.next_sync = time.monotonic() + writer.fsync_interval
+        self.thread = threading.Thread(target=self._run, name=f'novel-writer-{index}', daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        writer = self.writer
+        while True:
+            try:
+                op = self.queue.get(timeout=self._wait_timeout())
+            except queue.Empty:
+                op = None
+            batch = 0
+            while op is not None:
+                if op is _STOP:
+                    self._shutdown()
+                    return
+                self._apply(*op)
+                batch += 1
+                if batch >= _BATCH_SIZE:
+                    break
+                try:
+                    op = self.queue.get_nowait()
+                except queue.Empty:
+                    op = None
+            # 队列积压时缓冲越积越大，一次写出的章节越多；空闲时最多等待linger秒就写出，下载中的文件可以直接阅读
+            now = time.monotonic()
+            while self.dirty:
+                state = next(iter(self.dirty.values()))
+                if now - state.buffered_at < writer.linger and self.buffered <= writer.max_buffered:
+                    break
+                self._flush(state)
+            if writer.fsync is FsyncMode.PERIODIC and now >= self.next_sync:
+                self._sync_all()
+                self.next_sync = now + writer.fsync_interval
+
+    def _wait_timeout(self) -> Optional[float]:
+        """没有新操作时最多等待多久：到最早的缓冲需要写出，或者到下一次定期fsync"""
+        deadlines = []
+        if self.dirty:
+            deadlines.append(next(iter(self.dirty.values())).buffered_at + self.writer.linger)
+        if self.writer.fsync is FsyncMode.PERIODIC and (self.unsynced or self.closed_unsynced):
+            deadlines.append(self.next_sync)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _apply(self, action: str, file_id: int, argument) -> None:
+        if action == 'open':
+            self.files[file_id] = argument
+            return
+        state = self.files[file_id]
+        if action == 'write':
+            self.stats.writes += 1
+            if state.error is not None:
+                return
+            if not state.size:
+                state.buffered_at = time.monotonic()
+                self.dirty[file_id] = state
+            state.chunks.append(argument)
+            state.size += len(argument)
+            self.buffered += len(argument)
+            if state.size >= self.writer.buffer_size:
+                self._flush(state)
+        elif action == 'flush':
+            self._flush(state)
+            self._resolve(argument, state.error)
+        elif action == 'close':
+            self._flush(state)
+            if not state.created and state.error is None:
+                # 从来没有写入过的文件也要打开一次，保证文件存在并完成截断
+                self._try(state, self._open, state)
+            if state.unsynced and state.error is None:
+                if self.writer.fsync is FsyncMode.PER_NOVEL:
+                    self._try(state, self._sync, state)
+                elif self.writer.fsync is FsyncMode.PERIODIC:
+                    self.closed_unsynced.add(state.path)
+            self.unsynced.pop(state.file_id, None)
+            self._close_fd(state)
+            del self.files[file_id]
+            self._resolve(argument, state.error)
+
+    def _flush(self, state: _FileState) -> None:
+        """把文件的缓冲用尽量少的系统调用写出"""
+        if not state.size:
+            return
+        chunks = state.chunks
+        self.buffered -= state.size
+        state.chunks, state.size = [], 0
+        del self.dirty[state.file_id]
+        if state.error is None:
+            self._try(state, self._write, state, chunks)
+
+    def _try(self, state: _FileState, function, *args) -> None:
+        try:
+            function(*args)
+        except OSError as e:
+            # 出错后这个文件后续的写入都被丢弃，错误在下一次write、flush或close时交给协程
+            self.stats.errors += 1
+            state.error = e
+            self._close_fd(state)
+
+    def _open(self, state: _FileState) -> int:
+        if state.fd is not None:
+            self.open_files.move_to_end(state.file_id)
+            return state.fd
+        while len(self.open_files) >= self.writer.max_open_files_per_worker:
+            _, oldest = self.open_files.popitem(last=False)
+            self.stats.evictions += 1
+            os.close(oldest.fd)
+            oldest.fd = None
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0)
+        state.fd = os.open(state.path, flags, 0o666)
+        state.created = True
+        self.stats.opens += 1
+        if state.truncate is not None:
+            os.ftruncate(state.fd, state.truncate)
+            state.truncate = None
+        self.open_files[state.file_id] = state
+        return state.fd
+
+    def _write(self, state: _FileState, chunks: list[bytes]) -> None:
+        fd = self._open(state)
+        for i in range(0, len(chunks), _IOV_MAX):
+            batch = chunks[i:i + _IOV_MAX]
+            total = sum(map(len, batch))
+            if hasattr(os, 'writev'):
+                written = os.writev(fd, batch)
+            else:
+                batch = [b''.join(batch)]
+                written = os.write(fd, batch[0])
+            self.stats.syscalls += 1
+            if written < total:
+                # 部分写入（例如被信号中断）时，剩余的部分合并后继续写
+                rest = memoryview(b''.join(batch))[written:]
+                while rest:
+                    rest = rest[os.write(fd, rest):]
+                    self.stats.syscalls += 1
+            self.stats.bytes += total
+        state.unsynced = True
+        self.unsynced[state.file_id] = state
+
+    def _sync(self, state: _FileState) -> None:
+        os.fsync(self._open(state))
+        self.stats.fsyncs += 1
+        state.unsynced = False
+        self.unsynced.pop(state.file_id, None)
+
+    def _sync_all(self) -> None:
+        for state in list(self.unsynced.values()):
+            if state.error is None:
+                self._try(state, self._sync, state)
+        self.unsynced.clear()
+        for path in self.closed_unsynced:
+            try:
+                fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                try:
+                    os.fsync(fd)
+                    self.stats.fsyncs += 1
+                finally:
+                    os.close(fd)
+            except OSError:
+                self.stats.errors += 1
+        self.closed_unsynced.clear()
+
+    def _close_fd(self, state: _FileState) -> None:
+        if state.fd is None:
+            return
+        self.open_files.pop(state.file_id, None)
+        try:
+            os.close(state.fd)
+        except OSError:
+            pass
+        state.fd = None
+
+    def _shutdown(self) -> None:
+        """写出所有缓冲，按fsync模式落盘，关闭所有文件"""
+        for state in list(self.files.values()):
+            self._flush(state)
+        if self.writer.fsync is not FsyncMode.NONE:
+            self._sync_all()
+        for state in list(self.files.values()):
+            self._close_fd(state)
+
+    @staticmethod
+    def _resolve(future: concurrent.futures.Future, error: Optional[OSError]) -> None:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+
+class BulkFile:
+    """
+    BulkFileWriter打开的一个文件，只能追加写入。
+
+    write把数据交给写入线程后立即返回，写入线程的队列满时才会等待；同一个文件的写入需要依次await。
+    写入出错时，错误在之后的write、flush或close中抛出。
+    """
+
+    def __init__(self, writer: 'BulkFileWriter', worker: _Worker, file_id: int, path: str, truncate: Optional[int]):
+        self.writer = writer
+        self.path = path
+        self._worker = worker
+        self._state = _FileState(file_id, path, truncate)
+        self._registered = False    # 第一次提交操作时才在写入线程中登记，open本身不会等待
+        self._closed = False
+
+    async def write(self, data: bytes) -> None:
+        self._check()
+        await self._submit('write', data)
+
+    async def flush(self) -> None:
+        """等待之前写入的数据都交给操作系统"""
+        self._check()
+        await self._call('flush')
+
+    async def close(self) -> None:
+        """写出缓冲并关闭文件，FsyncMode.PER_NOVEL时还会等待fsync完成"""
+        if self._closed:
+            return
+        self._closed = True
+        await self._call('close')
+
+    async def __aenter__(self) -> 'BulkFile':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def _check(self) -> None:
+        if self._closed:
+            raise ValueError(f"文件已经关闭：{self.path}")
+        if self._state.error is not None:
+            raise self._state.error
+
+    async def _submit(self, action: str, argument) -> None:
+        file_id = self._state.file_id
+        if not self._registered:
+            await self.writer._submit(self._worker, ('open', file_id, self._state))
+            self._registered = True
+        await self.writer._submit(self._worker, (action, file_id, argument))
+
+    async def _call(self, action: str) -> None:
+        future = concurrent.futures.Future()
+        await self._submit(action, future)
+        await asyncio.wrap_future(future)
+
+
+class BulkFileWriter:
+    """
+    批量文件写入器，取代逐章通过aiofiles写入：每次aiofiles调用都要在线程池中往返一次，同时写入成千上万本小说时，
+    大量时间花在线程切换和很小的系统调用上。
+
+    固定数量的写入线程，每个文件按路径固定交给其中一个线程，因此同一个文件的写入保持顺序。
+    线程为每个文件维护写缓冲，缓冲达到buffer_size、缓冲的数据超过linger秒、或线程的总缓冲超过max_buffered时，
+    把缓冲中的多章用一次writev写出；队列积压时一次写出的章节更多。每个线程最多同时打开
+    max_open_files / threads个文件，超过时关闭最久没有使用的文件，之后需要时再以追加模式打开。
+
+    协程把数据交给写入线程时不等待写入完成，也不经过线程池；队列满时才等待，形成反压，
+    下载速度超过磁盘速度时内存不会无限增长。
+
+    作为异步上下文管理器使用，可以在多个爬虫之间共享：
+
+        async with BulkFileWriter(threads=4, fsync=FsyncMode.PER_NOVEL) as writer:
+            crawler = UjNovelCrawler(file_writer=writer)
+    """
+
+    def __init__(
+            self,
+            threads: int = 4,
+            buffer_size: int = 256 * 1024,
+            max_buffered: int = 16 * 1024 * 1024,
+            linger: float = 0.5,
+            max_open_files: int = 256,
+            queue_size: int = 1024,
+            fsync: FsyncMode = FsyncMode.NONE,
+            fsync_interval: float = 5.0
+    ):
+        """
+        参数:
+            threads (int): 写入线程数
+            buffer_size (int): 单个文件的缓冲达到这么多字节时写出
+            max_buffered (int): 单个线程所有文件的缓冲超过这么多字节时，从最早的开始写出
+            linger (float): 缓冲中的数据最多停留的秒数
+            max_open_files (int): 所有线程同时打开的文件数上限
+            queue_size (int): 每个线程的操作队列长度，队列满时写入方等待
+            fsync (FsyncMode): 何时调用fsync，也可以是'none'、'per_novel'或'periodic'
+            fsync_interval (float): FsyncMode.PERIODIC时fsync的间隔（秒）
+        """
+        if threads < 1:
+            raise ValueError(f"threads必须大于0：{threads}")
+        if max_open_files < threads:
+            raise ValueError(f"max_open_files不能小于threads：{max_open_files}")
+        self.threads = threads
+        self.buffer_size = buffer_size
+        self.max_buffered = max_buffered
+        self.linger = linger
+        self.max_open_files_per_worker = max_open_files // threads
+        self.queue_size = queue_size
+        self.fsync = FsyncMode(fsync)
+        self.fsync_interval = fsync_interval
+        self.backpressure_waits = 0     # 队列满、写入方需要等待的次数
+        self._workers: list[_Worker] = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def open(self, path: str, truncate: int = None) -> BulkFile:
+        """
+        以追加模式打开文件，不存在时创建。返回的BulkFile可以作为异步上下文管理器使用。
+
+        参数:
+            path (str): 文件路径，所在的文件夹需要已经存在
+            truncate (int): 打开时先把文件截断到这个长度，例如丢弃断点续传时清单没有记录的残留内容
+        """
+        workers = self._start()
+        # 同一个路径总是交给同一个线程，同一个文件先后打开的两个BulkFile不会并发写入
+        worker = workers[zlib.crc32(os.path.abspath(path).encode('utf-8')) % len(workers)]
+        return BulkFile(self, worker, next(self._ids), path, truncate)
+
+    def stats(self) -> WriterStats:
+        """所有线程的写入统计之和"""
+        total = WriterStats()
+        for worker in self._workers:
+            for field in fields(WriterStats):
+                setattr(total, field.name, getattr(total, field.name) + getattr(worker.stats, field.name))
+        return total
+
+    def close(self) -> None:
+        """写出所有缓冲、按fsync模式落盘并停止写入线程；会阻塞，在协程中请使用aclose"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for worker in self._workers:
+            worker.queue.put(_STOP)
+        for worker in self._workers:
+            worker.thread.join()
+
+    async def aclose(self) -> None:
+        await asyncio.to_thread(self.close)
+
+    async def __aenter__(self) -> 'BulkFileWriter':
+        self._start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.aclose()
+
+    def _start(self) -> list[_Worker]:
+        with self._lock:
+            if self._closed:
+                raise ValueError("BulkFileWriter已经关闭")
+            if not self._workers:
+                self._workers = [_Worker(self, i) for i in range(self.threads)]
+            return self._workers
+
+    async def _submit(self, worker: _Worker, op: tuple) -> None:
+        if self._closed:
+            raise ValueError("BulkFileWriter已经关闭")
+        try:
+            worker.queue.put_nowait(op)
+        except queue.Full:
+            self.backpressure_waits += 1
+            await asyncio.to_thread(worker.queue.put, op)
@@ -0,0 +1,352 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from typing import Iterable, Optional
+
+from novel_crawler.NovelCrawlerFactory import NovelMetadata
+
+# NovelMetadata中保存到novels表的字段，顺序和表结构一致
+_METADATA_FIELDS = [f.name for f in fields(NovelMetadata)]
+
+
+@dataclass
+class CatalogPolicy:
+    """
+    决定一次查询用本地目录回答，还是请求站点。
+
+    满足以下任一条件时使用本地结果：
+      - offline为True
+      - 同样的查询在max_age内请求过站点，并且当时取得的结果数量不少于需要的数量
+      - 调用方需要的数量有限，本地结果不少于需要的数量，并且其中最新的一条在max_age内从站点获取过
+
+    需要全部结果时（例如作者的所有作品），本地见过的几本书不代表完整的结果，只有前两个条件适用。
+    """
+    # 各查询类型的本地数据有效期（秒）
+    max_age: dict[str, float] = field(default_factory=lambda: {
+        'author': 24 * 60 * 60,
+        'search': 24 * 60 * 60,
+    })
+    min_results: int = 1        # 本地结果少于这个数量时总是请求站点
+    offline: bool = False       # 为True时只查询本地，不请求站点
+
+    def use_local(self, kind: str, wanted: Optional[int], result_count: int,
+                  newest_seen_at: Optional[float], queried_at: Optional[float]) -> bool:
+        """
+        参数:
+            kind (str): 查询类型，'author'或'search'
+            wanted (int): 调用方需要的结果数量，为None时表示需要全部
+            result_count (int): 本地查到的结果数量
+            newest_seen_at (float): 本地结果中最近一次从站点获取的时间戳
+            queried_at (float): 同样的查询最近一次请求站点、并且结果数量覆盖wanted的时间戳
+        """
+        if self.offline:
+            return True
+        max_age = self.max_age.get(kind, 0)
+        now = time.time()
+        if queried_at is not None and now - queried_at < max_age:
+            return True
+        if wanted is None:
+            return False
+        needed = max(self.min_results, wanted)
+        return result_count >= needed and newest_seen_at is not None and now - newest_seen_at < max_age
+
+
+class CatalogStore:
+    """
+    基于SQLite的本地小说目录，保存爬虫见过的所有小说元数据和章节列表。
+
+    novels表在author、tag、status、update_time上建有索引，title和description上建有FTS5全文索引
+    （trigram分词，适合没有空格分词的中文），作者、关键词、标签查询可以直接在本地完成。
+    写入先进入内存缓冲，攒够batch_size条或距上次写入超过flush_interval秒时在一个事务中批量upsert，
+    全站扫描时不会因为逐条提交而受限于磁盘写入。
+    所有方法都是线程安全的，可以在asyncio.to_thread中调用。
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 1.0):
+        """
+        参数:
+            path (str): 数据库文件路径
+            batch_size (int): 缓冲多少条写入后批量提交
+            flush_interval (float): 缓冲中的写入最多等待多少秒后提交
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending_novels: dict[str, tuple] = {}
+        self._pending_listings: dict[str, tuple] = {}
+        self._pending_chapters: dict[str, list[tuple[str, str]]] = {}
+        self._pending_queries: dict[tuple[str, str], tuple[float, Optional[int]]] = {}
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        # queries表早期没有result_limit列，其中的记录不知道覆盖了多少结果，只是请求站点的时间记录，直接丢弃
+        query_columns = [row[1] for row in self._conn.execute('PRAGMA table_info(queries)')]
+        if query_columns and 'result_limit' not in query_columns:
+            self._conn.execute('DROP TABLE queries')
+        columns = ', '.join(f'{name} {"INTEGER" if name in ("word_count", "clicks", "recommends", "favorites") else "TEXT"}'
+                            for name in _METADATA_FIELDS)
+        self._conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS novels (
+                url TEXT PRIMARY KEY,
+                {columns},
+                site_tag TEXT,
+                listed_at REAL,
+                crawled_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_novels_author ON novels (author);
+            CREATE INDEX IF NOT EXISTS idx_novels_tag ON novels (tag);
+            CREATE INDEX IF NOT EXISTS idx_novels_site_tag ON novels (site_tag);
+            CREATE INDEX IF NOT EXISTS idx_novels_status ON novels (status);
+            CREATE INDEX IF NOT EXISTS idx_novels_update_time ON novels (update_time);
+            CREATE TABLE IF NOT EXISTS chapters (
+                catalog_url TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (catalog_url, idx)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS chapter_lists (
+                catalog_url TEXT PRIMARY KEY,
+                chapter_count INTEGER NOT NULL,
+                crawled_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS queries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                queried_at REAL NOT NULL,
+                result_limit INTEGER,
+                PRIMARY KEY (kind, key)
+            );
+        ''')
+        try:
+            self._conn.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS novels_fts USING fts5(
+                    title, description, content='novels', content_rowid='rowid', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS novels_fts_insert AFTER INSERT ON novels BEGIN
+                    INSERT INTO novels_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);
+                END;
+                CREATE TRIGGER IF NOT EXISTS novels_fts_delete AFTER DELETE ON novels BEGIN
+                    INSERT INTO novels_fts (novels_fts, rowid, title, description)
+                    VALUES ('delete', old.rowid, old.title, old.description);
+                END;
+                CREATE TRIGGER IF NOT EXISTS novels_fts_update AFTER UPDATE OF title, description ON novels BEGIN
+                    INSERT INTO novels_fts (novels_fts, rowid, title, description)
+                    VALUES ('delete', old.rowid, old.title, old.description);
+                    INSERT INTO novels_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);
+                END;
+            ''')
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite没有编译FTS5或不支持trigram分词（3.34之前），关键词查询退化为LIKE扫描
+            self.has_fts = False
+        self._conn.commit()
+
+    # ---- 写入 ----
+
+    def put_novel(self, url: str, metadata: NovelMetadata) -> None:
+        """记录从详情页获取的小说元数据，url应为规范化后的详情页URL"""
+        row = (url, *(getattr(metadata, name) for name in _METADATA_FIELDS), time.time())
+        with self._lock:
+            self._pending_novels[url] = row
+            self._maybe_flush()
+
+    def put_listing(
+            self,
+            kind: str,
+            key: str,
+            novels: Iterable[tuple[str, str, str]],
+            site_tag: str = None,
+            limit: int = None
+    ) -> None:
+        """
+        记录一次标签、作者或关键词列表查询的结果。
+
+        列表中的小说只有书名和作者，本地还没有这本小说时先记录这两项，已有的元数据不会被覆盖。
+
+        参数:
+            kind (str): 查询类型，'author'、'search'或'tag'
+            key (str): 查询条件，即作者名、关键词或标签
+            novels : 列表中的(书名, 作者, 详情页URL链接)，URL应为规范化后的URL
+            site_tag (str): 标签列表中的小说所属的站点标签
+            limit (int): 站点只返回了前limit个结果；为None时表示列表是完整的结果
+        """
+        now = time.time()
+        with self._lock:
+            for title, author, url in novels:
+                self._pending_listings[url] = (url, title, author, site_tag, now)
+            self._pending_queries[(kind, key)] = (now, limit)
+            self._maybe_flush()
+
+    def put_chapters_list(self, catalog_url: str, chapters_list: list[tuple[str, str]]) -> None:
+        """记录小说的章节列表，catalog_url应为规范化后的目录页URL"""
+        with self._lock:
+            self._pending_chapters[catalog_url] = chapters_list
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        """缓冲足够多或等待足够久时提交，调用方需持有锁"""
+        pending = (len(self._pending_novels) + len(self._pending_listings)
+                   + sum(len(chapters) for chapters in self._pending_chapters.values()))
+        if pending >= self.batch_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self._flush()
+
+    def flush(self) -> None:
+        """立即提交缓冲中的所有写入"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        """在一个事务中批量提交缓冲中的写入，调用方需持有锁"""
+        self._flushed_at = time.monotonic()
+        if not (self._pending_novels or self._pending_listings or self._pending_chapters or self._pending_queries):
+            return
+        now = time.time()
+        with self._conn:
+            if self._pending_listings:
+                self._conn.executemany(
+                    'INSERT INTO novels (url, title, author, site_tag, listed_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (url) DO UPDATE SET '
+                    'site_tag = COALESCE(excluded.site_tag, site_tag), listed_at = excluded.listed_at',
+                    self._pending_listings.values())
+            if self._pending_novels:
+                assignments = ', '.join(f'{name} = excluded.{name}' for name in _METADATA_FIELDS)
+                self._conn.executemany(
+                    f'INSERT INTO novels (url, {", ".join(_METADATA_FIELDS)}, crawled_at) '
+                    f'VALUES ({", ".join("?" * (len(_METADATA_FIELDS) + 2))}) '
+                    f'ON CONFLICT (url) DO UPDATE SET {assignments}, crawled_at = excluded.crawled_at',
+                    self._pending_novels.values())
+            for catalog_url, chapters_list in self._pending_chapters.items():
+                self._conn.execute('DELETE FROM chapters WHERE catalog_url = ?', (catalog_url,))
+                self._conn.executemany(
+                    'INSERT INTO chapters (catalog_url, idx, title, url) VALUES (?, ?, ?, ?)',
+                    ((catalog_url, idx, title, url) for idx, (title, url) in enumerate(chapters_list)))
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO chapter_lists (catalog_url, chapter_count, crawled_at) VALUES (?, ?, ?)',
+                    (catalog_url, len(chapters_list), now))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO queries (kind, key, queried_at, result_limit) VALUES (?, ?, ?, ?)',
+                ((kind, key, queried_at, limit) for (kind, key), (queried_at, limit) in self._pending_queries.items()))
+        self._pending_novels.clear()
+        self._pending_listings.clear()
+        self._pending_chapters.clear()
+        self._pending_queries.clear()
+
+    # ---- 查询 ----
+
+    def get_novel(self, url: str) -> Optional[NovelMetadata]:
+        """读取从详情页获取过的小说元数据，没有时返回None"""
+        with self._lock:
+            self._flush()
+            row = self._conn.execute(
+                f'SELECT {", ".join(_METADATA_FIELDS)} FROM novels WHERE url = ? AND crawled_at IS NOT NULL',
+                (url,)).fetchone()
+        return NovelMetadata(*row) if row is not None else None
+
+    def get_chapters_list(self, catalog_url: str) -> Optional[list[tuple[str, str]]]:
+        """读取小说的章节列表，没有时返回None"""
+        with self._lock:
+            self._flush()
+            if self._conn.execute('SELECT 1 FROM chapter_lists WHERE catalog_url = ?', (catalog_url,)).fetchone() is None:
+                return None
+            rows = self._conn.execute(
+                'SELECT title, url FROM chapters WHERE catalog_url = ? ORDER BY idx', (catalog_url,)).fetchall()
+        return rows
+
+    def find_by_author(self, author: str) -> tuple[list[tuple[str, str, str]], Optional[float]]:
+        """
+        查询作者的小说，按更新时间从新到旧排列。
+
+        返回:
+            (小说列表, 结果中最近一次从站点获取的时间戳)，小说列表为(书名, 作者, 详情页URL链接)
+        """
+        return self._select('WHERE author = ? ORDER BY update_time DESC', (author,))
+
+    def find_by_tag(self, tag: str, limit: int = None, order_by: str = 'update_time',
+                    status: str = None) -> tuple[list[tuple[str, str, str]], Optional[float]]:
+        """
+        查询标签下的小说，tag可以是站点标签（例如"xuanhuan"），也可以是详情页中的分类名。
+
+        参数:
+            tag (str): 标签
+            limit (int): 最多返回多少本，为None时返回全部
+            order_by (str): 按哪个字段从大到小排列，'update_time'、'word_count'、'clicks'、'recommends'或'favorites'
+            status (str): 只返回此状态的小说，例如"完结"
+
+        返回:
+            (小说列表, 结果中最近一次从站点获取的时间戳)，小说列表为(书名, 作者, 详情页URL链接)
+        """
+        if order_by not in ('update_time', 'word_count', 'clicks', 'recommends', 'favorites'):
+            raise ValueError(f"不支持的排序字段：{order_by}")
+        where = '(tag = ? OR site_tag = ?)'
+        params = [tag, tag]
+        if status is not None:
+            where += ' AND status = ?'
+            params.append(status)
+        return self._select(f'WHERE {where} ORDER BY {order_by} DESC LIMIT ?', (*params, limit or -1))
+
+    def search(self, keyword: str, limit: int = None) -> tuple[list[tuple[str, str, str]], Optional[float]]:
+        """
+        按关键词全文检索书名和简介，书名命中的排在前面。
+
+        trigram分词只能检索不少于3个字符的关键词，更短的关键词（例如两个字的中文词）退化为LIKE扫描。
+
+        返回:
+            (小说列表, 结果中最近一次从站点获取的时间戳)，小说列表为(书名, 作者, 详情页URL链接)
+        """
+        keyword = keyword.strip()
+        if not keyword:
+            return [], None
+        if self.has_fts and len(keyword) >= 3:
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            return self._select(
+                'JOIN novels_fts ON novels_fts.rowid = novels.rowid WHERE novels_fts MATCH ? '
+                'ORDER BY bm25(novels_fts, 10.0, 1.0) LIMIT ?', (phrase, limit or -1))
+        pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self._select(
+            "WHERE title LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\' "
+            "ORDER BY title LIKE ? ESCAPE '\\' DESC, update_time DESC LIMIT ?",
+            (pattern, pattern, pattern, limit or -1))
+
+    def _select(self, clause: str, params: tuple) -> tuple[list[tuple[str, str, str]], Optional[float]]:
+        with self._lock:
+            self._flush()
+            rows = self._conn.execute(
+                f'SELECT novels.title, novels.author, novels.url, MAX(COALESCE(crawled_at, 0), COALESCE(listed_at, 0)) '
+                f'FROM novels {clause}', params).fetchall()
+        newest = max((row[3] for row in rows), default=None)
+        return [row[:3] for row in rows], newest or None
+
+    def queried_at(self, kind: str, key: str, wanted: int = None) -> Optional[float]:
+        """
+        同样的查询最近一次请求站点的时间戳，没有请求过、或者当时只取得了少于wanted个结果时返回None。
+
+        参数:
+            wanted (int): 需要的结果数量，为None时表示需要全部
+        """
+        with self._lock:
+            if (kind, key) in self._pending_queries:
+                row = self._pending_queries[(kind, key)]
+            else:
+                row = self._conn.execute(
+                    'SELECT queried_at, result_limit FROM queries WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        if row is None:
+            return None
+        queried_at, limit = row
+        if limit is not None and (wanted is None or limit < wanted):
+            return None
+        return queried_at
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._conn.close()
@@ -0,0 +1,135 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Generic, Iterable, TypeVar, Union
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+async def _aiter(items: Union[Iterable[T], AsyncIterable[T]]) -> AsyncIterator[T]:
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def ordered_fetch(
+        items: Union[Iterable[T], AsyncIterable[T]],
+        fetch: Callable[[T], Awaitable[R]],
+        window: int = 32
+) -> AsyncIterator[tuple[T, R]]:
+    """
+    按输入顺序并发获取结果的有界重排窗口。
+
+    最多同时有window个fetch任务在途，结果严格按items的顺序产出：
+    队首任务完成后立即产出，再补充下一个任务。已完成但尚未产出的结果同样不超过window个，
+    因此内存占用只和窗口大小有关，和items总数无关。
+
+    参数:
+        items : 待获取的条目，例如(章节标题, 章节URL)，也可以是异步迭代器，例如边下载边解析的目录
+        fetch : 针对单个条目的异步获取函数
+        window (int): 重排窗口大小，即最大在途任务数
+
+    返回:
+        AsyncIterator[tuple[T, R]]: 依次产出(条目, 获取结果)
+    """
+    if window < 1:
+        raise ValueError(f"window必须大于0：{window}")
+    pending: deque[tuple[T, asyncio.Future]] = deque()
+    try:
+        async with aclosing(_aiter(items)) as iterator:
+            async for item in iterator:
+                pending.append((item, asyncio.ensure_future(fetch(item))))
+                if len(pending) >= window:
+                    head_item, head_task = pending.popleft()
+                    yield head_item, await head_task
+        while pending:
+            head_item, head_task = pending.popleft()
+            yield head_item, await head_task
+    finally:
+        # 消费方提前退出或出现异常时，取消剩余的在途任务
+        for _, task in pending:
+            task.cancel()
+
+
+class ReadAhead(Generic[T]):
+    """
+    在后台任务中把异步迭代器读到底，已经读到的条目保存在items中，可以一边读取一边从任意位置开始迭代。
+
+    读取不受消费速度影响，例如流式解析的目录页不会因为章节请求排队而暂停下载、闲置占用请求名额。
+    所有条目一直保留到对象释放，内存占用随条目总数增长（wait()需要返回完整的列表）。
+    只在单个事件循环中使用，同一时间只应有一个消费者在迭代。
+    """
+
+    def __init__(self, source: AsyncIterator[T]):
+        self.items: list[T] = []
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._drain(source))
+        # 消费者提前退出时可能不再调用wait()，读取失败的异常不需要再报告
+        self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _drain(self, source: AsyncIterator[T]) -> None:
+        try:
+            async with aclosing(source) as iterator:
+                async for item in iterator:
+                    self.items.append(item)
+                    self._changed.set()
+        finally:
+            self._changed.set()
+
+    @property
+    def done(self) -> bool:
+        return self._task.done()
+
+    async def wait(self) -> list[T]:
+        """等待读完，返回全部条目；读取失败时抛出对应的异常"""
+        await self._task
+        return self.items
+
+    async def iter_from(self, start: int = 0) -> AsyncIterator[T]:
+        """从第start个条目开始迭代，条目还没有读到时等待；读取结束（包括失败）时迭代结束，失败原因由wait()给出"""
+        index = start
+        while True:
+            while index < len(self.items):
+                yield self.items[index]
+                index += 1
+            if self._task.done():
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+    async def aclose(self) -> None:
+        """停止读取并等待后台任务结束，之后可以安全地关闭读取所用的资源，例如session"""
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class ChapterSource(ABC):
+    """
+    下载整本小说时章节内容的来源，替换爬虫默认的“从本站逐章获取”，例如从多个镜像站点获取。
+
+    爬虫仍然负责获取详情页和目录、断点续传和写文件，章节来源只负责按目录中的条目取回章节内容。
+    """
+    window: int = None      # 下载时的重排窗口大小，即最多同时在途的章节数；为None时使用爬虫的chapter_window
+
+    async def prepare(self, metadata, chapters_list: list[tuple[str, str]]) -> None:
+        """
+        开始下载缺失章节之前调用一次。
+
+        参数:
+            metadata (NovelMetadata): 小说详情
+            chapters_list (list[tuple[str, str]]): 爬虫所在站点的完整目录，(章节标题, 章节内容URL链接)
+        """
+        pass
+
+    @abstractmethod
+    async def fetch(self, chapter: tuple[str, str]):
+        """获取目录中的一章，返回CrawlResult[str]，失败时同样返回CrawlResult而不是抛出异常"""
+        pass
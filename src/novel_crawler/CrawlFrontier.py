@@ -0,0 +1,376 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from novel_crawler.NovelCrawlerFactory import CrawlResult, NovelCrawlerFactory
+from novel_crawler.RequestCoalescer import normalize_url
+from novel_crawler.RetryPolicy import RetryPolicy
+from novel_crawler.ShardedCrawlRunner import CrawlTask, run_crawl_task
+from novel_crawler.VisitedUrlFilter import VisitedUrlFilter
+
+# 各类工作的默认优先级，数值越大越先执行；越接近最终内容的工作优先级越高，已经开始的小说尽快完成
+DEFAULT_PRIORITIES = {'tag': 0, 'metadata': 10, 'chapters': 20, 'chapter': 30, 'download': 20}
+
+
+@dataclass(frozen=True)
+class FrontierJob:
+    """加入爬取队列的工作"""
+    task: CrawlTask
+    priority: int = None    # 为None时使用DEFAULT_PRIORITIES中该类工作的优先级
+
+    @property
+    def dedup_key(self) -> str:
+        """去重键，同一类工作的URL规范化后相同即视为重复"""
+        target = self.task.target if self.task.kind == 'tag' else normalize_url(self.task.target)
+        return f'{self.task.kind} {target}'
+
+
+@dataclass(frozen=True)
+class Lease:
+    """领取到的工作，在lease_expires_at之前确认完成，否则会被重新分配给其他工作进程"""
+    job_id: int
+    token: str              # 租约凭证，确认、退回和续租时需要携带，租约被收回后旧凭证失效
+    task: CrawlTask
+    priority: int
+    attempts: int           # 包括本次在内已经领取过的次数
+    lease_expires_at: float
+
+
+class FrontierStore(ABC):
+    """
+    持久化的爬取队列（frontier）的存储接口。
+
+    工作的状态依次为pending（等待领取）、leased（已被领取）、done（完成）或failed（失败次数用尽或永久性失败）。
+    领取后在可见性超时（visibility timeout）之内没有确认的工作会被自动收回，重新变为pending，
+    因此工作进程崩溃不会丢失工作。同一个工作可能被执行多次，工作本身需要是幂等的。
+    实现需要保证多个进程（或多台机器）并发领取时，同一个工作同一时刻只属于一个租约。
+    """
+
+    @abstractmethod
+    def add(self, jobs: Iterable[FrontierJob]) -> int:
+        """加入工作，已经存在的（无论状态）会被忽略，返回实际新加入的数量"""
+        pass
+
+    @abstractmethod
+    def lease(self, owner: str, count: int, visibility_timeout: float) -> list[Lease]:
+        """按优先级从高到低、同优先级先进先出领取最多count个工作"""
+        pass
+
+    @abstractmethod
+    def ack(self, lease: Lease) -> bool:
+        """确认工作完成，租约已经失效时返回False"""
+        pass
+
+    @abstractmethod
+    def nack(self, lease: Lease, error: str, delay: float = 0, permanent: bool = False) -> bool:
+        """
+        退回工作：permanent为True时直接标记为失败，否则在delay秒后可以再次领取。租约已经失效时返回False
+        """
+        pass
+
+    @abstractmethod
+    def extend(self, leases: Iterable[Lease], visibility_timeout: float) -> int:
+        """续租，把仍然有效的租约延长到visibility_timeout秒之后，返回续租成功的数量"""
+        pass
+
+    @abstractmethod
+    def stats(self) -> dict[str, int]:
+        """各状态的工作数量，{状态: 数量}"""
+        pass
+
+    @abstractmethod
+    def existing(self, dedup_keys: Iterable[str]) -> set[str]:
+        """dedup_keys中已经加入过队列的去重键（无论状态），用于精确确认VisitedUrlFilter的结果"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteFrontierStore(FrontierStore):
+    """
+    基于SQLite的爬取队列，适合单机上的多个工作进程共享。
+
+    领取在BEGIN IMMEDIATE事务中完成，多个进程同时领取时由SQLite的写锁串行化。
+    所有方法都是线程安全的，可以在asyncio.to_thread中调用。
+    """
+
+    def __init__(self, path: str, max_attempts: int = 5, busy_timeout: float = 30.0):
+        """
+        参数:
+            path (str): 数据库文件路径
+            max_attempts (int): 每个工作最多领取的次数，超过后标记为失败
+            busy_timeout (float): 其他进程持有写锁时最多等待的秒数
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                dedup_key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                target TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_token TEXT,
+                lease_expires_at REAL,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (state, priority DESC, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_lease_expires_at ON jobs (state, lease_expires_at);
+        ''')
+
+    def add(self, jobs: Iterable[FrontierJob]) -> int:
+        now = time.time()
+        rows = [(job.dedup_key, job.task.kind, job.task.target, job.task.file_path,
+                 job.priority if job.priority is not None else DEFAULT_PRIORITIES.get(job.task.kind, 0), now)
+                for job in jobs]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (dedup_key, kind, target, file_path, priority, state, available_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'pending', ?)", rows)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            return self._conn.total_changes - before
+
+    def lease(self, owner: str, count: int, visibility_timeout: float) -> list[Lease]:
+        now = time.time()
+        expires_at = now + visibility_timeout
+        leases = []
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 收回过期的租约：持有者崩溃或卡住，工作重新变为可领取，领取次数用尽的标记为失败
+                self._conn.execute(
+                    "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL, "
+                    "last_error = COALESCE(last_error, '租约超时') "
+                    "WHERE state = 'leased' AND lease_expires_at <= ?", (self.max_attempts, now))
+                rows = self._conn.execute(
+                    "SELECT id, kind, target, file_path, priority, attempts FROM jobs "
+                    "WHERE state = 'pending' AND available_at <= ? ORDER BY priority DESC, id LIMIT ?",
+                    (now, count)).fetchall()
+                for job_id, kind, target, file_path, priority, attempts in rows:
+                    token = uuid.uuid4().hex
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                        "lease_token = ?, lease_expires_at = ? WHERE id = ?", (owner, token, expires_at, job_id))
+                    leases.append(Lease(job_id, token, CrawlTask(kind, target, file_path), priority, attempts + 1,
+                                        expires_at))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return leases
+
+    def ack(self, lease: Lease) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = 'done', lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL, "
+                "last_error = NULL WHERE id = ? AND state = 'leased' AND lease_token = ?", (lease.job_id, lease.token))
+        return cursor.rowcount == 1
+
+    def nack(self, lease: Lease, error: str, delay: float = 0, permanent: bool = False) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = CASE WHEN ? OR attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "available_at = ?, lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL, last_error = ? "
+                "WHERE id = ? AND state = 'leased' AND lease_token = ?",
+                (permanent, self.max_attempts, time.time() + delay, error, lease.job_id, lease.token))
+        return cursor.rowcount == 1
+
+    def extend(self, leases: Iterable[Lease], visibility_timeout: float) -> int:
+        expires_at = time.time() + visibility_timeout
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND state = 'leased' AND lease_token = ?",
+                [(expires_at, lease.job_id, lease.token) for lease in leases])
+            return self._conn.total_changes - before
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def existing(self, dedup_keys: Iterable[str]) -> set[str]:
+        dedup_keys = list(dedup_keys)
+        found = set()
+        with self._lock:
+            # 分批查询，避免超过SQLite的参数个数上限
+            for start in range(0, len(dedup_keys), 500):
+                batch = dedup_keys[start:start + 500]
+                found.update(key for key, in self._conn.execute(
+                    f"SELECT dedup_key FROM jobs WHERE dedup_key IN ({','.join('?' * len(batch))})", batch))
+        return found
+
+    def failed_jobs(self, limit: int = 100) -> list[tuple[CrawlTask, str]]:
+        """失败的工作和最后一次的失败原因"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, target, file_path, last_error FROM jobs WHERE state = 'failed' ORDER BY id LIMIT ?",
+                (limit,)).fetchall()
+        return [(CrawlTask(kind, target, file_path), error) for kind, target, file_path, error in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FrontierWorker:
+    """
+    从爬取队列领取工作并用NovelCrawlerFactory创建的爬虫执行，任何注册过的爬虫都可以作为工作进程。
+
+    执行期间定期续租，工作耗时超过可见性超时也不会被收回；成功后确认，暂时性失败按retry_policy退避后退回，
+    永久性失败直接标记为失败。follow中的工作类型成功后会把后续工作加入队列：
+    标签列表页 -> 小说详情页 -> 目录页 -> 章节页。
+    配置了visited时，后续工作先经过VisitedUrlFilter过滤，各个标签页中重复出现的小说、
+    已经加入过队列的章节不会再访问队列的数据库。
+    """
+
+    def __init__(
+            self,
+            store: FrontierStore,
+            site_name: str,
+            owner: str = None,
+            batch_size: int = 16,
+            visibility_timeout: float = 300.0,
+            follow: Iterable[str] = ('tag',),
+            retry_policy: RetryPolicy = None,
+            on_result: Callable[[CrawlTask, CrawlResult], None] = None,
+            crawler_options: dict = None,
+            visited: VisitedUrlFilter = None
+    ):
+        """
+        参数:
+            store (FrontierStore): 爬取队列
+            site_name (str): 站点名称，爬虫需要已经通过NovelCrawlerFactory.register_novel_crawler注册
+            owner (str): 工作进程的标识，默认为"主机名:进程号"
+            batch_size (int): 每次领取的工作数，也是同时执行的工作数
+            visibility_timeout (float): 租约的可见性超时（秒）
+            follow : 成功后把后续工作加入队列的工作类型，例如('tag', 'metadata', 'chapters')表示一直展开到章节
+            retry_policy (RetryPolicy): 暂时性失败退回时的退避策略
+            on_result : 每个工作完成（包括失败）时调用，用于保存结果
+            crawler_options (dict): 传给爬虫构造函数的选项
+            visited (VisitedUrlFilter): 已经加入过队列的工作，键为FrontierJob.dedup_key；
+                为None时每个后续工作都交给队列去重。没有指定confirm时使用store.existing精确确认
+        """
+        self.store = store
+        self.site_name = site_name
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.batch_size = batch_size
+        self.visibility_timeout = visibility_timeout
+        self.follow = set(follow)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.on_result = on_result
+        self.crawler_options = crawler_options or {}
+        if visited is not None and visited.confirm is None:
+            visited.confirm = store.existing
+        self.visited = visited
+        self.completed = 0
+        self.failed = 0
+
+    def follow_up_jobs(self, task: CrawlTask, result: CrawlResult) -> list[FrontierJob]:
+        """工作成功后需要加入队列的后续工作"""
+        if task.kind not in self.follow:
+            return []
+        if task.kind == 'tag':
+            return [FrontierJob(CrawlTask('metadata', url)) for _, _, url in result.value]
+        if task.kind == 'metadata':
+            return [FrontierJob(CrawlTask('chapters', result.value.catalog_url))]
+        if task.kind == 'chapters':
+            return [FrontierJob(CrawlTask('chapter', url)) for _, url in result.value]
+        return []
+
+    async def run(self, stop_when_idle: bool = True, idle_interval: float = 5.0) -> None:
+        """
+        持续领取并执行工作，同时最多执行batch_size个，有工作完成就补充领取。
+
+        参数:
+            stop_when_idle (bool): 队列中所有工作都已完成或失败时是否退出。还有等待重试的工作，
+                或者其他工作进程手头还有工作（可能产生后续工作）时，每隔idle_interval秒再次尝试领取
+            idle_interval (float): 没有新工作时再次尝试领取的间隔（秒）
+        """
+        crawler = NovelCrawlerFactory.create_novel_crawler(self.site_name, **self.crawler_options)
+        running: dict[asyncio.Future, Lease] = {}
+        async with crawler:
+            heartbeat = asyncio.ensure_future(self._heartbeat(running))
+            try:
+                while True:
+                    leases = []
+                    if len(running) < self.batch_size:
+                        leases = await asyncio.to_thread(self.store.lease, self.owner,
+                                                         self.batch_size - len(running), self.visibility_timeout)
+                        for lease in leases:
+                            running[asyncio.ensure_future(self._execute(crawler, lease))] = lease
+                    if not running:
+                        if stop_when_idle and not await self._has_unfinished_jobs():
+                            return
+                        await asyncio.sleep(idle_interval)
+                        continue
+                    # 没有领到新工作时，除了等待手头的工作完成，也定期回来看看其他工作进程是否加入了新工作
+                    done, _ = await asyncio.wait(running, timeout=None if leases else idle_interval,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    for job in done:
+                        del running[job]
+                        job.result()
+            finally:
+                heartbeat.cancel()
+                for job in running:
+                    job.cancel()
+
+    def _filter_visited(self, jobs: list[FrontierJob]) -> list[FrontierJob]:
+        """去掉已经加入过队列的工作，同一批中重复的只保留第一个"""
+        by_key = {}
+        for job in jobs:
+            by_key.setdefault(job.dedup_key, job)
+        return [by_key[key] for key in self.visited.filter_new(by_key)]
+
+    async def _has_unfinished_jobs(self) -> bool:
+        stats = await asyncio.to_thread(self.store.stats)
+        return stats.get('pending', 0) + stats.get('leased', 0) > 0
+
+    async def _heartbeat(self, running: dict[asyncio.Future, Lease]) -> None:
+        """每隔可见性超时的三分之一为执行中的工作续租一次"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if running:
+                await asyncio.to_thread(self.store.extend, list(running.values()), self.visibility_timeout)
+
+    async def _execute(self, crawler, lease: Lease) -> None:
+        result = await run_crawl_task(crawler, lease.task)
+        if self.on_result is not None:
+            self.on_result(lease.task, result)
+        if result.ok:
+            follow_up = self.follow_up_jobs(lease.task, result)
+            if follow_up and self.visited is not None:
+                follow_up = await asyncio.to_thread(self._filter_visited, follow_up)
+            if follow_up:
+                await asyncio.to_thread(self.store.add, follow_up)
+            await asyncio.to_thread(self.store.ack, lease)
+            self.completed += 1
+            return
+        self.failed += 1
+        delay = self.retry_policy.backoff(lease.attempts) if result.retryable else 0
+        await asyncio.to_thread(self.store.nack, lease, result.error, delay, not result.retryable)
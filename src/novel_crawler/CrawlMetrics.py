@@ -0,0 +1,238 @@
+import bisect
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Callable, Iterator, Optional
+
+import aiohttp
+
+# 直方图的默认桶上界（秒），覆盖从本地缓存命中到慢请求的范围
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    固定桶的累计直方图，记录一次观测只需要一次二分查找和两次加法，可以长期开启。
+
+    可以按桶内线性插值估计分位数，精度取决于桶的划分。
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶对应+Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """估计q分位数（0 < q < 1），没有观测时返回None；落在+Inf桶中时返回最大的有限桶上界"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts)),
+        }
+
+
+class CrawlMetrics:
+    """
+    爬虫的指标：按阶段和接口类型的耗时直方图、按状态码和失败类型的计数器、在途数量的仪表。
+
+    阶段依次为dns（DNS解析）、connect（建立TCP连接）、ttfb（发出请求到收到响应头）、download（下载响应体）、
+    parse（解析页面）和write（写文件）。
+
+    请求各阶段的耗时通过trace_config()返回的aiohttp TraceConfig采集，解析和写文件的耗时由爬虫调用phase()采集。
+    每个请求结束时，如果设置了on_request，会收到一条结构化的请求记录，可以用log_requests()写入日志。
+    所有更新都在事件循环线程中进行，不加锁；导出快照的开销与指标的种类数成正比，与请求数无关。
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, on_request: Callable[[dict], None] = None):
+        """
+        参数:
+            buckets : 耗时直方图的桶上界（秒），需要递增
+            on_request : 每个请求结束时调用，参数为请求记录，包括kind、method、url、status、error、
+                elapsed和各阶段的耗时phases
+        """
+        self.buckets = buckets
+        self.on_request = on_request
+        self.histograms: dict[tuple[str, str], Histogram] = {}       # {(阶段, 接口类型): 直方图}
+        self.responses: dict[tuple[str, int], int] = defaultdict(int)    # {(接口类型, 状态码): 次数}
+        self.failures: dict[tuple[str, str], int] = defaultdict(int)     # {(接口类型, 失败类型): 次数}
+        self.results: dict[tuple[str, str], int] = defaultdict(int)      # {(接口类型, CrawlStatus): 次数}
+        self.in_flight: dict[str, int] = defaultdict(int)                # {阶段: 在途数量}
+
+    def observe(self, phase: str, kind: str, seconds: float) -> None:
+        histogram = self.histograms.get((phase, kind))
+        if histogram is None:
+            histogram = self.histograms[(phase, kind)] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def histogram(self, phase: str, kind: str) -> Optional[Histogram]:
+        return self.histograms.get((phase, kind))
+
+    @contextmanager
+    def phase(self, phase: str, kind: str) -> Iterator[None]:
+        """统计代码块的耗时和在途数量，例如with metrics.phase('parse', 'chapter'): ..."""
+        self.in_flight[phase] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, kind, time.perf_counter() - start)
+            self.in_flight[phase] -= 1
+
+    def count_failure(self, kind: str, failure: str) -> None:
+        self.failures[(kind, failure)] += 1
+
+    def count_result(self, kind: str, status: str) -> None:
+        self.results[(kind, status)] += 1
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        采集请求各阶段耗时的TraceConfig。
+
+        请求时通过trace_request_ctx={'kind': 接口类型}传入接口类型，没有传入时记为'other'。
+        下载响应体的耗时不在TraceConfig的回调范围内，由发起请求的代码用phase('download', kind)统计。
+        """
+        trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=self._trace_context)
+
+        async def on_request_start(session, context, params):
+            context.start = time.perf_counter()
+            context.method = params.method
+            context.url = str(params.url)
+            self.in_flight['request'] += 1
+
+        async def on_dns_resolvehost_start(session, context, params):
+            context.dns_start = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, context, params):
+            context.phases['dns'] = time.perf_counter() - context.dns_start
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            # 建立连接的回调包括了DNS解析，这里只记录TCP连接本身
+            context.phases['connect'] = time.perf_counter() - context.connect_start - context.phases.get('dns', 0.0)
+
+        async def on_request_headers_sent(session, context, params):
+            context.headers_sent = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            context.phases['ttfb'] = time.perf_counter() - (context.headers_sent or context.start)
+            self.responses[(context.kind, params.response.status)] += 1
+            self._finish(context, params.response.status, None)
+
+        async def on_request_exception(session, context, params):
+            self.count_failure(context.kind, type(params.exception).__name__)
+            self._finish(context, None, f'{type(params.exception).__name__}: {params.exception}')
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_request_headers_sent.append(on_request_headers_sent)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    @staticmethod
+    def _trace_context(trace_request_ctx=None) -> SimpleNamespace:
+        kind = trace_request_ctx.get('kind', 'other') if isinstance(trace_request_ctx, dict) else 'other'
+        return SimpleNamespace(kind=kind, start=0.0, headers_sent=None, phases={}, method='', url='')
+
+    def _finish(self, context: SimpleNamespace, status: Optional[int], error: Optional[str]) -> None:
+        self.in_flight['request'] -= 1
+        for phase, seconds in context.phases.items():
+            self.observe(phase, context.kind, seconds)
+        if self.on_request is not None:
+            self.on_request({
+                'kind': context.kind,
+                'method': context.method,
+                'url': context.url,
+                'status': status,
+                'error': error,
+                'elapsed': time.perf_counter() - context.start,
+                'phases': dict(context.phases),
+            })
+
+    def snapshot(self) -> dict:
+        """当前所有指标的快照，可以直接序列化为JSON"""
+        return {
+            'phases': {f'{phase}/{kind}': histogram.to_dict()
+                       for (phase, kind), histogram in sorted(self.histograms.items())},
+            'responses': {f'{kind}/{status}': count for (kind, status), count in sorted(self.responses.items())},
+            'failures': {f'{kind}/{failure}': count for (kind, failure), count in sorted(self.failures.items())},
+            'results': {f'{kind}/{status}': count for (kind, status), count in sorted(self.results.items())},
+            'in_flight': dict(self.in_flight),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def to_prometheus(self, prefix: str = 'novel_crawler') -> str:
+        """Prometheus文本格式（exposition format）的快照"""
+        lines = [f'# TYPE {prefix}_phase_seconds histogram']
+        for (phase, kind), histogram in sorted(self.histograms.items()):
+            labels = f'phase="{phase}",kind="{_escape(kind)}"'
+            cumulative = 0
+            for bound, count in zip([*map(str, histogram.buckets), '+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_phase_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{prefix}_phase_seconds_count{{{labels}}} {histogram.count}')
+        for name, label, counter in (('responses', 'status', self.responses), ('failures', 'type', self.failures),
+                                     ('results', 'status', self.results)):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for (kind, value), count in sorted(counter.items()):
+                lines.append(f'{prefix}_{name}_total{{kind="{_escape(kind)}",{label}="{_escape(str(value))}"}} {count}')
+        lines.append(f'# TYPE {prefix}_in_flight gauge')
+        for stage, count in sorted(self.in_flight.items()):
+            lines.append(f'{prefix}_in_flight{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def log_requests(logger: logging.Logger = None, level: int = logging.DEBUG) -> Callable[[dict], None]:
+    """
+    返回把请求记录以JSON写入日志的回调，可以作为CrawlMetrics的on_request。
+
+    参数:
+        logger (logging.Logger): 日志记录器，默认为'novel_crawler.requests'
+        level (int): 日志级别，出错的请求提升为WARNING
+    """
+    logger = logger or logging.getLogger('novel_crawler.requests')
+
+    def on_request(record: dict) -> None:
+        record_level = logging.WARNING if record['error'] or (record['status'] or 0) >= 400 else level
+        if logger.isEnabledFor(record_level):
+            logger.log(record_level, json.dumps(record, ensure_ascii=False))
+
+    return on_request
@@ -0,0 +1,97 @@
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import aiohttp
+
+
+@dataclass
+class ConnectionOptions:
+    """爬虫自有会话的连接池配置"""
+    limit: int = 100                    # 连接池的总连接数上限
+    limit_per_host: int = 16            # 每个站点的连接数上限
+    ttl_dns_cache: Optional[int] = 300  # DNS缓存时间（秒），None表示永久缓存
+    keepalive_timeout: float = 30.0     # 空闲连接保持的时间（秒）
+    compress: bool = True               # 是否接受gzip/deflate压缩的响应
+    total_timeout: Optional[float] = 300    # 单个请求的总超时（秒），None表示不限制
+
+
+@dataclass
+class ConnectionStats:
+    """连接复用统计"""
+    requests: int = 0               # 发出的请求数
+    connections_created: int = 0    # 新建的TCP连接数
+    connections_reused: int = 0     # 复用连接池中空闲连接的次数
+    dns_lookups: int = 0            # 实际发生的DNS解析次数
+    dns_cache_hits: int = 0         # 命中DNS缓存的次数
+
+    @property
+    def reuse_ratio(self) -> float:
+        """复用连接的请求占比"""
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'reuse_ratio': self.reuse_ratio}
+
+
+def _stats_trace_config(stats: ConnectionStats) -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        stats.requests += 1
+
+    async def on_connection_create_end(session, context, params):
+        stats.connections_created += 1
+
+    async def on_connection_reuseconn(session, context, params):
+        stats.connections_reused += 1
+
+    async def on_dns_resolvehost_end(session, context, params):
+        stats.dns_lookups += 1
+
+    async def on_dns_cache_hit(session, context, params):
+        stats.dns_cache_hits += 1
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+    return trace_config
+
+
+def create_session(
+        headers: dict,
+        options: ConnectionOptions,
+        stats: ConnectionStats = None,
+        trace_configs: list[aiohttp.TraceConfig] = None
+) -> aiohttp.ClientSession:
+    """
+    按连接池配置创建会话。
+
+    参数:
+        headers (dict): 会话默认请求头
+        options (ConnectionOptions): 连接池配置
+        stats (ConnectionStats): 连接复用统计，为None时不统计
+        trace_configs (list): 额外的aiohttp TraceConfig
+    """
+    connector = aiohttp.TCPConnector(
+        limit=options.limit,
+        limit_per_host=options.limit_per_host,
+        ttl_dns_cache=options.ttl_dns_cache,
+        use_dns_cache=True,
+        keepalive_timeout=options.keepalive_timeout,
+    )
+    headers = dict(headers)
+    if not options.compress:
+        headers['Accept-Encoding'] = 'identity'
+    trace_configs = list(trace_configs or [])
+    if stats is not None:
+        trace_configs.append(_stats_trace_config(stats))
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        auto_decompress=options.compress,
+        timeout=aiohttp.ClientTimeout(total=options.total_timeout),
+        trace_configs=trace_configs,
+    )
@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar('T')
+
+# 默认做对冲的接口类型：章节和详情页是幂等的GET请求，也是整本下载中数量最多、最容易被长尾拖慢的请求
+DEFAULT_HEDGE_KINDS = frozenset({'chapter', 'metadata'})
+
+
+@dataclass
+class HedgeStats:
+    """一种接口类型的对冲统计"""
+    requests: int = 0       # 经过对冲策略的请求数（不含对冲请求本身）
+    hedged: int = 0         # 发出对冲请求的次数
+    hedge_wins: int = 0     # 对冲请求先于原请求成功的次数
+    budget_denied: int = 0  # 超过阈值但对冲预算不足、没有发出对冲请求的次数
+
+    @property
+    def win_rate(self) -> float:
+        """对冲请求的胜率，胜率很低说明阈值过低，额外的请求大多是浪费"""
+        return self.hedge_wins / self.hedged if self.hedged else 0.0
+
+    @property
+    def hedge_ratio(self) -> float:
+        """额外请求占请求数的比例"""
+        return self.hedged / self.requests if self.requests else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'win_rate': self.win_rate, 'hedge_ratio': self.hedge_ratio}
+
+
+class LatencyWindow:
+    """最近size次成功请求的耗时，用于估计分位数"""
+
+    def __init__(self, size: int = 256):
+        self.samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """最近样本的q分位数（0 < q < 1），没有样本时返回None；窗口很小，每次直接排序"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class HedgePolicy:
+    """
+    对冲请求（hedged requests）策略，用于削减长尾延迟。
+
+    请求耗时超过该接口类型最近成功请求的quantile分位数（默认p95）仍未完成时，再发出一个相同的请求，
+    两者中先成功的作为结果，另一个被取消。对冲请求同样经过调度器和限流器。
+    全局对冲预算是一个令牌桶：每个请求存入budget个令牌、最多累积burst个，每次对冲消耗一个，
+    因此额外请求长期不超过请求数的budget（默认5%），站点的负载有明确上界。
+
+    同时提供按接口类型的单次请求超时，超时按暂时性失败处理，由RetryPolicy退避重试；
+    只需要超时、不需要对冲时可以传入kinds=()。
+    """
+
+    def __init__(
+            self,
+            quantile: float = 0.95,
+            budget: float = 0.05,
+            burst: float = 10.0,
+            min_delay: float = 0.05,
+            min_samples: int = 20,
+            window: int = 256,
+            kinds: Iterable[str] = DEFAULT_HEDGE_KINDS,
+            timeouts: dict[str, float] = None,
+            default_timeout: Optional[float] = None
+    ):
+        """
+        参数:
+            quantile (float): 对冲阈值取最近成功请求耗时的这个分位数
+            budget (float): 对冲请求占请求数比例的上限
+            burst (float): 对冲预算最多累积的令牌数，允许短时间内集中对冲
+            min_delay (float): 对冲阈值的下限（秒），避免站点很快时对冲过于频繁
+            min_samples (int): 一种接口类型至少有这么多成功请求后才开始对冲，样本太少时分位数不可靠
+            window (int): 每种接口类型保留的最近耗时样本数
+            kinds : 做对冲的接口类型，接口类型与ResponseCache中的一致；只应包括幂等的请求
+            timeouts (dict): {接口类型: 单次请求的超时秒数}，覆盖default_timeout
+            default_timeout (float): 没有在timeouts中列出的接口类型的单次请求超时，None表示沿用会话的超时
+        """
+        if not 0 < quantile < 1:
+            raise ValueError(f"quantile必须在0和1之间：{quantile}")
+        self.quantile = quantile
+        self.budget = budget
+        self.burst = burst
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.kinds = frozenset(kinds)
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.tokens = burst
+        self.latencies: dict[str, LatencyWindow] = {}
+        self.stats: dict[str, HedgeStats] = {}
+
+    def timeout_for(self, kind: str) -> Optional[float]:
+        """单次请求的超时秒数，None表示沿用会话的超时"""
+        return self.timeouts.get(kind, self.default_timeout)
+
+    def hedge_delay(self, kind: str) -> Optional[float]:
+        """请求发出多久后仍未完成就发出对冲请求，None表示不对冲"""
+        if kind not in self.kinds:
+            return None
+        latencies = self.latencies.get(kind)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, latencies.quantile(self.quantile))
+
+    def observe(self, kind: str, seconds: float) -> None:
+        latencies = self.latencies.get(kind)
+        if latencies is None:
+            latencies = self.latencies[kind] = LatencyWindow(self.window)
+        latencies.observe(seconds)
+
+    def stats_for(self, kind: str) -> HedgeStats:
+        stats = self.stats.get(kind)
+        if stats is None:
+            stats = self.stats[kind] = HedgeStats()
+        return stats
+
+    def snapshot(self) -> dict:
+        """各接口类型的对冲统计和当前阈值，可以直接序列化为JSON"""
+        return {
+            'tokens': round(self.tokens, 3),
+            'kinds': {kind: {**stats.to_dict(), 'threshold': self.hedge_delay(kind)}
+                      for kind, stats in sorted(self.stats.items())},
+        }
+
+    def _try_spend(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    async def run(self, kind: str, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        按对冲策略执行request，返回先成功的结果；两次请求都失败时抛出后失败的那个异常。
+
+        参数:
+            kind (str): 接口类型
+            request : 发出一次请求的协程函数，可能被调用两次，被取消时需要自行释放资源
+        """
+        stats = self.stats_for(kind)
+        stats.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.budget)
+        delay = self.hedge_delay(kind)
+        start = time.monotonic()
+        if delay is None:
+            result = await request()
+            self.observe(kind, time.monotonic() - start)
+            return result
+
+        primary = _start(request)
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if self._try_spend():
+                    stats.hedged += 1
+                    tasks.add(_start(request))
+                else:
+                    stats.budget_denied += 1
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            stats.hedge_wins += 1
+                        # 对冲请求胜出时原请求的真实耗时未知，记录到此为止的耗时作为下界
+                        self.observe(kind, time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _start(request: Callable[[], Awaitable[T]]) -> asyncio.Task:
+    task = asyncio.ensure_future(request())
+    # 落败的请求被取消，或者在胜者之后才失败，它们的异常不需要再处理
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
@@ -0,0 +1,251 @@
+import asyncio
+import re
+import time
+import unicodedata
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from novel_crawler.ChapterPipeline import ChapterSource
+from novel_crawler.NovelCrawlerFactory import BaseNovelCrawler, CrawlResult, CrawlStatus, NovelCrawlerFactory
+from novel_crawler.NovelCrawlerFactory import NovelMetadata
+
+_CHINESE_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8,
+                   '九': 9}
+_CHINESE_UNITS = {'十': 10, '百': 100, '千': 1000, '万': 10000}
+_CHAPTER_NUMBER = re.compile(r'第([零〇一二两三四五六七八九十百千万\d]+)([章节回卷集])')
+# 标题中不参与比较的字符：空白、标点和各种括号
+_IGNORED_CHARS = re.compile(r'[\s\W_]+')
+
+
+def chinese_number(text: str) -> int:
+    """把'一百零三'、'二十'、'103'这样的数字转换为整数"""
+    if text.isdigit():
+        return int(text)
+    total = section = digit = 0
+    for char in text:
+        if char in _CHINESE_DIGITS:
+            digit = _CHINESE_DIGITS[char]
+        elif char == '万':
+            total += (section + digit) * 10000
+            section = digit = 0
+        else:
+            # '十'前面没有数字时表示一十
+            section += (digit or 1) * _CHINESE_UNITS[char]
+            digit = 0
+    return total + section + digit
+
+
+def normalize_title(text: str) -> str:
+    """规范化书名或作者名：全角转半角、小写，去掉空白和标点"""
+    return _IGNORED_CHARS.sub('', unicodedata.normalize('NFKC', text)).lower()
+
+
+def normalize_chapter_title(text: str) -> str:
+    """规范化章节标题：在normalize_title的基础上，把'第一百零三章'统一为'第103章'"""
+    text = unicodedata.normalize('NFKC', text)
+    text = _CHAPTER_NUMBER.sub(lambda match: f'第{chinese_number(match.group(1))}{match.group(2)}', text)
+    return normalize_title(text)
+
+
+def align_chapters(
+        primary: list[tuple[str, str]],
+        mirror: list[tuple[str, str]]
+) -> list[Optional[str]]:
+    """
+    按规范化后的章节标题对齐两个目录，返回与primary等长的列表，元素为镜像中对应章节的URL，没有对应章节时为None。
+
+    标题重复的章节（例如多个'上架感言'）按出现的先后顺序一一对应。
+    """
+    by_title: dict[str, list[str]] = {}
+    for title, url in mirror:
+        by_title.setdefault(normalize_chapter_title(title), []).append(url)
+    used: dict[str, int] = {}
+    aligned = []
+    for title, _ in primary:
+        key = normalize_chapter_title(title)
+        urls = by_title.get(key, ())
+        index = used.get(key, 0)
+        aligned.append(urls[index] if index < len(urls) else None)
+        used[key] = index + 1
+    return aligned
+
+
+@dataclass
+class MirrorHealth:
+    """一个站点最近的表现，用于按吞吐分配章节请求"""
+    latency: Optional[float] = None     # 成功请求耗时的指数移动平均（秒），还没有成功过时为None
+    success_rate: float = 1.0           # 成功率的指数移动平均
+    in_flight: int = 0
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0         # 连续失败后暂时不再分配请求，直到这个时刻（time.monotonic）
+
+    def expected_delay(self, default_latency: float) -> float:
+        """把下一个请求交给这个站点时，预计多久能拿到结果；在途请求越多、越慢、越容易失败，预计越久"""
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.in_flight + 1) * latency / max(self.success_rate, 0.05)
+
+    def record(self, ok: bool, elapsed: float, cooldown: float) -> None:
+        self.success_rate = 0.9 * self.success_rate + 0.1 * ok
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= 3:
+            self.cooldown_until = time.monotonic() + cooldown * min(2 ** (self.consecutive_failures - 3), 16)
+
+
+class MirrorChapterSource(ChapterSource):
+    """
+    从多个镜像站点获取同一本小说的章节。
+
+    prepare时在其他站点上按规范化的书名和作者搜索同一本书，并按规范化的章节标题与主站目录对齐。
+    每一章交给预计最快拿到结果的站点（按各站点观测到的延迟、成功率和在途请求数估计），
+    因此请求量与各站点的吞吐成正比；失败时换下一个站点重试，所有站点都失败才算失败。
+    重排窗口是所有可用站点窗口之和，整本书的下载时间取决于所有站点的总吞吐，而不是最慢的站点。
+    """
+
+    def __init__(self, downloader: 'MirrorDownloader', primary: str):
+        self.downloader = downloader
+        self.primary = primary
+        self.window = None
+        self._candidates: dict[str, list[tuple[str, str]]] = {}     # {主站章节URL: [(站点名称, 章节URL)]}
+
+    async def prepare(self, metadata: NovelMetadata, chapters_list: list[tuple[str, str]]) -> None:
+        crawlers = self.downloader.crawlers
+        mirrors = [name for name in crawlers if name != self.primary]
+        mirror_lists = await asyncio.gather(*(self.downloader.find_chapters(name, metadata) for name in mirrors))
+        columns = [[url for _, url in chapters_list]]
+        sites = [self.primary]
+        for name, mirror_list in zip(mirrors, mirror_lists):
+            if mirror_list:
+                columns.append(align_chapters(chapters_list, mirror_list))
+                sites.append(name)
+        self._candidates = {
+            urls[0]: [(site, url) for site, url in zip(sites, urls) if url is not None]
+            for urls in zip(*columns)
+        }
+        self.window = sum(getattr(crawlers[site], 'chapter_window', 32) for site in sites)
+        matched = ', '.join(f'{site}（{sum(url is not None for url in column)}章）'
+                            for site, column in zip(sites[1:], columns[1:]))
+        print(f"《{metadata.title}》的镜像站点：{matched or '无'}")
+
+    async def fetch(self, chapter: tuple[str, str]) -> CrawlResult[str]:
+        _, chapter_url = chapter
+        candidates = list(self._candidates.get(chapter_url) or [(self.primary, chapter_url)])
+        result = CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error='没有可用的站点', url=chapter_url)
+        while candidates:
+            site, url = self.downloader.choose(candidates)
+            candidates.remove((site, url))
+            result = await self.downloader.fetch_chapter(site, url)
+            if result.ok:
+                return CrawlResult.success(result.value, chapter_url)
+        return result
+
+
+class MirrorDownloader:
+    """
+    多站点下载：同一本书同时从所有注册过的站点获取章节，某个站点限流或章节页面损坏时由其他站点补齐。
+
+    作为异步上下文管理器使用，期间每个站点的爬虫使用各自的长连接会话：
+
+        async with MirrorDownloader() as downloader:
+            result = await downloader.download('ujxsw', url, file_path)
+
+    详情页、目录、断点续传和写文件都由主站的爬虫负责，其他站点只提供章节内容。
+    """
+
+    def __init__(
+            self,
+            crawlers: dict[str, BaseNovelCrawler] = None,
+            site_names: Iterable[str] = None,
+            crawler_options: dict[str, dict] = None,
+            search_top_n: int = 10,
+            cooldown: float = 30.0
+    ):
+        """
+        参数:
+            crawlers (dict): {站点名称: 爬虫实例}，为None时用NovelCrawlerFactory为site_names创建
+            site_names : 参与下载的站点名称，默认为所有注册过的站点
+            crawler_options (dict): {站点名称: 传给爬虫构造函数的选项}
+            search_top_n (int): 在其他站点上按书名搜索时查看的结果数
+            cooldown (float): 站点连续失败3次后暂停分配请求的基础秒数，继续失败时加倍
+        """
+        if crawlers is None:
+            crawler_options = crawler_options or {}
+            names = list(site_names) if site_names is not None else NovelCrawlerFactory.registered_sites()
+            crawlers = {name: NovelCrawlerFactory.create_novel_crawler(name, **crawler_options.get(name, {}))
+                        for name in names}
+        self.crawlers = crawlers
+        self.search_top_n = search_top_n
+        self.cooldown = cooldown
+        self.health = {name: MirrorHealth() for name in crawlers}
+        self._exit_stack: Optional[AsyncExitStack] = None
+
+    async def __aenter__(self) -> 'MirrorDownloader':
+        self._exit_stack = AsyncExitStack()
+        for crawler in self.crawlers.values():
+            await self._exit_stack.enter_async_context(crawler)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self._exit_stack.aclose()
+
+    async def download(self, primary: str, url: str, file_path: str) -> CrawlResult[str]:
+        """
+        下载一本小说。
+
+        参数:
+            primary (str): 主站的站点名称，url属于这个站点
+            url (str): 主站的小说详情页URL
+            file_path (str): 小说保存的文件夹，与write_novel_content_to_file相同
+        """
+        return await self.crawlers[primary].write_novel_content_to_file(
+            url, file_path, chapter_source=MirrorChapterSource(self, primary))
+
+    async def find_chapters(self, site: str, metadata: NovelMetadata) -> Optional[list[tuple[str, str]]]:
+        """在site上找到书名和作者都与metadata一致的小说，返回它的目录，找不到或出错时返回None"""
+        crawler = self.crawlers[site]
+        title, author = normalize_title(metadata.title), normalize_title(metadata.author)
+        try:
+            novels = await crawler.get_novel_list_by_keyword_async(metadata.title, self.search_top_n)
+            detail_url = next((novel_url for novel_title, novel_author, novel_url in novels or ()
+                               if normalize_title(novel_title) == title and normalize_title(novel_author) == author),
+                              None)
+            if detail_url is None:
+                return None
+            metadata_result = await crawler.get_novel_metadata_result_async(detail_url)
+            if not metadata_result.ok:
+                return None
+            chapters_result = await crawler.get_novel_chapters_list_result_async(metadata_result.value.catalog_url)
+            return chapters_result.value if chapters_result.ok else None
+        except Exception as e:
+            print(f"在站点 {site} 上查找《{metadata.title}》失败：{type(e).__name__}: {e}")
+            return None
+
+    def choose(self, candidates: list[tuple[str, str]]) -> tuple[str, str]:
+        """从候选的(站点名称, 章节URL)中选出预计最快拿到结果的，暂停中的站点只有在别无选择时才会被选中"""
+        now = time.monotonic()
+        known = [health.latency for health in self.health.values() if health.latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        return min(candidates, key=lambda candidate: (
+            self.health[candidate[0]].cooldown_until > now,
+            self.health[candidate[0]].expected_delay(default_latency)))
+
+    async def fetch_chapter(self, site: str, url: str) -> CrawlResult[str]:
+        health = self.health[site]
+        health.in_flight += 1
+        start = time.monotonic()
+        try:
+            result = await self.crawlers[site].get_novel_chapter_content_result_async(url)
+        except Exception as e:
+            result = CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error=f'{type(e).__name__}: {e}', url=url)
+        finally:
+            health.in_flight -= 1
+        health.record(result.ok, time.monotonic() - start, self.cooldown)
+        return result
@@ -0,0 +1,301 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+
+try:
+    import zstandard
+except ImportError:     # zstandard是可选依赖，只有使用zstd压缩时才需要
+    zstandard = None
+
+ARCHIVE_SUFFIX = '.nca'
+INDEX_SUFFIX = '.idx'
+
+# 索引文件的文件头：魔数、压缩方式、字典ID；之后是定长的索引项：章节记录在数据文件中的偏移、长度，正文解压后的长度
+_INDEX_HEADER = struct.Struct('<8s16sI')
+_INDEX_HEADER_SIZE = 32
+_INDEX_ENTRY = struct.Struct('<QII')
+_INDEX_MAGIC = b'NCARCH01'
+# 每个章节记录的开头：标题的字节数，之后是UTF-8编码的标题和压缩后的正文
+_RECORD_HEADER = struct.Struct('<H')
+
+
+class ChapterCodec(ABC):
+    """
+    单个章节的压缩方式。
+
+    每个章节单独压缩，读取任意一章都不需要解压其他章节；章节很短时单独压缩的压缩率很低，
+    可以使用从大量章节中训练出的共享字典弥补。压缩和解压可能在多个线程中同时调用。
+    """
+    name: str = None
+
+    def __init__(self, dictionary: bytes = None):
+        """
+        参数:
+            dictionary (bytes): 共享字典，写入和读取同一个归档需要使用相同的字典；为None时不使用字典
+        """
+        self.dictionary = dictionary
+
+    @property
+    def dictionary_id(self) -> int:
+        """字典的标识，写入归档的文件头，读取时用来检查字典是否一致；不使用字典时为0"""
+        return zlib.crc32(self.dictionary) if self.dictionary else 0
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        pass
+
+
+class ZlibChapterCodec(ChapterCodec):
+    """标准库zlib（DEFLATE，与gzip相同的压缩算法），共享字典作为预设字典（zdict）使用，只有最后32KB有效"""
+    name = 'zlib'
+
+    def __init__(self, dictionary: bytes = None, level: int = 6):
+        super().__init__(dictionary)
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.dictionary:
+            compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+        else:
+            compressor = zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class ZstdChapterCodec(ChapterCodec):
+    """zstd压缩，需要安装zstandard；压缩率和速度都优于zlib，字典可以用train_dictionary训练"""
+    name = 'zstd'
+
+    def __init__(self, dictionary: bytes = None, level: int = 3):
+        if zstandard is None:
+            raise ImportError('使用zstd压缩需要先安装zstandard')
+        super().__init__(dictionary)
+        self.level = level
+        self._dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        # 压缩器和解压器对象不能在多个线程中同时使用，每个线程各自创建
+        self._local = threading.local()
+
+    @property
+    def dictionary_id(self) -> int:
+        return self._dict_data.dict_id() if self._dict_data is not None else 0
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dict_data)
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dict_data)
+        return decompressor.decompress(data)
+
+
+CHAPTER_CODECS = {
+    ZlibChapterCodec.name: ZlibChapterCodec,
+    ZstdChapterCodec.name: ZstdChapterCodec,
+}
+
+
+def create_chapter_codec(name: str, dictionary: bytes = None, **options) -> ChapterCodec:
+    """
+    按名称创建章节压缩方式。
+
+    参数:
+        name (str): 'zlib'或'zstd'
+        dictionary (bytes): 共享字典
+        options : 传给压缩方式构造函数的其他参数，例如level
+    """
+    codec_class = CHAPTER_CODECS.get(name)
+    if codec_class is None:
+        raise ValueError(f"未知的压缩方式 '{name}'，可选：{', '.join(CHAPTER_CODECS)}")
+    return codec_class(dictionary, **options)
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 112640) -> bytes:
+    """
+    从章节样本中训练zstd共享字典，需要安装zstandard。训练出的字典也可以作为zlib的预设字典使用。
+
+    参数:
+        samples : 章节正文样本，通常取几千个不同小说的章节
+        size (int): 字典的最大字节数
+    """
+    if zstandard is None:
+        raise ImportError('训练共享字典需要先安装zstandard')
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+def index_path_for(archive_path: str) -> str:
+    """归档数据文件对应的索引文件路径"""
+    return archive_path + INDEX_SUFFIX
+
+
+class NovelArchiveWriter:
+    """
+    以追加方式写入小说归档。
+
+    归档由数据文件和索引文件组成：数据文件依次保存每个章节的记录（标题和单独压缩的正文），
+    索引文件保存每个章节记录的偏移和长度。先写数据再写索引，中途崩溃时索引只会缺少最后几章，
+    不会指向没有写完的数据。两个文件都只在末尾追加，已经写入的章节不会被改写，适合断点续传和增量更新。
+    """
+
+    def __init__(self, path: str, codec: ChapterCodec):
+        """
+        参数:
+            path (str): 数据文件路径，索引文件为path + '.idx'
+            codec (ChapterCodec): 章节压缩方式，已有归档的压缩方式或字典与之不一致时抛出ValueError
+        """
+        self.path = path
+        self.codec = codec
+        self._data = open(path, 'ab')
+        self._index = open(index_path_for(path), 'a+b')
+        self._index.seek(0)
+        header = self._index.read(_INDEX_HEADER_SIZE)
+        if len(header) < _INDEX_HEADER_SIZE:
+            self._index.truncate(0)
+            self._index.write(_INDEX_HEADER.pack(_INDEX_MAGIC, codec.name.encode(), codec.dictionary_id)
+                              .ljust(_INDEX_HEADER_SIZE, b'\0'))
+        else:
+            _check_header(path, header, codec)
+
+    def truncate(self, chapter_count: int, data_end: int) -> None:
+        """
+        只保留前chapter_count章，丢弃之后的索引项和data_end之后的数据，用于与清单文件对齐后续传。
+
+        参数:
+            chapter_count (int): 保留的章节数
+            data_end (int): 保留的章节在数据文件中的结束偏移
+        """
+        self._data.truncate(data_end)
+        self._index.truncate(_INDEX_HEADER_SIZE + chapter_count * _INDEX_ENTRY.size)
+
+    def append(self, title: str, content: str) -> bytes:
+        """压缩并追加一章，返回写入数据文件的章节记录"""
+        raw = content.encode('utf-8')
+        title_bytes = title.encode('utf-8')
+        record = _RECORD_HEADER.pack(len(title_bytes)) + title_bytes + self.codec.compress(raw)
+        offset = self._data.seek(0, os.SEEK_END)
+        self._data.write(record)
+        self._data.flush()
+        self._index.write(_INDEX_ENTRY.pack(offset, len(record), len(raw)))
+        self._index.flush()
+        return record
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self) -> 'NovelArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class NovelArchiveReader:
+    """
+    通过mmap读取小说归档，按章节序号读取任意一章只需要定位索引项并解压这一章，与归档大小无关。
+
+    只读取打开时索引中已有的章节；写入端中途崩溃时，末尾不完整的索引项会被忽略。
+    """
+
+    def __init__(self, path: str, codec: ChapterCodec):
+        """
+        参数:
+            path (str): 数据文件路径
+            codec (ChapterCodec): 章节压缩方式，需要与写入时的压缩方式和字典一致
+        """
+        self.path = path
+        self.codec = codec
+        self._data_file = open(path, 'rb')
+        self._index_file = open(index_path_for(path), 'rb')
+        self._data = _map(self._data_file)
+        self._index = _map(self._index_file)
+        _check_header(path, bytes(self._index[:_INDEX_HEADER_SIZE]), codec)
+        count = (len(self._index) - _INDEX_HEADER_SIZE) // _INDEX_ENTRY.size
+        # 数据总是先于索引写入，但数据文件也可能被外部截断，只保留记录完整的章节
+        while count and sum(self._entry(count - 1)[:2]) > len(self._data):
+            count -= 1
+        self._count = count
+
+    def _entry(self, index: int) -> tuple[int, int, int]:
+        return _INDEX_ENTRY.unpack_from(self._index, _INDEX_HEADER_SIZE + index * _INDEX_ENTRY.size)
+
+    def _record(self, index: int) -> tuple[int, int, int]:
+        """章节记录的(标题起始偏移, 正文起始偏移, 记录结束偏移)"""
+        if not 0 <= index < self._count:
+            raise IndexError(f'章节序号超出范围：{index}')
+        offset, length, _ = self._entry(index)
+        title_start = offset + _RECORD_HEADER.size
+        return title_start, title_start + _RECORD_HEADER.unpack_from(self._data, offset)[0], offset + length
+
+    def __len__(self) -> int:
+        return self._count
+
+    def title(self, index: int) -> str:
+        title_start, content_start, _ = self._record(index)
+        return self._data[title_start:content_start].decode('utf-8')
+
+    def chapter(self, index: int) -> tuple[str, str]:
+        """第index章的(标题, 正文)"""
+        title_start, content_start, end = self._record(index)
+        content = self.codec.decompress(self._data[content_start:end])
+        return self._data[title_start:content_start].decode('utf-8'), content.decode('utf-8')
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        for index in range(self._count):
+            yield self.chapter(index)
+
+    def titles(self) -> list[str]:
+        """所有章节标题，不需要解压正文"""
+        return [self.title(index) for index in range(self._count)]
+
+    def export_text(self, text_path: str) -> None:
+        """逐章解压并写入纯文本文件，格式与直接下载的.txt文件相同，内存中同时只有一章"""
+        with open(text_path, 'wb') as f:
+            for title, content in self:
+                f.write(f"{title}\n{content}\n\n".encode('utf-8'))
+
+    def close(self) -> None:
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._data_file.close()
+        self._index_file.close()
+
+    def __enter__(self) -> 'NovelArchiveReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _map(f):
+    """只读映射整个文件，空文件不能映射，返回空字节串"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _check_header(path: str, header: bytes, codec: ChapterCodec) -> None:
+    if len(header) < _INDEX_HEADER.size:
+        raise ValueError(f"不是小说归档的索引文件：{path}")
+    magic, codec_name, dictionary_id = _INDEX_HEADER.unpack_from(header)
+    if magic != _INDEX_MAGIC:
+        raise ValueError(f"不是小说归档的索引文件：{path}")
+    codec_name = codec_name.rstrip(b'\0').decode()
+    if codec_name != codec.name or dictionary_id != codec.dictionary_id:
+        raise ValueError(f"归档的压缩方式与指定的不一致：{path} 使用 {codec_name}（字典 {dictionary_id}），"
+                         f"指定的是 {codec.name}（字典 {codec.dictionary_id}）")
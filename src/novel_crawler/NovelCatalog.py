@@ -0,0 +1,305 @@
+import heapq
+from array import array
+from datetime import date
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+from novel_crawler.NovelCrawlerFactory import NovelMetadata
+
+
+def parse_update_date(update_time: str) -> int:
+    """把'2024-01-31'或'2024-01-31 12:00'形式的更新时间转为公历序数（date.toordinal），无法解析时返回0"""
+    try:
+        return date.fromisoformat(update_time[:10]).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+class StringTable:
+    """
+    紧凑的字符串列：所有字符串UTF-8编码后首尾相接存放在一个bytearray中，另用整数数组记录每个字符串的结束位置。
+
+    相比list[str]，省去了每个字符串对象约50字节的对象头和列表中8字节的指针。
+    """
+
+    def __init__(self, values: Iterable[str] = ()):
+        self._data = bytearray()
+        self._ends = array('Q')
+        for value in values:
+            self.append(value)
+
+    def append(self, value: str) -> None:
+        self._data += value.encode('utf-8')
+        self._ends.append(len(self._data))
+
+    def __getitem__(self, index: int) -> str:
+        start = self._ends[index - 1] if index > 0 else 0
+        return self._data[start:self._ends[index]].decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __iter__(self) -> Iterator[str]:
+        start = 0
+        for end in self._ends:
+            yield self._data[start:end].decode('utf-8')
+            start = end
+
+    def take(self, indices: Iterable[int]) -> 'StringTable':
+        return StringTable(self[i] for i in indices)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data) + self._ends.itemsize * len(self._ends)
+
+
+class Categorical:
+    """
+    字典编码的分类列：每个不同的值只保存一次，每行只保存它在字典中的编号。适合标签、状态、作者等重复度高的列。
+
+    indexed为True时同时维护倒排索引，即每个值所在的行号，按值筛选时不需要扫描整列；
+    每行多占4字节，每个不同的值多一个数组对象，只适合取值很少的列，例如标签和状态。
+    """
+
+    def __init__(self, values: Iterable[str] = (), indexed: bool = False):
+        self.categories: list[str] = []
+        self._codes_by_value: dict[str, int] = {}
+        self.codes = array('I')
+        self._rows: Optional[list[array]] = [] if indexed else None
+        for value in values:
+            self.append(value)
+
+    def code_of(self, value: str) -> Optional[int]:
+        """值在字典中的编号，不存在时返回None"""
+        return self._codes_by_value.get(value)
+
+    @property
+    def indexed(self) -> bool:
+        return self._rows is not None
+
+    def rows_of(self, code: int) -> array:
+        """编号为code的所有行号，按从小到大排列，只能在indexed为True时调用"""
+        return self._rows[code]
+
+    def append(self, value: str) -> None:
+        code = self._codes_by_value.get(value)
+        if code is None:
+            code = self._codes_by_value[value] = len(self.categories)
+            self.categories.append(value)
+            if self._rows is not None:
+                self._rows.append(array('I'))
+        if self._rows is not None:
+            self._rows[code].append(len(self.codes))
+        self.codes.append(code)
+
+    def __getitem__(self, index: int) -> str:
+        return self.categories[self.codes[index]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self) -> Iterator[str]:
+        categories = self.categories
+        return (categories[code] for code in self.codes)
+
+    def take(self, indices: Iterable[int]) -> 'Categorical':
+        return Categorical((self[i] for i in indices), self.indexed)
+
+    @property
+    def nbytes(self) -> int:
+        index_bytes = sum(rows.itemsize * len(rows) for rows in self._rows) if self._rows is not None else 0
+        return (self.codes.itemsize * len(self.codes) + index_bytes
+                + sum(len(value.encode('utf-8')) for value in self.categories))
+
+
+class NovelCatalog:
+    """
+    按列保存大量NovelMetadata的紧凑容器，用于全站目录的排序、筛选和去重。
+
+    tag、status、author和update_time做字典编码；word_count、点击/推荐/收藏数和解析后的更新日期保存在整数数组中；
+    书名、简介、URL等其余字段保存在StringTable中。每本小说的内存占用只比数据本身略多，
+    远小于同样数量的NovelMetadata对象。筛选和排序直接在编码后的列上进行，不需要还原出NovelMetadata：
+    tag和status另有倒排索引，按它们筛选时只访问匹配的行；整数列按需缓存从大到小的行号顺序，
+    对所有行取前N名或排序时不需要再比较。其余条件仍是在剩下的行上逐行比较（没有numpy，标准库中
+    没有更快的做法），单独按字数等整数条件扫描全表时比在NovelMetadata列表上筛选慢。
+
+    行号从0开始，筛选方法返回行号数组，可以继续传给其他筛选、排序方法或take、rows。
+    """
+
+    _string_columns = ('id', 'title', 'description', 'cover_url', 'catalog_url')
+    _categorical_columns = ('author', 'tag', 'status', 'update_time')
+    _indexed_columns = ('tag', 'status')     # 取值很少、常用于筛选的分类列，维护倒排索引
+    _integer_columns = ('word_count', 'clicks', 'recommends', 'favorites')
+    sortable_columns = _integer_columns + ('update_date',)
+
+    def __init__(self, rows: Iterable[NovelMetadata] = ()):
+        for name in self._string_columns:
+            setattr(self, name, StringTable())
+        for name in self._categorical_columns:
+            setattr(self, name, Categorical(indexed=name in self._indexed_columns))
+        for name in self._integer_columns:
+            setattr(self, name, array('q'))
+        self.update_date = array('i')       # 更新时间的公历序数，无法解析时为0
+        self._orders: dict[str, array] = {}     # 整数列从大到小的行号顺序，值相同时行号小的在前，追加行时清空
+        self.extend(rows)
+
+    def append(self, novel: NovelMetadata) -> None:
+        for name in self._string_columns + self._categorical_columns + self._integer_columns:
+            getattr(self, name).append(getattr(novel, name))
+        self.update_date.append(parse_update_date(novel.update_time))
+        self._orders.clear()
+
+    def extend(self, rows: Iterable[NovelMetadata]) -> None:
+        for novel in rows:
+            self.append(novel)
+
+    def __len__(self) -> int:
+        return len(self.word_count)
+
+    def row(self, index: int) -> NovelMetadata:
+        """还原第index行的NovelMetadata"""
+        return NovelMetadata(
+            id=self.id[index],
+            title=self.title[index],
+            author=self.author[index],
+            tag=self.tag[index],
+            status=self.status[index],
+            word_count=self.word_count[index],
+            update_time=self.update_time[index],
+            description=self.description[index],
+            cover_url=self.cover_url[index],
+            catalog_url=self.catalog_url[index],
+            clicks=self.clicks[index],
+            recommends=self.recommends[index],
+            favorites=self.favorites[index]
+        )
+
+    def rows(self, indices: Iterable[int] = None) -> Iterator[NovelMetadata]:
+        """按行号依次还原NovelMetadata，indices为None时遍历所有行"""
+        for index in range(len(self)) if indices is None else indices:
+            yield self.row(index)
+
+    def take(self, indices: Sequence[int]) -> 'NovelCatalog':
+        """按行号取出子集，组成新的NovelCatalog"""
+        catalog = NovelCatalog()
+        for name in self._string_columns + self._categorical_columns:
+            setattr(catalog, name, getattr(self, name).take(indices))
+        for name in self._integer_columns + ('update_date',):
+            column = getattr(self, name)
+            setattr(catalog, name, array(column.typecode, (column[i] for i in indices)))
+        return catalog
+
+    def filter(
+            self,
+            tag: str = None,
+            status: str = None,
+            author: str = None,
+            min_word_count: int = None,
+            max_word_count: int = None,
+            updated_since: str = None,
+            predicate: Callable[[int], bool] = None,
+            indices: Iterable[int] = None
+    ) -> array:
+        """
+        返回满足所有条件的行号。
+
+        没有指定indices时，从tag、status中匹配行数最少的倒排索引开始，其余条件依次在剩下的行上逐行比较；
+        分类条件只比较字典编号。
+
+        参数:
+            tag (str): 只保留此分类
+            status (str): 只保留此状态，例如"完结"
+            author (str): 只保留此作者
+            min_word_count (int): 字数下限（含）
+            max_word_count (int): 字数上限（含）
+            updated_since (str): 只保留在此日期（含）之后更新的，例如"2024-01-01"
+            predicate : 额外的条件，参数为行号
+            indices : 只在这些行中筛选，为None时筛选所有行
+
+        返回:
+            array: 满足条件的行号，按行号从小到大排列
+        """
+        conditions = []
+        for name, value in (('tag', tag), ('status', status), ('author', author)):
+            if value is None:
+                continue
+            # 分类列只需要比较整数编号，值不在字典中时不可能有任何一行满足条件
+            column = getattr(self, name)
+            code = column.code_of(value)
+            if code is None:
+                return array('I')
+            conditions.append((column, code))
+
+        selected = range(len(self)) if indices is None else indices
+        if indices is None:
+            indexed = [condition for condition in conditions if condition[0].indexed]
+            if indexed:
+                start = min(indexed, key=lambda condition: len(condition[0].rows_of(condition[1])))
+                conditions.remove(start)
+                selected = start[0].rows_of(start[1])
+        for column, code in conditions:
+            codes = column.codes
+            selected = [i for i in selected if codes[i] == code]
+        if min_word_count is not None:
+            word_count = self.word_count
+            selected = [i for i in selected if word_count[i] >= min_word_count]
+        if max_word_count is not None:
+            word_count = self.word_count
+            selected = [i for i in selected if word_count[i] <= max_word_count]
+        if updated_since is not None:
+            since = parse_update_date(updated_since)
+            update_date = self.update_date
+            selected = [i for i in selected if update_date[i] >= since]
+        if predicate is not None:
+            selected = [i for i in selected if predicate(i)]
+        return array('I', selected)
+
+    def argsort(self, column: str, reverse: bool = True, indices: Iterable[int] = None) -> array:
+        """
+        按整数列排序后的行号，值相同的行按行号从小到大排列。
+
+        参数:
+            column (str): 'word_count'、'clicks'、'recommends'、'favorites'或'update_date'
+            reverse (bool): 是否从大到小排列，默认从大到小
+            indices : 只排序这些行，为None时排序所有行
+        """
+        if indices is None and reverse:
+            return array('I', self._order(column))
+        values = self._sort_column(column)
+        selected = range(len(self)) if indices is None else indices
+        return array('I', sorted(selected, key=values.__getitem__, reverse=reverse))
+
+    def top_n(self, column: str, n: int, indices: Iterable[int] = None) -> array:
+        """
+        按整数列从大到小取前n行的行号。
+
+        对所有行取前n名时直接截取缓存的行号顺序（第一次调用时排序一次）；
+        指定了indices时，例如筛选的结果，只在这些行上维护大小为n的堆，不对所有行排序。
+        """
+        if indices is None:
+            return self._order(column)[:max(n, 0)]
+        values = self._sort_column(column)
+        return array('I', heapq.nlargest(n, indices, key=values.__getitem__))
+
+    def _order(self, column: str) -> array:
+        """整数列从大到小的行号顺序，值相同时行号小的在前"""
+        order = self._orders.get(column)
+        if order is None:
+            values = self._sort_column(column)
+            order = self._orders[column] = array('I', sorted(range(len(self)), key=values.__getitem__, reverse=True))
+        return order
+
+    def _sort_column(self, column: str) -> array:
+        if column not in self.sortable_columns:
+            raise ValueError(f"不支持的排序字段：{column}")
+        return getattr(self, column)
+
+    @property
+    def nbytes(self) -> int:
+        """各列数据占用的字节数（不含Python对象本身的固定开销）"""
+        total = 0
+        for name in self._string_columns + self._categorical_columns:
+            total += getattr(self, name).nbytes
+        for name in self._integer_columns + ('update_date',):
+            column = getattr(self, name)
+            total += column.itemsize * len(column)
+        return total
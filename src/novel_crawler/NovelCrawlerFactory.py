@@ -1,13 +1,24 @@
 import asyncio
+import sys
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
-from typing import Any, Union
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Generic, Hashable, Iterable, Optional, TypeVar, Union
 import aiohttp
 
+from novel_crawler.ChapterPipeline import ChapterSource
+from novel_crawler.CrawlerSession import ConnectionOptions, ConnectionStats, create_session
+from novel_crawler.RequestCoalescer import RequestCoalescer, normalize_url
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class NovelMetadata:
+    """
+    小说的元数据。
+
+    不可变且使用__slots__，全站几十万本小说同时驻留内存时占用更小；取值有限的tag和status会被驻留(intern)，
+    相同的值共享同一个字符串对象。需要更紧凑的表示时可以放进NovelCatalog按列保存。
+    """
     id: str             # 小说ID，根据这个id可以进入这本小说的详情网站
     title: str          # 小说名
     author: str         # 作者
@@ -18,6 +29,45 @@ class NovelMetadata:
     description: str    # 简介
     cover_url: str      # 封面图片URL
     catalog_url: str    # 小说目录URL
+    clicks: int = 0         # 点击数
+    recommends: int = 0     # 推荐数
+    favorites: int = 0      # 收藏数
+
+    def __post_init__(self):
+        object.__setattr__(self, 'tag', sys.intern(self.tag))
+        object.__setattr__(self, 'status', sys.intern(self.status))
+
+
+T = TypeVar('T')
+
+
+class CrawlStatus(Enum):
+    SUCCESS = 'success'                         # 成功
+    TRANSIENT_FAILURE = 'transient_failure'     # 暂时性失败（超时、限流、熔断等），稍后重试可能成功
+    PERMANENT_FAILURE = 'permanent_failure'     # 永久性失败（页面不存在、页面结构不符合预期等）
+
+
+@dataclass
+class CrawlResult(Generic[T]):
+    """
+    爬取结果，明确区分成功、暂时性失败和永久性失败，调用方可以据此只重试失败的部分。
+    """
+    status: CrawlStatus
+    value: Optional[T] = None   # 成功时的结果
+    error: str = ""             # 失败原因
+    url: str = ""               # 请求的URL
+
+    @property
+    def ok(self) -> bool:
+        return self.status == CrawlStatus.SUCCESS
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == CrawlStatus.TRANSIENT_FAILURE
+
+    @classmethod
+    def success(cls, value: T, url: str = "") -> 'CrawlResult[T]':
+        return cls(CrawlStatus.SUCCESS, value, url=url)
 
 
 class SortStrategy(ABC):
@@ -25,11 +75,98 @@ class SortStrategy(ABC):
     async def sort(self, novels: list[NovelMetadata]) -> list[NovelMetadata]:
         pass
 
+    async def select_top_n(
+            self,
+            candidates: AsyncIterable[tuple[T, dict]],
+            top_n: int,
+            fetch_metadata: Callable[[T], Awaitable[Optional[NovelMetadata]]]
+    ) -> list[tuple[T, NovelMetadata]]:
+        """
+        从候选小说流中选出排序后的前top_n本。
+
+        默认实现获取所有候选的元数据后调用sort，按键排序的策略会覆盖为按需获取元数据的堆选择。
+
+        参数:
+            candidates : 候选小说流，(列表页中的小说信息, 列表页中能直接拿到的字段)
+            top_n (int): 需要的小说数量
+            fetch_metadata : 获取候选小说元数据的函数，失败时返回None
+
+        返回:
+            list[tuple[T, NovelMetadata]]: 排序后的前top_n本，(列表页中的小说信息, 元数据)
+        """
+        items = [item async for item, _ in candidates]
+        metadata_list = await asyncio.gather(*(fetch_metadata(item) for item in items))
+        by_id = {id(metadata): item for item, metadata in zip(items, metadata_list) if metadata is not None}
+        ranked = await self.sort([metadata for metadata in metadata_list if metadata is not None])
+        return [(by_id[id(metadata)], metadata) for metadata in ranked[:top_n]]
+
 
 class BaseNovelCrawler(ABC):
     """
     小说爬虫的基类。
+
+    爬虫可以作为异步上下文管理器使用，期间所有没有显式传入session的调用共享爬虫自己的会话和连接池：
+
+        async with NovelCrawlerFactory.create_novel_crawler("ujxsw") as crawler:
+            metadata = await crawler.get_novel_metadata_async(url)
     """
+    headers: dict = {}      # 会话默认请求头
+    metadata_many_window = 64   # 批量获取元数据时最多同时在途的请求数
+
+    def __init__(self, connection_options: ConnectionOptions = None):
+        """
+        参数:
+            connection_options (ConnectionOptions): 爬虫自有会话的连接池配置，为None时使用默认配置
+        """
+        self.connection_options = connection_options if connection_options is not None else ConnectionOptions()
+        self.connection_stats = ConnectionStats()
+        self.coalescer = RequestCoalescer()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> Optional[aiohttp.ClientSession]:
+        """爬虫自有的会话，没有打开时为None"""
+        if self._session is None or self._session.closed:
+            return None
+        return self._session
+
+    def _trace_configs(self) -> list[aiohttp.TraceConfig]:
+        """创建自有会话时附加的TraceConfig，子类可以扩展"""
+        return []
+
+    async def open(self) -> None:
+        """打开爬虫自有的会话，重复调用不会创建新的会话"""
+        if self.session is None:
+            self._session = create_session(self.headers, self.connection_options, self.connection_stats,
+                                           self._trace_configs())
+
+    async def close(self) -> None:
+        """关闭爬虫自有的会话并释放连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def normalize_url(self, url: str) -> str:
+        """规范化URL，规范化后相同的URL视为同一个页面，子类可以加入站点特有的规则"""
+        return normalize_url(url)
+
+    async def _coalesce(
+            self,
+            kind: Hashable,
+            url: str,
+            crawl: Callable[[], Awaitable['CrawlResult[T]']]
+    ) -> 'CrawlResult[T]':
+        """合并对同一页面的并发请求，kind区分同一URL的不同解析方式，返回结果的url为调用方传入的url"""
+        result = await self.coalescer.run((kind, self.normalize_url(url)), crawl)
+        return result if result.url == url else replace(result, url=url)
+
     @abstractmethod
     async def get_novel_metadata_async(
             self,
@@ -89,6 +226,130 @@ class BaseNovelCrawler(ABC):
         """
         pass
 
+    async def get_novel_metadata_result_async(
+            self,
+            url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> CrawlResult[NovelMetadata]:
+        """
+        与get_novel_metadata_async相同，但返回能区分成功和失败类型的CrawlResult。
+
+        默认实现基于get_novel_metadata_async，无法区分失败类型，一律视为暂时性失败，子类应当覆盖。
+        对同一页面的并发调用会合并为一次请求。
+        """
+        async def crawl():
+            metadata = await self.get_novel_metadata_async(url, session, semaphore)
+            if not metadata.catalog_url:
+                return CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error='获取小说具体信息失败', url=url)
+            return CrawlResult.success(metadata, url)
+
+        return await self._coalesce('metadata', url, crawl)
+
+    async def get_novel_chapters_list_result_async(
+            self,
+            url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> CrawlResult[list[tuple[str, str]]]:
+        """
+        与get_novel_chapters_list_async相同，但返回能区分成功和失败类型的CrawlResult。
+
+        默认实现基于get_novel_chapters_list_async，无法区分失败类型，一律视为暂时性失败，子类应当覆盖。
+        对同一页面的并发调用会合并为一次请求。
+        """
+        async def crawl():
+            chapters_list = await self.get_novel_chapters_list_async(url, session, semaphore)
+            if not chapters_list:
+                return CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error='获取小说章节列表失败', url=url)
+            return CrawlResult.success(chapters_list, url)
+
+        return await self._coalesce('catalog', url, crawl)
+
+    async def get_novel_chapter_content_result_async(
+            self,
+            chapter_url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> CrawlResult[str]:
+        """
+        与get_novel_chapter_content_async相同，但返回能区分成功和失败类型的CrawlResult。
+
+        默认实现基于get_novel_chapter_content_async，无法区分失败类型，一律视为暂时性失败，子类应当覆盖。
+        对同一页面的并发调用会合并为一次请求。
+        """
+        async def crawl():
+            content = await self.get_novel_chapter_content_async(chapter_url, session, semaphore)
+            if not content:
+                return CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error='获取小说章节内容失败', url=chapter_url)
+            return CrawlResult.success(content, chapter_url)
+
+        return await self._coalesce('chapter', chapter_url, crawl)
+
+    async def get_novel_metadata_many(
+            self,
+            urls: Iterable[str],
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None,
+            window: int = None
+    ) -> AsyncIterator[CrawlResult[NovelMetadata]]:
+        """
+        批量获取小说元数据，按完成顺序逐个产出结果。
+
+        URL规范化后去重，每个页面只请求一次，也会和其他调用中对同一页面的在途请求合并。
+        单个URL失败不影响其他URL，失败的结果同样会产出，可以据此只重试retryable的部分。
+
+        参数:
+            urls : 小说详情页URL，例如从标签、作者、关键词列表中收集的URL，可以有重复
+            session : 异步HTTP会话对象，用于管理共享连接池和Cookie等
+            semaphore : 信号量semaphore控制并发
+            window (int): 最多同时在途的请求数，默认为metadata_many_window
+
+        返回:
+            AsyncIterator[CrawlResult[NovelMetadata]]: 每个不同的页面产出一个结果，url为该页面第一次出现时的URL
+        """
+        window = window or self.metadata_many_window
+        seen = set()
+
+        def unique_urls():
+            for url in urls:
+                key = self.normalize_url(url)
+                if key not in seen:
+                    seen.add(key)
+                    yield url
+
+        async def fetch(url):
+            try:
+                return await self.get_novel_metadata_result_async(url, session, semaphore)
+            except Exception as e:
+                return CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error=f'{type(e).__name__}: {e}', url=url)
+
+        should_close_session = session is None and self.session is None
+        if should_close_session:
+            # 没有可用的会话时创建一个临时会话，避免每个请求各自创建会话
+            session = create_session(self.headers, self.connection_options, self.connection_stats,
+                                     self._trace_configs())
+        pending = set()
+        try:
+            pending_urls = unique_urls()
+            for url in pending_urls:
+                pending.add(asyncio.ensure_future(fetch(url)))
+                if len(pending) >= window:
+                    break
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = next(pending_urls, None)
+                    if url is not None:
+                        pending.add(asyncio.ensure_future(fetch(url)))
+                    yield task.result()
+        finally:
+            # 消费方提前退出或出现异常时，取消剩余的在途任务
+            for task in pending:
+                task.cancel()
+            if should_close_session:
+                await session.close()
+
     @abstractmethod
     async def get_novel_list_by_tag_async(
             self,
@@ -113,6 +374,33 @@ class BaseNovelCrawler(ABC):
         """
         pass
 
+    async def iter_novel_list_by_tag_async(
+            self,
+            tag: str,
+            top_n: int = None,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None,
+            prefetch: int = None
+    ) -> AsyncIterator[tuple[str, str, str]]:
+        """
+        按站点的列表顺序逐页产出具有此标签的小说，拿够top_n本后不再请求后续分页。
+
+        默认实现基于get_novel_list_by_tag_async一次性获取，子类应当覆盖为真正的分页实现。
+
+        参数:
+            tag (str): 小说的分类，例如"xuanhuan"、"dushi"、"yanqing"。
+            top_n (int): 最多产出多少本小说，为None时遍历所有分页
+            session : 异步HTTP会话对象，用于管理共享连接池和Cookie等
+            semaphore : 信号量semaphore控制并发
+            prefetch (int): 最多提前预取的分页数
+
+        返回:
+            AsyncIterator[tuple[str, str, str]]: 依次产出(书名, 作者, 详情页URL链接)
+        """
+        novels = await self.get_novel_list_by_tag_async(tag, top_n or 0, None, session, semaphore)
+        for novel in novels[:top_n] if top_n else novels:
+            yield novel
+
     @abstractmethod
     async def get_novel_list_by_author_async(
             self,
@@ -183,7 +471,9 @@ class BaseNovelCrawler(ABC):
             url: str,
             file_path: str,
             session: aiohttp.ClientSession = None,
-            semaphore: asyncio.Semaphore = None
+            semaphore: asyncio.Semaphore = None,
+            chapter_source: ChapterSource = None,
+            metadata: NovelMetadata = None
     ):
         """
         将具体的某一本小说保存到指定的文件夹路径下
@@ -193,7 +483,11 @@ class BaseNovelCrawler(ABC):
             file_path (str): 小说需要保存到哪个文件夹下面
             session : 异步HTTP会话对象，用于管理共享连接池和Cookie等
             semaphore : 信号量semaphore控制并发
+            chapter_source (ChapterSource): 章节内容的来源，例如MirrorChapterSource；为None时从本站获取
+            metadata (NovelMetadata): 刚刚获取到的小说详情，传入时不再重复请求详情页
 
+        返回:
+            CrawlResult[str]: 成功时为小说文件的路径；失败时说明失败的章节和失败类型
         """
 
 
@@ -215,12 +509,18 @@ class NovelCrawlerFactory:
         cls._all_sites[site_name] = crawler
 
     @classmethod
-    def create_novel_crawler(cls, site_name: str) -> BaseNovelCrawler:
+    def registered_sites(cls) -> list[str]:
+        """已经注册了爬虫的站点名称，按注册顺序"""
+        return list(cls._all_sites)
+
+    @classmethod
+    def create_novel_crawler(cls, site_name: str, **kwargs) -> BaseNovelCrawler:
         """
         为给定站点名称创建小说爬虫。
 
         参数:
             site_name (str): 站点的名称。
+            kwargs : 传给爬虫构造函数的选项，例如响应缓存cache。
 
         返回:
             BaseNovelCrawler: 给定站点的小说爬虫。
@@ -228,4 +528,4 @@ class NovelCrawlerFactory:
         crawler = cls._all_sites.get(site_name)
         if crawler is None:
             raise ValueError(f"未找到站点 '{site_name}' 的爬虫")
-        return crawler()
+        return crawler(**kwargs)
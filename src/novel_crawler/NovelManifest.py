@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field, asdict
+
+import aiofiles
+
+
+@dataclass
+class ChapterRecord:
+    url: str            # 章节内容URL
+    title: str          # 章节标题
+    offset: int         # 章节在小说文件中的起始字节偏移
+    length: int         # 章节写入的字节数
+    sha1: str           # 章节写入内容的sha1摘要
+
+
+@dataclass
+class NovelManifest:
+    """
+    小说文件旁边的清单文件（sidecar manifest），记录已经写入文件的章节。
+
+    章节按目录顺序追加写入，因此chapters始终是目录的一个前缀。重新运行时只需要获取清单中缺失或新增的章节，
+    文件末尾没有被清单记录的残留内容会被截断，避免重复写入。
+    """
+    url: str = ""                   # 小说详情页URL
+    update_time: str = ""           # 上次完整下载时NovelMetadata中的更新时间
+    word_count: int = 0             # 上次完整下载时的字数，更新时间只精确到天，同一天内的更新靠字数识别
+    complete: bool = False          # 上次运行是否完整写入了目录中的所有章节
+    chapters: list[ChapterRecord] = field(default_factory=list)
+
+    @staticmethod
+    def path_for(novel_file_path: str) -> str:
+        """小说文件对应的清单文件路径"""
+        return novel_file_path + '.manifest.json'
+
+    @property
+    def end_offset(self) -> int:
+        """已记录章节在文件中的结束偏移"""
+        if not self.chapters:
+            return 0
+        last = self.chapters[-1]
+        return last.offset + last.length
+
+    @classmethod
+    async def load(cls, path: str) -> 'NovelManifest':
+        """读取清单文件，文件不存在或已损坏时返回空清单"""
+        try:
+            async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+                data = json.loads(await f.read())
+            chapters = [ChapterRecord(**chapter) for chapter in data.pop('chapters', [])]
+            return cls(chapters=chapters, **data)
+        except FileNotFoundError:
+            return cls()
+        except (ValueError, TypeError) as e:
+            print(f"清单文件已损坏，将重新下载：{path} {e}")
+            return cls()
+
+    async def save(self, path: str) -> None:
+        """原子地保存清单文件：先写临时文件，再替换"""
+        tmp_path = path + '.tmp'
+        async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(asdict(self), ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    def append(self, url: str, title: str, data: bytes) -> None:
+        """记录一个刚写入文件末尾的章节"""
+        self.chapters.append(ChapterRecord(
+            url=url,
+            title=title,
+            offset=self.end_offset,
+            length=len(data),
+            sha1=hashlib.sha1(data).hexdigest()
+        ))
+
+    def truncate(self, count: int) -> None:
+        """只保留前count个章节记录"""
+        del self.chapters[count:]
+
+    def reconcile(self, chapters_list: list[tuple[str, str]]) -> None:
+        """
+        与最新的章节目录对齐，只保留与目录前缀一致的章节记录。
+
+        参数:
+            chapters_list (list[tuple[str, str]]): 最新的章节目录，(章节标题, 章节内容URL链接)
+        """
+        kept = 0
+        for record, (_, chapter_url) in zip(self.chapters, chapters_list):
+            if record.url != chapter_url:
+                break
+            kept += 1
+        del self.chapters[kept:]
+
+    async def verify(self, novel_file_path: str) -> None:
+        """按记录的偏移和摘要校验文件内容，从第一个不一致的章节开始丢弃记录"""
+        try:
+            async with aiofiles.open(novel_file_path, 'rb') as f:
+                for i, record in enumerate(self.chapters):
+                    await f.seek(record.offset)
+                    data = await f.read(record.length)
+                    if len(data) != record.length or hashlib.sha1(data).hexdigest() != record.sha1:
+                        del self.chapters[i:]
+                        return
+        except FileNotFoundError:
+            self.chapters.clear()
@@ -0,0 +1,25 @@
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def is_free_threaded() -> bool:
+    """当前解释器是否是关闭了GIL的自由线程版本（Python 3.13t及以上）"""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def create_parse_executor(max_workers: int = None) -> Executor:
+    """
+    创建用于解析页面的执行器。
+
+    普通CPython有GIL，解析只能在多进程中并行，返回ProcessPoolExecutor；
+    自由线程版本下线程就可以并行执行解析，返回开销更小的ThreadPoolExecutor。
+
+    参数:
+        max_workers (int): 工作进程/线程数，默认为CPU核数
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if is_free_threaded():
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='novel-parser')
+    return ProcessPoolExecutor(max_workers=max_workers)
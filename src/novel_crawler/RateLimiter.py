@@ -0,0 +1,306 @@
+import asyncio
+import multiprocessing
+import multiprocessing.context
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+# 表示站点过载或限流的HTTP状态码
+OVERLOAD_STATUSES = {429, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    令牌桶，限制每秒请求数。
+
+    令牌以rate个/秒的速度补充，最多积攒burst个；等待令牌的协程按先来先得的顺序获得令牌。
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """
+        参数:
+            rate (float): 每秒补充的令牌数，即长期平均的每秒请求数上限
+            burst (float): 令牌桶容量，即允许的突发请求数，默认等于rate
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """取走一个令牌，令牌不足时等待"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class SharedTokenBucket:
+    """
+    跨进程共享的令牌桶，用于多个工作进程共同遵守一个全局请求预算。
+
+    令牌数和更新时间保存在共享内存中，由进程间锁保护。acquire采用预约的方式：持锁时直接扣除令牌
+    （允许扣成负数），再在锁外等待到令牌补足的时刻，锁只在极短的计算期间持有，不会阻塞事件循环。
+    需要在启动工作进程之前创建，并作为进程参数传给工作进程。
+    """
+
+    def __init__(self, rate: float, burst: float = None, context: multiprocessing.context.BaseContext = None):
+        """
+        参数:
+            rate (float): 所有进程合计的每秒请求数上限
+            burst (float): 令牌桶容量，默认等于rate
+            context : 创建共享内存和锁的multiprocessing上下文，需要和启动工作进程的上下文一致
+        """
+        context = context or multiprocessing.get_context()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._state = context.RawArray('d', [self.burst, time.monotonic()])   # [令牌数, 更新时间]
+        self._lock = context.Lock()
+
+    def _reserve(self) -> float:
+        """扣除一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.burst, self._state[0] + (now - self._state[1]) * self.rate) - 1
+            self._state[0] = tokens
+            self._state[1] = now
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+    async def acquire(self) -> None:
+        """取走一个令牌，令牌不足时等待"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            return min(self.burst, self._state[0] + (time.monotonic() - self._state[1]) * self.rate)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD（加性增、乘性减）自适应并发上限。
+
+    响应正常时每个成功请求把上限增加1/limit，相当于每一轮并发增加1；遇到429/503、超时，
+    或者平均延迟明显高于空载延迟时，把上限乘以backoff。同一个冷却时间内最多减小一次，
+    避免同一波请求的多个失败把上限连续压到底。
+    """
+
+    def __init__(
+            self,
+            initial: int = 10,
+            min_limit: int = 1,
+            max_limit: int = 64,
+            backoff: float = 0.7,
+            latency_tolerance: float = 2.5,
+            cooldown: float = None
+    ):
+        """
+        参数:
+            initial (int): 初始并发上限
+            min_limit (int): 并发上限的下限
+            max_limit (int): 并发上限的上限
+            backoff (float): 过载时并发上限的缩小比例
+            latency_tolerance (float): 平均延迟超过空载延迟的多少倍时视为拥塞
+            cooldown (float): 两次缩小并发上限之间的最短间隔（秒），默认为当前的平均请求延迟，即每一轮请求最多缩小一次
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None       # 最近请求延迟的指数移动平均
+        self.baseline_latency: Optional[float] = None   # 空载延迟估计，跟踪最小延迟并缓慢上浮
+        self.successes = 0
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        """占用一个并发名额，已达上限时排队等待"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已经分配给了这个协程，但它被取消了，需要把名额让给下一个
+                self.in_flight -= 1
+                self._wake_up()
+            elif waiter in self._waiters:
+                # 取消后、处理取消之前，_wake_up可能已经把这个waiter跳过并移出了队列
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, overloaded: bool = False, latency: float = None) -> None:
+        """
+        归还并发名额，并根据请求结果调整并发上限。
+
+        参数:
+            overloaded (bool): 请求是否遇到了限流、过载或超时
+            latency (float): 成功请求的耗时（秒），为None时不调整上限（例如普通的请求错误）
+        """
+        self.in_flight -= 1
+        if overloaded:
+            self.overloads += 1
+            self._decrease()
+        elif latency is not None:
+            self.successes += 1
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            self.baseline_latency = latency if self.baseline_latency is None else min(
+                latency, self.baseline_latency * 1.001)
+            if self.latency_ewma > self.baseline_latency * self.latency_tolerance:
+                self._decrease()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self._wake_up()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        cooldown = self.cooldown if self.cooldown is not None else (self.latency_ewma or 0.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+
+    def _wake_up(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class RequestSlot:
+    """一次请求占用的限流名额，请求方通过record_status报告响应状态码"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+
+    def record_status(self, status: int) -> None:
+        self.status = status
+
+
+class HostRateLimiter:
+    """单个站点（host）的限流器：令牌桶限制请求速率，AIMD自适应限制并发数"""
+
+    def __init__(self, host: str, rate: float, burst: float = None, shared_bucket: SharedTokenBucket = None,
+                 **concurrency_options):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.shared_bucket = shared_bucket
+        self.concurrency = AdaptiveConcurrencyLimit(**concurrency_options)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[RequestSlot]:
+        """
+        占用一个请求名额，退出时根据响应状态码、异常和耗时调整并发上限。
+
+        用法:
+            async with limiter.slot() as slot:
+                async with session.get(url) as response:
+                    slot.record_status(response.status)
+        """
+        await self.concurrency.acquire()
+        request_slot = RequestSlot()
+        try:
+            await self.bucket.acquire()
+            if self.shared_bucket is not None:
+                await self.shared_bucket.acquire()
+            start = time.monotonic()
+            yield request_slot
+        except asyncio.TimeoutError:
+            self.concurrency.release(overloaded=True)
+            raise
+        except BaseException:
+            if request_slot.status in OVERLOAD_STATUSES:
+                self.concurrency.release(overloaded=True)
+            else:
+                self.concurrency.release()
+            raise
+        else:
+            if request_slot.status in OVERLOAD_STATUSES:
+                self.concurrency.release(overloaded=True)
+            elif request_slot.status is not None and request_slot.status < 400:
+                self.concurrency.release(latency=time.monotonic() - start)
+            else:
+                self.concurrency.release()
+
+    def snapshot(self) -> dict:
+        """当前限流状态，用于监控"""
+        concurrency = self.concurrency
+        return {
+            'rate': self.bucket.rate,
+            'burst': self.bucket.burst,
+            'tokens': round(self.bucket.tokens, 3),
+            'concurrency_limit': int(concurrency.limit),
+            'in_flight': concurrency.in_flight,
+            'waiting': len(concurrency._waiters),
+            'latency_ewma': concurrency.latency_ewma,
+            'baseline_latency': concurrency.baseline_latency,
+            'successes': concurrency.successes,
+            'overloads': concurrency.overloads,
+        }
+
+
+class RateLimiter:
+    """
+    按站点分别限流的限流器集合。
+
+    同一个RateLimiter可以被多个爬虫实例共享，所有请求同一站点的方法和并发调用都受同一组限制。
+    """
+
+    def __init__(
+            self,
+            rate: float = 20.0,
+            burst: float = None,
+            host_rates: dict[str, float] = None,
+            shared_bucket: SharedTokenBucket = None,
+            **concurrency_options
+    ):
+        """
+        参数:
+            rate (float): 每个站点默认的每秒请求数上限
+            burst (float): 令牌桶容量，默认等于rate
+            host_rates (dict): 为个别站点单独指定每秒请求数上限，{host: rate}
+            shared_bucket (SharedTokenBucket): 所有站点的请求都要额外经过的共享令牌桶，例如多进程共同遵守的全局请求预算
+            concurrency_options : 传给AdaptiveConcurrencyLimit的参数，例如initial、max_limit
+        """
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = host_rates or {}
+        self.shared_bucket = shared_bucket
+        self.concurrency_options = concurrency_options
+        self._hosts: dict[str, HostRateLimiter] = {}
+
+    def for_host(self, host: str) -> HostRateLimiter:
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = HostRateLimiter(host, self.host_rates.get(host, self.rate), self.burst, self.shared_bucket,
+                                      **self.concurrency_options)
+            self._hosts[host] = limiter
+        return limiter
+
+    def snapshot(self) -> dict[str, dict]:
+        """所有站点当前的限流状态，{host: 状态}"""
+        return {host: limiter.snapshot() for host, limiter in self._hosts.items()}
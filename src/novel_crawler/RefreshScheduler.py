@@ -0,0 +1,436 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+from novel_crawler.NovelCrawlerFactory import BaseNovelCrawler, CrawlResult, NovelCrawlerFactory, NovelMetadata
+from novel_crawler.NovelManifest import NovelManifest
+from novel_crawler.RateLimiter import TokenBucket
+from novel_crawler.RequestCoalescer import normalize_url
+
+# 保留的最近几次不同的更新时间，用于在还没有观测到章节间隔时估计更新频率
+HISTORY_SIZE = 16
+
+
+@dataclass
+class TrackedNovel:
+    """被跟踪更新的一本小说，以及从历次检查中学到的更新规律"""
+    url: str                                # 小说详情页URL（规范化后）
+    site: str                               # 站点名称
+    file_path: str                          # 小说保存的文件夹，与write_novel_content_to_file相同
+    next_check: float = 0.0                 # 下次检查的时刻（time.time）
+    interval: Optional[float] = None        # 当前的检查间隔（秒），还没有检查过时为None
+    update_time: str = ""                   # 上次检查时NovelMetadata中的更新时间
+    word_count: int = 0                     # 上次检查时的字数
+    status: str = ""                        # 上次检查时的状态，"完结"或"连载"
+    chapters: int = 0                       # 已经写入文件的章节数
+    chapter_gap: Optional[float] = None     # 平均每章的更新间隔（秒）的指数移动平均，还没有样本时为None
+    last_checked_at: Optional[float] = None
+    last_changed_at: Optional[float] = None     # 最近一次检查到更新的时刻
+    failures: int = 0                       # 连续失败的检查次数
+    checks: int = 0
+    changes: int = 0
+    update_history: list[str] = field(default_factory=list)     # 最近几次不同的更新时间，从旧到新
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.url).hostname or ''
+
+    def has_changed(self, metadata: NovelMetadata) -> bool:
+        """详情页与上次检查时相比是否有变化，第一次检查总是视为有变化"""
+        return (self.checks == 0 or metadata.update_time != self.update_time
+                or metadata.word_count != self.word_count or metadata.status != self.status)
+
+    def record(self, metadata: NovelMetadata, changed: bool, new_chapters: int, now: float, smoothing: float) -> None:
+        """
+        记录一次成功的检查。
+
+        参数:
+            metadata (NovelMetadata): 本次检查获取的小说详情
+            changed (bool): 详情页是否有变化
+            new_chapters (int): 本次新写入的章节数
+            now (float): 检查的时刻
+            smoothing (float): 章节间隔指数移动平均的平滑系数，越大越看重最近的样本
+        """
+        if changed and self.checks:
+            if self.last_changed_at is not None and new_chapters > 0:
+                # 上次检查到更新以来新增了new_chapters章，平均每章的间隔就是一个样本
+                sample = (now - self.last_changed_at) / new_chapters
+                self.chapter_gap = sample if self.chapter_gap is None else (
+                        (1 - smoothing) * self.chapter_gap + smoothing * sample)
+            self.last_changed_at = now
+            self.changes += 1
+        elif changed:
+            # 第一次检查只建立基线，下载的是整本书，不能作为更新间隔的样本
+            self.last_changed_at = now
+        if metadata.update_time and (not self.update_history or self.update_history[-1] != metadata.update_time):
+            self.update_history = (self.update_history + [metadata.update_time])[-HISTORY_SIZE:]
+        self.update_time = metadata.update_time
+        self.word_count = metadata.word_count
+        self.status = metadata.status
+        self.last_checked_at = now
+        self.checks += 1
+        self.failures = 0
+
+
+@dataclass
+class RefreshPolicy:
+    """
+    检查间隔的策略。
+
+    每次检查到更新后，间隔取平均每章更新间隔的chapters_per_check倍，即预计每次检查能看到这么多新章节；
+    还没有观测到章节间隔时，用历次更新时间之间的间隔的中位数估计，只有一个更新时间时按距离上次更新的时长估计。
+    没有变化时间隔乘以idle_backoff，断更的小说逐渐降低检查频率；完结的小说使用completed_interval。
+    """
+    min_interval: float = 15 * 60.0
+    max_interval: float = 7 * 86400.0
+    initial_interval: float = 3600.0        # 没有任何依据时的间隔
+    completed_interval: float = 30 * 86400.0    # 完结的小说很少再更新，偶尔检查一次是否改回连载
+    idle_backoff: float = 1.5
+    chapters_per_check: float = 1.0
+    smoothing: float = 0.3
+    staleness_factor: float = 0.25          # 只有一个更新时间时，间隔取距离上次更新时长的这个比例
+    failure_delay: float = 60.0             # 检查失败后重试的基础间隔，连续失败时加倍
+    jitter: float = 0.1                     # 间隔上下随机浮动的比例，避免大量小说在同一时刻到期
+
+    def next_interval(self, novel: TrackedNovel, changed: bool, now: float) -> float:
+        """一次成功的检查之后，下次检查的间隔（不含随机浮动）"""
+        if novel.status == '完结':
+            return self.completed_interval
+        if novel.chapter_gap is not None:
+            expected = novel.chapter_gap * self.chapters_per_check
+        else:
+            expected = self.prior_interval(novel, now)
+        if not changed and novel.interval is not None:
+            expected = max(expected, novel.interval * self.idle_backoff)
+        return min(self.max_interval, max(self.min_interval, expected))
+
+    def prior_interval(self, novel: TrackedNovel, now: float) -> float:
+        """还没有观测到章节间隔时，根据详情页上的更新时间估计检查间隔"""
+        dates = [date for date in map(_parse_date, novel.update_history) if date is not None]
+        gaps = [later - earlier for earlier, later in zip(dates, dates[1:]) if later > earlier]
+        if gaps:
+            return statistics.median(gaps)
+        if dates:
+            return max(0.0, now - dates[-1]) * self.staleness_factor or self.initial_interval
+        return self.initial_interval
+
+    def retry_delay(self, novel: TrackedNovel) -> float:
+        """检查失败后多久再试"""
+        return min(self.max_interval, self.failure_delay * 2 ** min(novel.failures - 1, 16))
+
+    def with_jitter(self, interval: float) -> float:
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+def _parse_date(text: str) -> Optional[float]:
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').timestamp()
+    except ValueError:
+        return None
+
+
+class RefreshStore:
+    """
+    被跟踪小说的持久化存储，基于SQLite，重启后继续按原来的计划检查。
+
+    所有方法都是线程安全的，可以在asyncio.to_thread中调用。
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        """
+        参数:
+            path (str): 数据库文件路径
+            busy_timeout (float): 其他进程持有写锁时最多等待的秒数
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS tracked_novels (
+                url TEXT PRIMARY KEY,
+                next_check REAL NOT NULL,
+                state TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tracked_novels_next_check ON tracked_novels (next_check);
+        ''')
+
+    def put(self, novels: Iterable[TrackedNovel]) -> None:
+        rows = [(novel.url, novel.next_check, json.dumps(asdict(novel), ensure_ascii=False)) for novel in novels]
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO tracked_novels (url, next_check, state) VALUES (?, ?, ?)", rows)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def remove(self, url: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM tracked_novels WHERE url = ?", (url,))
+        return cursor.rowcount == 1
+
+    def load_all(self) -> list[TrackedNovel]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state FROM tracked_novels ORDER BY next_check").fetchall()
+        return [TrackedNovel(**json.loads(state)) for state, in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class RefreshStats:
+    checks: int = 0         # 完成的检查次数（包括失败）
+    changed: int = 0        # 详情页有变化、因此获取了目录的次数
+    new_chapters: int = 0   # 新写入的章节数
+    failures: int = 0       # 失败的检查次数
+    deferred: int = 0       # 因为站点的检查预算用完而推迟的次数
+
+
+class RefreshScheduler:
+    """
+    跟踪小说的更新：按下次检查时刻排序的优先队列，到期的小说先只获取详情页，
+    详情页的更新时间、字数或状态有变化时，才获取目录和新增的章节（断点续传由清单文件保证，已有的章节不会重新下载）。
+
+    每本小说的检查间隔从它的更新历史中学习（见RefreshPolicy），更新勤快的小说检查得勤，
+    断更的小说逐渐降低频率，完结的小说降到最低频率。每个站点（主机）有独立的检查预算，
+    预算用完时到期的检查顺延，不会阻塞其他站点；检查触发的下载请求仍然受爬虫自身的限流器约束。
+
+    作为异步上下文管理器使用：
+
+        async with RefreshScheduler(RefreshStore('refresh.db'), site_names=['ujxsw']) as scheduler:
+            await scheduler.track('ujxsw', url)
+            await scheduler.run()
+
+    只在单个事件循环中使用。
+    """
+
+    def __init__(
+            self,
+            store: RefreshStore = None,
+            crawlers: dict[str, BaseNovelCrawler] = None,
+            site_names: Iterable[str] = None,
+            crawler_options: dict[str, dict] = None,
+            file_path: str = './novels/',
+            policy: RefreshPolicy = None,
+            host_budgets: dict[str, float] = None,
+            default_host_budget: float = 600.0,
+            max_concurrent_checks: int = 8
+    ):
+        """
+        参数:
+            store (RefreshStore): 持久化存储，为None时只保存在内存中
+            crawlers (dict): {站点名称: 爬虫实例}，为None时用NovelCrawlerFactory为site_names创建
+            site_names : 使用的站点名称，默认为所有注册过的站点
+            crawler_options (dict): {站点名称: 传给爬虫构造函数的选项}
+            file_path (str): track时没有指定文件夹的小说保存在这里
+            policy (RefreshPolicy): 检查间隔的策略
+            host_budgets (dict): {主机名: 每小时最多检查的次数}，覆盖default_host_budget
+            default_host_budget (float): 没有在host_budgets中列出的主机每小时最多检查的次数
+            max_concurrent_checks (int): 同时进行的检查数，包括检查到更新后的下载
+        """
+        if crawlers is None:
+            crawler_options = crawler_options or {}
+            names = list(site_names) if site_names is not None else NovelCrawlerFactory.registered_sites()
+            crawlers = {name: NovelCrawlerFactory.create_novel_crawler(name, **crawler_options.get(name, {}))
+                        for name in names}
+        self.crawlers = crawlers
+        self.store = store
+        self.file_path = file_path
+        self.policy = policy if policy is not None else RefreshPolicy()
+        self.host_budgets = dict(host_budgets or {})
+        self.default_host_budget = default_host_budget
+        self.max_concurrent_checks = max_concurrent_checks
+        self.novels: dict[str, TrackedNovel] = {}
+        self.stats = RefreshStats()
+        # 按(下次检查时刻, 序号, URL)排序；重新安排或取消跟踪时旧的条目留在堆中，出堆时与novels对照跳过
+        self._heap: list[tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._exit_stack: Optional[AsyncExitStack] = None
+
+    async def __aenter__(self) -> 'RefreshScheduler':
+        self._exit_stack = AsyncExitStack()
+        for crawler in self.crawlers.values():
+            await self._exit_stack.enter_async_context(crawler)
+        if self.store is not None:
+            for novel in await asyncio.to_thread(self.store.load_all):
+                self._schedule(novel, novel.next_check)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self._exit_stack.aclose()
+
+    async def track(self, site: str, url: str, file_path: str = None, check_now: bool = True) -> TrackedNovel:
+        """
+        开始跟踪一本小说，已经在跟踪时返回原来的记录。
+
+        参数:
+            site (str): 站点名称，需要在crawlers中
+            url (str): 小说详情页URL
+            file_path (str): 小说保存的文件夹，默认为构造时的file_path
+            check_now (bool): 是否立即检查（并下载整本书），为False时在initial_interval之后检查
+        """
+        if site not in self.crawlers:
+            raise ValueError(f"没有站点 {site} 的爬虫")
+        url = normalize_url(url)
+        novel = self.novels.get(url)
+        if novel is not None:
+            return novel
+        novel = TrackedNovel(url, site, file_path if file_path is not None else self.file_path)
+        next_check = time.time() if check_now else time.time() + self.policy.with_jitter(self.policy.initial_interval)
+        self._schedule(novel, next_check)
+        await self._save(novel)
+        return novel
+
+    async def untrack(self, url: str) -> bool:
+        """停止跟踪一本小说，正在进行的检查不受影响"""
+        novel = self.novels.pop(normalize_url(url), None)
+        if novel is not None and self.store is not None:
+            await asyncio.to_thread(self.store.remove, novel.url)
+        return novel is not None
+
+    def host_budget(self, host: str) -> TokenBucket:
+        """主机的检查预算，令牌桶的容量为一分钟的配额，允许检查在短时间内适度集中"""
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate = self.host_budgets.get(host, self.default_host_budget) / 3600
+            bucket = self._buckets[host] = TokenBucket(rate, max(1.0, rate * 60))
+        return bucket
+
+    async def run(self, until_idle: bool = False) -> None:
+        """
+        持续检查到期的小说，同时最多进行max_concurrent_checks个检查，直到被取消。
+
+        参数:
+            until_idle (bool): 为True时，当前到期的小说都检查完、下一本还没有到期时返回，适合由cron定期运行
+        """
+        self._wake = asyncio.Event()
+        running: set[asyncio.Future] = set()
+        try:
+            while True:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now and len(running) < self.max_concurrent_checks:
+                    next_check, _, url = heapq.heappop(self._heap)
+                    novel = self.novels.get(url)
+                    if novel is None or novel.next_check != next_check:
+                        continue
+                    bucket = self.host_budget(novel.host)
+                    tokens = bucket.tokens
+                    if tokens < 1:
+                        # 这个站点的预算用完了，顺延到下一个令牌补充的时刻，其他站点的检查照常进行
+                        self.stats.deferred += 1
+                        self._schedule(novel, now + max(1.0, (1 - tokens) / bucket.rate))
+                        continue
+                    await bucket.acquire()
+                    running.add(asyncio.ensure_future(self._check(novel)))
+                if until_idle and not running and (not self._heap or self._heap[0][0] > now):
+                    return
+                timeout = None
+                if self._heap and len(running) < self.max_concurrent_checks:
+                    timeout = max(0.0, self._heap[0][0] - time.time())
+                self._wake.clear()
+                wake = asyncio.ensure_future(self._wake.wait())
+                try:
+                    done, _ = await asyncio.wait(running | {wake}, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    wake.cancel()
+                for task in done - {wake}:
+                    running.discard(task)
+                    task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            self._wake = None
+
+    def snapshot(self) -> dict:
+        """跟踪的小说数、统计和最近到期的几本小说，可以直接序列化为JSON"""
+        upcoming = sorted(self.novels.values(), key=lambda novel: novel.next_check)[:10]
+        return {
+            'tracked': len(self.novels),
+            'completed': sum(novel.status == '完结' for novel in self.novels.values()),
+            **asdict(self.stats),
+            'upcoming': [{'url': novel.url, 'next_check': novel.next_check, 'interval': novel.interval,
+                          'chapter_gap': novel.chapter_gap} for novel in upcoming],
+        }
+
+    def _schedule(self, novel: TrackedNovel, next_check: float) -> None:
+        novel.next_check = next_check
+        self.novels[novel.url] = novel
+        heapq.heappush(self._heap, (next_check, next(self._sequence), novel.url))
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _save(self, novel: TrackedNovel) -> None:
+        if self.store is not None:
+            await asyncio.to_thread(self.store.put, [novel])
+
+    async def _check(self, novel: TrackedNovel) -> None:
+        crawler = self.crawlers[novel.site]
+        try:
+            metadata_result = await crawler.get_novel_metadata_result_async(novel.url)
+            if not metadata_result.ok:
+                await self._failed(novel, metadata_result)
+                return
+            metadata = metadata_result.value
+            changed = novel.has_changed(metadata)
+            new_chapters = 0
+            if changed:
+                self.stats.changed += 1
+                download_result = await crawler.write_novel_content_to_file(
+                    novel.url, novel.file_path, metadata=metadata)
+                if not download_result.ok:
+                    # 不记录这次的详情，下次检查仍然视为有变化
+                    await self._failed(novel, download_result)
+                    return
+                manifest = await NovelManifest.load(NovelManifest.path_for(download_result.value))
+                new_chapters = max(0, len(manifest.chapters) - novel.chapters)
+                novel.chapters = len(manifest.chapters)
+                if novel.checks:
+                    self.stats.new_chapters += new_chapters
+            now = time.time()
+            novel.record(metadata, changed, new_chapters, now, self.policy.smoothing)
+            novel.interval = self.policy.next_interval(novel, changed, now)
+            next_check = now + self.policy.with_jitter(novel.interval)
+        except Exception as e:
+            print(f"检查小说更新失败：{novel.url} {type(e).__name__}: {e}")
+            await self._failed(novel, None)
+            return
+        finally:
+            self.stats.checks += 1
+        if novel.url in self.novels:
+            self._schedule(novel, next_check)
+            await self._save(novel)
+
+    async def _failed(self, novel: TrackedNovel, result: Optional[CrawlResult]) -> None:
+        """检查失败后退避重试；永久性失败（例如小说被删除）按最长间隔重试"""
+        self.stats.failures += 1
+        novel.failures += 1
+        if result is not None:
+            print(f"检查小说更新失败：{novel.url} {result.error}")
+        retryable = result is None or result.retryable
+        delay = self.policy.retry_delay(novel) if retryable else self.policy.max_interval
+        if novel.url in self.novels:
+            self._schedule(novel, time.time() + delay)
+            await self._save(novel)
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from yarl import URL
+
+T = TypeVar('T')
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化URL，用于判断两个URL是否指向同一个页面。
+
+    去掉首尾空白和#片段，协议和域名转为小写，去掉默认端口，空路径补为'/'。
+    """
+    parsed = URL(url.strip())
+    if not parsed.is_absolute():
+        return str(parsed.with_fragment(None))
+    scheme = parsed.scheme.lower()
+    port = parsed.explicit_port if parsed.explicit_port != _DEFAULT_PORTS.get(scheme) else None
+    normalized = URL.build(
+        scheme=scheme,
+        user=parsed.raw_user,
+        password=parsed.raw_password,
+        host=parsed.raw_host.lower(),
+        port=port,
+        path=parsed.raw_path or '/',
+        query_string=parsed.raw_query_string,
+        encoded=True
+    )
+    return str(normalized)
+
+
+class RequestCoalescer:
+    """
+    合并并发的相同请求（singleflight）。
+
+    同一个key的请求在途时，后来的调用不再发起新的请求，而是等待在途请求的结果；
+    请求完成后立即移除，之后的调用会重新发起请求，因此这里不是缓存。
+    所有等待方都被取消时，在途请求也会被取消。
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, tuple[asyncio.Task, list[int]]] = {}
+        self.calls = 0          # 总调用次数
+        self.coalesced = 0      # 被合并到在途请求上的调用次数
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行key对应的请求，已有相同key的请求在途时共享它的结果。
+
+        参数:
+            key : 请求的标识，例如(接口类型, 规范化后的URL)
+            factory : 发起请求的函数，只有没有在途请求时才会被调用
+
+        返回:
+            请求的结果，所有等待方拿到的是同一个对象，调用方不应修改它
+        """
+        self.calls += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(factory())
+            entry = self._inflight[key] = (task, [0])
+
+            def forget(_):
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            waiters[0] -= 1
+            if waiters[0] == 0 and not task.done():
+                task.cancel()
+
+    @property
+    def in_flight(self) -> int:
+        """当前在途的请求数"""
+        return len(self._inflight)
+
+    def snapshot(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': self.in_flight}
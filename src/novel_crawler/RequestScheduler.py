@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import AsyncIterator, Hashable, Iterator, Optional
+
+
+class RequestPriority(IntEnum):
+    """请求的优先级类别，数值越小越优先"""
+    INTERACTIVE = 0     # 交互式查询：关键词搜索、作者作品
+    METADATA = 1        # 小说详情页、标签列表页
+    CHAPTER_LIST = 2    # 目录页
+    BULK_CHAPTER = 3    # 批量下载的章节内容
+
+
+# 各接口类型默认的优先级类别，接口类型与ResponseCache中的一致
+KIND_PRIORITIES = {
+    'search': RequestPriority.INTERACTIVE,
+    'author': RequestPriority.INTERACTIVE,
+    'metadata': RequestPriority.METADATA,
+    'tag': RequestPriority.METADATA,
+    'catalog': RequestPriority.CHAPTER_LIST,
+    'chapter': RequestPriority.BULK_CHAPTER,
+}
+
+# 当前协程所属的流（例如正在下载的小说）和它的权重，协程中创建的任务会继承
+_current_flow: ContextVar[tuple[Hashable, float]] = ContextVar('novel_crawler_request_flow', default=(None, 1.0))
+# 当前协程强制使用的优先级类别，为None时按接口类型决定
+_current_priority: ContextVar[Optional[RequestPriority]] = ContextVar('novel_crawler_request_priority', default=None)
+
+
+class RequestScheduler:
+    """
+    全局请求调度器，取代各个方法各自持有的信号量。
+
+    最多同时发出max_concurrency个请求。名额不足时，按优先级类别严格排序：高优先级类别有请求排队时，
+    低优先级类别不会得到名额，因此大量章节下载不会阻塞交互式查询和元数据请求。
+    同一类别内按流（通常是一本小说）做加权公平排队（start-time fair queuing）：每个请求的虚拟开始时间为
+    max(类别的虚拟时间, 该流上一个请求的虚拟完成时间)，虚拟完成时间为开始时间 + 1/权重，
+    按虚拟开始时间从小到大分配名额，并发下载的多本小说按权重轮流前进，一本五千章的小说不会占满所有名额。
+
+    名额只在单次请求期间持有，嵌套调用（下载整本小说时获取详情页、目录页和章节）不会持有名额再等待名额，
+    不会死锁。只在单个事件循环中使用。
+    """
+
+    def __init__(self, max_concurrency: int = 16, kind_priorities: dict[str, RequestPriority] = None):
+        """
+        参数:
+            max_concurrency (int): 同时在途的请求数上限
+            kind_priorities (dict): 接口类型到优先级类别的映射，没有列出的接口类型使用METADATA
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency必须大于0：{max_concurrency}")
+        self.max_concurrency = max_concurrency
+        self.kind_priorities = kind_priorities if kind_priorities is not None else KIND_PRIORITIES
+        self.in_flight = 0
+        self.granted = {priority: 0 for priority in RequestPriority}    # 各类别已分配的名额数
+        # 每个类别一个按(虚拟开始时间, 序号)排序的等待队列，取消的等待者留在队列中，出队时跳过
+        self._queues: dict[RequestPriority, list[tuple[float, int, asyncio.Future]]] = {
+            priority: [] for priority in RequestPriority}
+        self._virtual_time = {priority: 0.0 for priority in RequestPriority}
+        self._flow_finish: dict[tuple[RequestPriority, Hashable], float] = {}
+        self._sequence = itertools.count()
+
+    def priority_of(self, kind: str) -> RequestPriority:
+        priority = _current_priority.get()
+        if priority is not None:
+            return priority
+        return self.kind_priorities.get(kind, RequestPriority.METADATA)
+
+    @property
+    def waiting(self) -> int:
+        """正在排队的请求数"""
+        return sum(not waiter.done() for queue in self._queues.values() for _, _, waiter in queue)
+
+    @staticmethod
+    @contextmanager
+    def flow(key: Hashable, weight: float = 1.0) -> Iterator[None]:
+        """
+        把代码块中（包括其中创建的任务）发出的请求归入同一个流，例如with scheduler.flow(小说URL): ...
+
+        参数:
+            key : 流的标识
+            weight (float): 流的权重，同一类别内流之间按权重的比例分配名额
+        """
+        token = _current_flow.set((key, weight))
+        try:
+            yield
+        finally:
+            _current_flow.reset(token)
+
+    @staticmethod
+    @contextmanager
+    def priority(priority: RequestPriority) -> Iterator[None]:
+        """代码块中发出的请求都使用指定的优先级类别，例如用户交互时获取的详情页可以提升为INTERACTIVE"""
+        token = _current_priority.set(priority)
+        try:
+            yield
+        finally:
+            _current_priority.reset(token)
+
+    @asynccontextmanager
+    async def slot(self, kind: str) -> AsyncIterator[None]:
+        """占用一个请求名额，例如async with scheduler.slot('chapter'): ..."""
+        await self.acquire(kind)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, kind: str) -> None:
+        priority = self.priority_of(kind)
+        start = self._start_tag(priority)
+        if self.in_flight < self.max_concurrency and not any(self._queues.values()):
+            self._grant(priority, start)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (start, next(self._sequence), waiter))
+        # 队列中可能只剩下已经取消的等待者，这时有空闲名额，直接分配
+        self._wake_up()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已经分配给了这个协程，但它被取消了，需要把名额让给下一个
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake_up()
+
+    def _start_tag(self, priority: RequestPriority) -> float:
+        """计算请求的虚拟开始时间，并把流的虚拟完成时间推进到开始时间 + 1/权重"""
+        flow, weight = _current_flow.get()
+        key = (priority, flow)
+        start = max(self._virtual_time[priority], self._flow_finish.get(key, 0.0))
+        self._flow_finish[key] = start + 1.0 / weight
+        return start
+
+    def _grant(self, priority: RequestPriority, start: float) -> None:
+        self.in_flight += 1
+        self.granted[priority] += 1
+        self._virtual_time[priority] = max(self._virtual_time[priority], start)
+        if len(self._flow_finish) > 4096:
+            # 完成时间不超过虚拟时间的流与没有记录的流等价，定期清理已经结束的流
+            self._flow_finish = {key: tag for key, tag in self._flow_finish.items()
+                                 if tag > self._virtual_time[key[0]]}
+
+    def _wake_up(self) -> None:
+        for priority in RequestPriority:
+            queue = self._queues[priority]
+            while queue and self.in_flight < self.max_concurrency:
+                start, _, waiter = heapq.heappop(queue)
+                if waiter.done():
+                    continue
+                self._grant(priority, start)
+                waiter.set_result(None)
+            if self.in_flight >= self.max_concurrency:
+                return
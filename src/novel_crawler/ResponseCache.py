@@ -0,0 +1,167 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+
+@dataclass
+class CachedResponse:
+    body: bytes                     # 解压后的响应体
+    etag: Optional[str]             # 响应的ETag头
+    last_modified: Optional[str]    # 响应的Last-Modified头
+    stored_at: float                # 缓存写入（或最近一次重新验证）的时间戳
+
+    def validators(self) -> dict[str, str]:
+        """条件请求需要携带的请求头"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    基于SQLite的磁盘HTTP响应缓存。
+
+    以(请求方法, URL, 请求体)为键，压缩保存响应体以及ETag/Last-Modified头。
+    每种接口类型（详情页、目录页、章节页、标签页等）有各自的过期时间，过期的缓存通过
+    If-None-Match/If-Modified-Since发起条件请求重新验证；缓存总大小超过上限时按最近最少使用淘汰。
+    所有方法都是线程安全的，可以在asyncio.to_thread中调用，避免压缩和磁盘IO阻塞事件循环。
+    """
+
+    # 各接口类型的缓存有效期（秒），None表示永不过期，0表示每次都重新验证
+    default_ttl_rules = {
+        'chapter': None,        # 章节内容发布后基本不会变化
+        'catalog': 10 * 60,
+        'metadata': 10 * 60,
+        'tag': 5 * 60,
+        'author': 60 * 60,
+        'search': 60 * 60,
+    }
+
+    def __init__(
+            self,
+            cache_dir: str,
+            max_bytes: int = 1 << 30,
+            ttl_rules: dict[str, Optional[float]] = None,
+            compress_level: int = 6
+    ):
+        """
+        参数:
+            cache_dir (str): 缓存目录
+            max_bytes (int): 缓存中压缩后响应体的总大小上限，默认1GB
+            ttl_rules (dict): 覆盖默认的各接口类型缓存有效期
+            compress_level (int): zlib压缩级别
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_rules = {**self.default_ttl_rules, **(ttl_rules or {})}
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'responses.sqlite3'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+        self.total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def make_key(method: str, url: str, data: Any = None) -> str:
+        """根据请求方法、URL和请求体生成缓存键"""
+        if isinstance(data, dict):
+            data = urlencode(sorted(data.items()))
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(f'{method.upper()} {url}\n'.encode('utf-8'))
+        digest.update(data or b'')
+        return digest.hexdigest()
+
+    def is_fresh(self, entry: CachedResponse, kind: str) -> bool:
+        """缓存是否仍在有效期内，可以不经网络直接使用"""
+        ttl = self.ttl_rules.get(kind, 0)
+        return ttl is None or time.time() - entry.stored_at < ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """读取缓存并更新最近访问时间，没有缓存时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+        body, etag, last_modified, stored_at = row
+        return CachedResponse(zlib.decompress(body), etag, last_modified, stored_at)
+
+    def put(self, key: str, kind: str, body: bytes, etag: str = None, last_modified: str = None) -> None:
+        """写入（或替换）缓存，必要时按LRU淘汰旧缓存"""
+        compressed = zlib.compress(body, self.compress_level)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, kind, body, size, etag, last_modified, stored_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, kind, compressed, len(compressed), etag, last_modified, now, now))
+            self.total_bytes += len(compressed) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def refresh(self, key: str) -> None:
+        """条件请求返回304后，重置缓存的有效期"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """删除一条缓存，例如响应体无法解析时，避免之后一直使用同一个错误的页面"""
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if old is None:
+                return
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.commit()
+            self.total_bytes -= old[0]
+
+    def _evict(self) -> None:
+        """按最近最少使用淘汰，直到总大小降到上限的90%以下，调用方需持有锁"""
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute('SELECT key, size FROM responses ORDER BY accessed_at')
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+            self.total_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
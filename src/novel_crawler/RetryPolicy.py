@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import aiohttp
+
+
+class FetchError(Exception):
+    """请求失败"""
+
+    def __init__(self, message: str, url: str = '', status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after      # 服务端通过Retry-After要求的等待时间（秒）
+
+
+class TransientFetchError(FetchError):
+    """暂时性失败，例如超时、连接错误、429/5xx，稍后重试可能成功"""
+
+
+class PermanentFetchError(FetchError):
+    """永久性失败，例如404、页面结构不符合预期，重试也不会成功"""
+
+
+class CircuitOpenError(TransientFetchError):
+    """站点的熔断器处于打开状态，请求没有发出"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After头，支持秒数和HTTP日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class RetryPolicy:
+    """请求的重试策略：指数退避加全抖动（full jitter），并遵守服务端的Retry-After"""
+    max_attempts: int = 4           # 包括第一次在内的最多请求次数
+    base_delay: float = 0.5         # 第一次重试前的退避时间上限（秒）
+    max_delay: float = 30.0         # 退避时间上限（秒）
+    retry_statuses: frozenset = field(default_factory=lambda: frozenset({408, 425, 429, 500, 502, 503, 504}))
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """第attempt次请求失败后，下一次请求前需要等待的时间"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def classify_status(self, url: str, status: int, headers) -> FetchError:
+        """把非成功的响应状态码转换为对应的失败类型"""
+        if status in self.retry_statuses:
+            return TransientFetchError(f'HTTP {status}', url, status, parse_retry_after(headers.get('Retry-After')))
+        return PermanentFetchError(f'HTTP {status}', url, status)
+
+    @staticmethod
+    def classify_exception(url: str, error: Exception) -> FetchError:
+        """把请求过程中的异常转换为对应的失败类型"""
+        if isinstance(error, FetchError):
+            return error
+        if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError)):
+            return TransientFetchError(f'{type(error).__name__}: {error}', url)
+        return PermanentFetchError(f'{type(error).__name__}: {error}', url)
+
+
+class CircuitBreaker:
+    """
+    单个站点的熔断器。
+
+    连续failure_threshold次暂时性失败后打开，打开期间请求直接失败、不再发往站点；
+    经过reset_timeout后进入半开状态，只放行一个探测请求，探测成功则关闭，失败则重新打开。
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_request(self, url: str = '') -> None:
+        """请求前调用，熔断器打开时抛出CircuitOpenError"""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f'站点 {self.host} 已熔断', url, retry_after=retry_after)
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def record_abort(self) -> None:
+        """请求被取消等没有结果的情况，释放半开状态下的探测名额"""
+        self._probing = False
+
+    def snapshot(self) -> dict:
+        return {'state': self.state, 'consecutive_failures': self.consecutive_failures}
+
+
+class CircuitBreakers:
+    """按站点分别维护的熔断器集合"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._hosts: dict[str, CircuitBreaker] = {}
+
+    def for_host(self, host: str) -> CircuitBreaker:
+        breaker = self._hosts.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            self._hosts[host] = breaker
+        return breaker
+
+    def snapshot(self) -> dict[str, dict]:
+        return {host: breaker.snapshot() for host, breaker in self._hosts.items()}
@@ -0,0 +1,260 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from novel_crawler.NovelCrawlerFactory import BaseNovelCrawler, CrawlResult, CrawlStatus, NovelCrawlerFactory
+from novel_crawler.RateLimiter import RateLimiter, SharedTokenBucket
+from novel_crawler.RequestCoalescer import normalize_url
+from novel_crawler.RetryPolicy import PermanentFetchError
+from novel_crawler.VisitedUrlFilter import VisitedUrlFilter
+
+# 工作进程发回父进程的消息类型
+_RESULT = 'result'
+_EXIT = 'exit'
+
+
+@dataclass(frozen=True)
+class CrawlTask:
+    """
+    交给ShardedCrawlRunner的一项工作。
+
+    kind:
+        'tag'      : target为标签，结果为该标签下所有小说的(书名, 作者, 详情页URL链接)列表
+        'metadata' : target为小说详情页URL，结果为NovelMetadata
+        'chapters' : target为小说目录页URL，结果为(章节标题, 章节URL)列表
+        'chapter'  : target为章节URL，结果为章节内容
+        'download' : target为小说详情页URL，把小说保存到file_path目录下，结果为小说文件的路径
+    """
+    kind: str
+    target: str
+    file_path: str = ''
+
+
+@dataclass
+class TaskResult:
+    task: CrawlTask
+    result: CrawlResult
+    worker: int         # 完成这项工作的工作进程编号，-1表示工作进程异常退出、工作没有完成
+
+
+@dataclass
+class RunnerProgress:
+    total: int = 0          # 已提交的工作数
+    completed: int = 0      # 已完成（包括失败）的工作数
+    failed: int = 0         # 失败的工作数
+    workers_alive: int = 0  # 仍在运行的工作进程数
+
+    @property
+    def fraction(self) -> float:
+        return self.completed / self.total if self.total else 1.0
+
+
+async def run_crawl_task(crawler: BaseNovelCrawler, task: CrawlTask) -> CrawlResult:
+    """用爬虫执行一项工作，所有异常都转换为失败的CrawlResult"""
+    try:
+        if task.kind == 'metadata':
+            return await crawler.get_novel_metadata_result_async(task.target)
+        if task.kind == 'chapters':
+            return await crawler.get_novel_chapters_list_result_async(task.target)
+        if task.kind == 'chapter':
+            return await crawler.get_novel_chapter_content_result_async(task.target)
+        if task.kind == 'download':
+            return await crawler.write_novel_content_to_file(task.target, task.file_path)
+        if task.kind == 'tag':
+            novels = [novel async for novel in crawler.iter_novel_list_by_tag_async(task.target)]
+            return CrawlResult.success(novels, task.target)
+        return CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=f"未知的工作类型：{task.kind}", url=task.target)
+    except PermanentFetchError as e:
+        return CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=str(e), url=task.target)
+    except Exception as e:
+        return CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error=f'{type(e).__name__}: {e}', url=task.target)
+
+
+async def _worker_loop(worker_id, site_name, crawler_class, crawler_options, bucket, concurrency,
+                       task_queue, result_queue) -> None:
+    NovelCrawlerFactory.register_novel_crawler(site_name, crawler_class)
+    options = dict(crawler_options)
+    options.setdefault('rate_limiter', RateLimiter(rate=bucket.rate, burst=bucket.burst, shared_bucket=bucket))
+    crawler = NovelCrawlerFactory.create_novel_crawler(site_name, **options)
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    async def run(index, task):
+        try:
+            result = await run_crawl_task(crawler, task)
+            result_queue.put((_RESULT, worker_id, index, result))
+        finally:
+            slots.release()
+
+    async with crawler:
+        while True:
+            await slots.acquire()
+            item = await asyncio.to_thread(task_queue.get)
+            if item is None:
+                break
+            job = asyncio.ensure_future(run(*item))
+            running.add(job)
+            job.add_done_callback(running.discard)
+        if running:
+            await asyncio.wait(running)
+
+
+def _worker_main(worker_id, site_name, crawler_class, crawler_options, bucket, concurrency,
+                 task_queue, result_queue) -> None:
+    """工作进程入口：独立的事件循环、会话和爬虫，从任务队列领取工作直到收到None"""
+    try:
+        asyncio.run(_worker_loop(worker_id, site_name, crawler_class, crawler_options, bucket, concurrency,
+                                 task_queue, result_queue))
+    finally:
+        result_queue.put((_EXIT, worker_id, None, None))
+
+
+class ShardedCrawlRunner:
+    """
+    多进程爬取：把工作列表分给多个工作进程，每个进程有自己的事件循环、会话和爬虫，页面解析可以用满所有CPU核。
+
+    工作进程从共享的任务队列中领取工作，先做完的进程自动多领，避免静态分片时个别大任务拖慢整体。
+    所有进程的请求都经过同一个跨进程令牌桶，合计的请求速率不超过rate；结果在完成时逐个发回父进程。
+
+    用法:
+        runner = ShardedCrawlRunner("ujxsw", workers=4, rate=40)
+        async for item in runner.run(CrawlTask('metadata', url) for url in urls):
+            ...
+    """
+
+    def __init__(
+            self,
+            site_name: str,
+            workers: int = None,
+            rate: float = 20.0,
+            burst: float = None,
+            concurrency: int = 16,
+            crawler_options: dict = None,
+            on_progress: Callable[[RunnerProgress], None] = None
+    ):
+        """
+        参数:
+            site_name (str): 站点名称，爬虫需要已经通过NovelCrawlerFactory.register_novel_crawler注册
+            workers (int): 工作进程数，默认为CPU核数
+            rate (float): 所有工作进程合计的每秒请求数上限
+            burst (float): 全局令牌桶容量，默认等于rate
+            concurrency (int): 每个工作进程同时进行的工作数
+            crawler_options (dict): 传给每个工作进程中爬虫构造函数的选项，需要能被pickle。
+                没有指定rate_limiter时，工作进程创建一个接入全局令牌桶的RateLimiter
+            on_progress : 每完成一项工作调用一次，参数为当前进度
+        """
+        self.crawler_class = NovelCrawlerFactory._all_sites.get(site_name)
+        if self.crawler_class is None:
+            raise ValueError(f"未找到站点 '{site_name}' 的爬虫")
+        self.site_name = site_name
+        self.workers = workers or os.cpu_count() or 1
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.crawler_options = crawler_options or {}
+        self.on_progress = on_progress
+        self.progress = RunnerProgress()
+        # spawn启动的子进程不会继承父进程的事件循环和已打开的连接
+        self._context = multiprocessing.get_context('spawn')
+
+    async def run(self, tasks: Iterable[CrawlTask]) -> AsyncIterator[TaskResult]:
+        """
+        执行所有工作，按完成顺序产出结果。
+
+        工作进程异常退出时，它没有完成的工作以暂时性失败的结果产出，worker为-1。
+        调用方提前停止迭代时，工作进程会被终止。
+        """
+        tasks = list(tasks)
+        self.progress = RunnerProgress(total=len(tasks), workers_alive=self.workers)
+        bucket = SharedTokenBucket(self.rate, self.burst, self._context)
+        task_queue = self._context.Queue()
+        result_queue = self._context.Queue()
+        for item in enumerate(tasks):
+            task_queue.put(item)
+        for _ in range(self.workers):
+            task_queue.put(None)
+        processes = [
+            self._context.Process(
+                target=_worker_main,
+                args=(worker_id, self.site_name, self.crawler_class, self.crawler_options, bucket,
+                      self.concurrency, task_queue, result_queue),
+                daemon=True)
+            for worker_id in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+        outstanding = set(range(len(tasks)))
+        try:
+            while self.progress.workers_alive:
+                message = await asyncio.to_thread(self._next_message, result_queue, processes)
+                if message is None:
+                    # 有工作进程没有发出退出消息就结束了（例如被系统杀死）
+                    self.progress.workers_alive = sum(process.is_alive() for process in processes)
+                    if self.progress.workers_alive:
+                        continue
+                    break
+                kind, worker_id, index, result = message
+                if kind == _EXIT:
+                    self.progress.workers_alive -= 1
+                    continue
+                outstanding.discard(index)
+                yield self._complete(TaskResult(tasks[index], result, worker_id))
+            for index in sorted(outstanding):
+                result = CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error='工作进程异常退出', url=tasks[index].target)
+                yield self._complete(TaskResult(tasks[index], result, -1))
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                await asyncio.to_thread(process.join)
+            task_queue.cancel_join_thread()
+            result_queue.cancel_join_thread()
+
+    @staticmethod
+    def _next_message(result_queue, processes) -> Optional[tuple]:
+        """等待下一条消息，所有工作进程都已结束且队列为空时返回None"""
+        while True:
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    try:
+                        return result_queue.get_nowait()
+                    except queue.Empty:
+                        return None
+
+    def _complete(self, item: TaskResult) -> TaskResult:
+        self.progress.completed += 1
+        if not item.result.ok:
+            self.progress.failed += 1
+        if self.on_progress is not None:
+            self.on_progress(self.progress)
+        return item
+
+    async def sweep(self, tags: Iterable[str] = None, visited: VisitedUrlFilter = None) -> AsyncIterator[TaskResult]:
+        """
+        全站扫描：先遍历所有标签的列表页，再获取去重后所有小说的元数据，按完成顺序产出元数据的结果。
+
+        参数:
+            tags : 需要扫描的标签，默认为爬虫的tags_list
+            visited (VisitedUrlFilter): 已经成功获取过元数据的小说，键为"metadata 规范化URL"。
+                这些小说不再请求，元数据获取成功后才标记，中断后重新扫描只需要处理剩下的小说
+        """
+        tags = list(tags if tags is not None else getattr(self.crawler_class, 'tags_list', []))
+        urls = {}
+        async for item in self.run(CrawlTask('tag', tag) for tag in tags):
+            if not item.result.ok:
+                print(f"获取标签相关的小说列表失败：{item.result.error}")
+                continue
+            for _, _, url in item.result.value:
+                urls.setdefault(normalize_url(url), url)
+        if visited is not None:
+            urls = {key: url for key, url in urls.items() if f'metadata {key}' not in visited}
+        async for item in self.run(CrawlTask('metadata', url) for url in urls.values()):
+            if visited is not None and item.result.ok:
+                await asyncio.to_thread(visited.add, f'metadata {normalize_url(item.task.target)}')
+            yield item
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+from abc import abstractmethod
+from typing import Any, AsyncIterable, Awaitable, Callable, Optional
+
+from novel_crawler.NovelCrawlerFactory import NovelMetadata, SortStrategy, T
+
+
+class KeySortStrategy(SortStrategy):
+    """
+    按NovelMetadata上的某个键从大到小排序的策略。
+
+    select_top_n用大小为top_n的最小堆做选择，只在候选还有可能进入前top_n时才获取它的元数据：
+    列表页上能直接拿到排序字段（例如字数、更新时间）的候选先只记下这个上界，候选流结束后按上界从大到小
+    依次获取元数据，一旦上界不大于堆顶（当前第top_n名）就停止；拿不到上界的候选只能获取元数据后比较。
+    """
+
+    def __init__(self, concurrency: int = 8):
+        """
+        参数:
+            concurrency (int): 同时获取元数据的最大数量
+        """
+        self.concurrency = concurrency
+
+    @abstractmethod
+    def key(self, novel: NovelMetadata) -> Any:
+        """排序键，越大越靠前"""
+        pass
+
+    def bound(self, hint: dict) -> Optional[Any]:
+        """根据列表页字段给出排序键的上界，拿不到时返回None"""
+        return None
+
+    async def sort(self, novels: list[NovelMetadata]) -> list[NovelMetadata]:
+        return sorted(novels, key=self.key, reverse=True)
+
+    async def select_top_n(
+            self,
+            candidates: AsyncIterable[tuple[T, dict]],
+            top_n: int,
+            fetch_metadata: Callable[[T], Awaitable[Optional[NovelMetadata]]]
+    ) -> list[tuple[T, NovelMetadata]]:
+        heap = []           # 当前的前top_n名，最小堆：(排序键, 序号, 小说信息, 元数据)
+        deferred = []       # 有上界、暂不获取元数据的候选，最大堆：(-上界, 序号, 小说信息)
+        pending = set()
+        sequence = 0
+
+        def threshold():
+            return heap[0][0] if len(heap) >= top_n else None
+
+        def offer(item, metadata, seq):
+            if metadata is None:
+                return
+            entry = (self.key(metadata), seq, item, metadata)
+            if len(heap) < top_n:
+                heapq.heappush(heap, entry)
+            elif entry[0] > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+
+        async def fetch(item, seq):
+            return item, await fetch_metadata(item), seq
+
+        async def schedule(item, seq):
+            pending.add(asyncio.ensure_future(fetch(item, seq)))
+            if len(pending) >= self.concurrency:
+                await drain(asyncio.FIRST_COMPLETED)
+
+        async def drain(return_when=asyncio.ALL_COMPLETED):
+            done, _ = await asyncio.wait(pending, return_when=return_when)
+            for task in done:
+                pending.discard(task)
+                offer(*task.result())
+
+        if top_n <= 0:
+            return []
+        try:
+            async for item, hint in candidates:
+                sequence += 1
+                upper_bound = self.bound(hint or {})
+                if upper_bound is None:
+                    await schedule(item, sequence)
+                elif threshold() is None or upper_bound > threshold():
+                    heapq.heappush(deferred, (_Descending(upper_bound), sequence, item))
+            # 按上界从大到小获取元数据，上界不大于当前第top_n名时，剩下的候选都不可能进入前top_n
+            while deferred:
+                if pending:
+                    await drain()
+                limit = threshold()
+                batch = []
+                while deferred and len(batch) < self.concurrency:
+                    upper_bound, seq, item = heapq.heappop(deferred)
+                    if limit is not None and not upper_bound.value > limit:
+                        deferred.clear()
+                        break
+                    batch.append((item, seq))
+                for item, seq in batch:
+                    await schedule(item, seq)
+            if pending:
+                await drain()
+        finally:
+            for task in pending:
+                task.cancel()
+        ranked = sorted(heap, key=lambda entry: (entry[0], -entry[1]), reverse=True)
+        return [(item, metadata) for _, _, item, metadata in ranked]
+
+
+class _Descending:
+    """让heapq的最小堆按值从大到小弹出，值本身只需要支持比较"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.value < self.value
+
+
+class WordCountSortStrategy(KeySortStrategy):
+    """按字数从多到少"""
+
+    def key(self, novel: NovelMetadata) -> int:
+        return novel.word_count
+
+    def bound(self, hint: dict) -> Optional[int]:
+        return hint.get('word_count')
+
+
+class UpdateTimeSortStrategy(KeySortStrategy):
+    """按最近更新时间从新到旧"""
+
+    def key(self, novel: NovelMetadata) -> str:
+        return novel.update_time
+
+    def bound(self, hint: dict) -> Optional[str]:
+        return hint.get('update_time')
+
+
+class ClickSortStrategy(KeySortStrategy):
+    """按点击数从多到少"""
+
+    def key(self, novel: NovelMetadata) -> int:
+        return novel.clicks
+
+    def bound(self, hint: dict) -> Optional[int]:
+        return hint.get('clicks')
+
+
+class RecommendSortStrategy(KeySortStrategy):
+    """按推荐数从多到少"""
+
+    def key(self, novel: NovelMetadata) -> int:
+        return novel.recommends
+
+    def bound(self, hint: dict) -> Optional[int]:
+        return hint.get('recommends')
+
+
+class FavoriteSortStrategy(KeySortStrategy):
+    """按收藏数从多到少"""
+
+    def key(self, novel: NovelMetadata) -> int:
+        return novel.favorites
+
+    def bound(self, hint: dict) -> Optional[int]:
+        return hint.get('favorites')
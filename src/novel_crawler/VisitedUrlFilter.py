@@ -0,0 +1,232 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from typing import Callable, Iterable
+
+# 每个布隆过滤器文件的文件头：魔数、容量、误判率、哈希函数个数、位数、已加入的元素个数
+_HEADER = struct.Struct('<8sQdIQQ')
+_HEADER_SIZE = 64
+_MAGIC = b'NCBLOOM1'
+
+
+def _hash_pair(key: str) -> tuple[int, int]:
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    """
+    保存在文件中、通过mmap访问的固定容量布隆过滤器。
+
+    位数组和计数都直接写在映射的内存中，由操作系统负责写回磁盘，进程重启后打开同一个文件即可继续使用。
+    k个哈希位置由一次blake2b摘要的两半做双重哈希得到。
+    """
+
+    def __init__(self, path: str, capacity: int = None, error_rate: float = None):
+        """
+        参数:
+            path (str): 文件路径，文件已存在时按文件头中的参数打开，忽略capacity和error_rate
+            capacity (int): 设计容量，加入的元素数不超过它时误判率不超过error_rate
+            error_rate (float): 设计误判率
+        """
+        self.path = path
+        if not os.path.exists(path):
+            bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            with open(path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, capacity, error_rate, hashes, bits, 0).ljust(_HEADER_SIZE, b'\0'))
+                f.truncate(_HEADER_SIZE + (bits + 7) // 8)
+        self._file = open(path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.error_rate, self.hashes, self.bits, self.count = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"不是布隆过滤器文件：{path}")
+
+    def _positions(self, key: str) -> Iterable[int]:
+        h1, h2 = _hash_pair(key)
+        bits = self.bits
+        return ((h1 + i * h2) % bits for i in range(self.hashes))
+
+    def __contains__(self, key: str) -> bool:
+        data = self._mmap
+        return all(data[_HEADER_SIZE + (position >> 3)] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """加入元素，返回加入前是否一定不存在（False表示之前可能已经加入过）"""
+        data = self._mmap
+        added = False
+        for position in self._positions(key):
+            index = _HEADER_SIZE + (position >> 3)
+            mask = 1 << (position & 7)
+            if not data[index] & mask:
+                data[index] |= mask
+                added = True
+        if added:
+            self.count += 1
+            _HEADER.pack_into(data, 0, _MAGIC, self.capacity, self.error_rate, self.hashes, self.bits, self.count)
+        return added
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mmap)
+
+    def flush(self) -> None:
+        self._mmap.flush()
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+
+class ScalableBloomFilter:
+    """
+    可扩容的布隆过滤器（Almeida等人的Scalable Bloom Filter）。
+
+    当前的过滤器加满后追加一个容量为growth倍、误判率为tightening倍的新过滤器，
+    各层误判率之和收敛，总误判率不超过error_rate，不需要预先知道元素总数。
+    每一层保存为目录下的一个文件，重启后按顺序重新打开，不需要重建。
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            initial_capacity: int = 1 << 20,
+            error_rate: float = 0.001,
+            growth: int = 2,
+            tightening: float = 0.5
+    ):
+        """
+        参数:
+            directory (str): 保存各层过滤器文件的目录
+            initial_capacity (int): 第一层的容量
+            error_rate (float): 总误判率上限
+            growth (int): 每一层相对上一层的容量倍数
+            tightening (float): 每一层相对上一层的误判率倍数，需要小于1
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self._lock = threading.Lock()
+        self.filters: list[BloomFilter] = []
+        while os.path.exists(self._layer_path(len(self.filters))):
+            self.filters.append(BloomFilter(self._layer_path(len(self.filters))))
+        if not self.filters:
+            self._add_layer()
+
+    def _layer_path(self, index: int) -> str:
+        return os.path.join(self.directory, f'bloom-{index:03d}.bin')
+
+    def _add_layer(self) -> None:
+        index = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** index
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** index
+        self.filters.append(BloomFilter(self._layer_path(index), capacity, error_rate))
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in bloom for bloom in reversed(self.filters))
+
+    def add(self, key: str) -> bool:
+        """加入元素，返回加入前是否一定不存在（False表示之前可能已经加入过）"""
+        with self._lock:
+            if key in self:
+                return False
+            if self.filters[-1].full:
+                self._add_layer()
+            return self.filters[-1].add(key)
+
+    def __len__(self) -> int:
+        """已加入的元素个数（近似值，误判为已存在的元素没有计入）"""
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bloom.nbytes for bloom in self.filters)
+
+    def flush(self) -> None:
+        with self._lock:
+            for bloom in self.filters:
+                bloom.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            for bloom in self.filters:
+                bloom.close()
+            self.filters = []
+
+
+class VisitedUrlFilter:
+    """
+    爬取过程中已经见过的URL集合。
+
+    先查布隆过滤器：不存在的一定是新URL；布隆过滤器认为已存在的，可能是误判，
+    再用confirm到持久化存储（例如爬取队列）中精确确认。内存占用只有布隆过滤器的位数组，
+    每个URL约1.4字节（误判率0.1%时），远小于保存URL字符串的set。
+    所有方法都是线程安全的，可以在asyncio.to_thread中调用。
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            confirm: Callable[[list[str]], set[str]] = None,
+            initial_capacity: int = 1 << 20,
+            error_rate: float = 0.001
+    ):
+        """
+        参数:
+            directory (str): 保存布隆过滤器文件的目录
+            confirm : 精确确认函数，参数为布隆过滤器认为已存在的键，返回其中确实已存在的键；
+                为None时相信布隆过滤器，误判的URL会被当作已见过而跳过
+            initial_capacity (int): 布隆过滤器第一层的容量
+            error_rate (float): 布隆过滤器的总误判率上限
+        """
+        self.bloom = ScalableBloomFilter(directory, initial_capacity, error_rate)
+        self.confirm = confirm
+        self.false_positives = 0    # 布隆过滤器误判、经confirm确认实际是新URL的次数
+
+    def filter_new(self, keys: Iterable[str]) -> list[str]:
+        """
+        返回keys中没有见过的键（保持原来的顺序，重复的只保留第一个），并把它们标记为已见过。
+
+        参数:
+            keys : 需要检查的键，通常是规范化后的URL
+        """
+        keys = list(dict.fromkeys(keys))
+        new_keys = set()
+        maybe_seen = []
+        for key in keys:
+            if self.bloom.add(key):
+                new_keys.add(key)
+            else:
+                maybe_seen.append(key)
+        if maybe_seen and self.confirm is not None:
+            seen = self.confirm(maybe_seen)
+            confirmed_new = [key for key in maybe_seen if key not in seen]
+            self.false_positives += len(confirmed_new)
+            new_keys.update(confirmed_new)
+        return [key for key in keys if key in new_keys]
+
+    def add(self, key: str) -> bool:
+        """把键标记为已见过，返回之前是否一定没有见过"""
+        return self.bloom.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        """是否见过，布隆过滤器认为已存在时同样用confirm确认"""
+        if key not in self.bloom:
+            return False
+        return self.confirm is None or key in self.confirm([key])
+
+    def flush(self) -> None:
+        self.bloom.flush()
+
+    def close(self) -> None:
+        self.bloom.close()
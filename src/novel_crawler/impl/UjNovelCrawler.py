@@ -1,17 +1,35 @@
 import asyncio
+import functools
 import os
-import random
-import re
-from datetime import datetime
+import time
+from concurrent.futures import Executor
+from contextlib import aclosing, asynccontextmanager, nullcontext
 from enum import Enum
-from typing import List, Any, Union
+from pathlib import Path
+from typing import List, Any, AsyncIterator, Callable, Optional, Union
 
 import aiofiles
 import aiohttp
-from bs4 import BeautifulSoup
+from yarl import URL
 
+from novel_crawler.BulkFileWriter import BulkFileWriter
+from novel_crawler.CatalogStore import CatalogPolicy, CatalogStore
+from novel_crawler.ChapterPipeline import ChapterSource, ReadAhead, ordered_fetch
+from novel_crawler.CrawlMetrics import CrawlMetrics
+from novel_crawler.CrawlerSession import ConnectionOptions
+from novel_crawler.HedgePolicy import HedgePolicy
 from novel_crawler.NovelCrawlerFactory import BaseNovelCrawler, SortStrategy
-from novel_crawler.NovelCrawlerFactory import NovelMetadata
+from novel_crawler.NovelCrawlerFactory import CrawlResult, CrawlStatus, NovelMetadata
+from novel_crawler.NovelArchive import ARCHIVE_SUFFIX, ChapterCodec, NovelArchiveWriter
+from novel_crawler.NovelManifest import NovelManifest
+from novel_crawler.RateLimiter import RateLimiter
+from novel_crawler.RequestScheduler import RequestScheduler
+from novel_crawler.ResponseCache import ResponseCache
+from novel_crawler.RetryPolicy import CircuitBreakers, CircuitOpenError, PermanentFetchError, RetryPolicy
+from novel_crawler.RetryPolicy import TransientFetchError
+from novel_crawler.impl.UjPageParser import UjPageParser, create_uj_page_parser
+from novel_crawler.impl.UjStreamParser import AuthorPageStreamParser, CatalogStreamParser, StreamPageParser
+from novel_crawler.impl.UjStreamParser import TagPageStreamParser
 
 
 class UjNovelCrawler(BaseNovelCrawler):
@@ -23,167 +41,640 @@ class UjNovelCrawler(BaseNovelCrawler):
         "Referer": "http://www.ujxsw.org/",
         "Content-Type": "application/x-www-form-urlencoded"
     }
+    chapter_window = 32     # 下载整本小说时章节重排窗口大小，即最多同时在途的章节请求数
+    manifest_save_interval = 50     # 每写入多少章保存一次清单文件
+    chapter_retry_rounds = 2        # 章节在请求层重试用尽后，下载整本小说时再额外重试的轮数
+    tag_page_prefetch = 2           # 按标签遍历小说时，最多提前预取的分页数
+    stream_chunk_size = 16 * 1024   # 流式解析页面时每次读取的响应体字节数
+    encoding = 'utf-8'      # 站点页面编码
+
+    def __init__(
+            self,
+            cache: ResponseCache = None,
+            parser: Union[str, UjPageParser] = 'bs4',
+            parse_executor: Executor = None,
+            rate_limiter: RateLimiter = None,
+            retry_policy: RetryPolicy = None,
+            circuit_breakers: CircuitBreakers = None,
+            connection_options: ConnectionOptions = None,
+            catalog: CatalogStore = None,
+            catalog_policy: CatalogPolicy = None,
+            archive_codec: ChapterCodec = None,
+            metrics: CrawlMetrics = None,
+            scheduler: RequestScheduler = None,
+            hedge_policy: HedgePolicy = None,
+            stream_pages: bool = False,
+            file_writer: BulkFileWriter = None
+    ):
+        """
+        参数:
+            cache (ResponseCache): 磁盘HTTP响应缓存，所有请求都会经过它；为None时不使用缓存
+            parser : 页面解析后端，'bs4'（兼容性最好）或'lxml'（更快），也可以直接传入UjPageParser实例
+            parse_executor (Executor): 解析页面的执行器，例如create_parse_executor()创建的进程池。
+                为None时在事件循环中直接解析；指定后原始页面字节交给执行器解析，事件循环只负责下载。
+                执行器由调用方负责关闭
+            rate_limiter (RateLimiter): 按站点的限流器，所有方法的请求都经过它；可以在多个爬虫实例间共享。
+                为None时创建一个默认的限流器
+            retry_policy (RetryPolicy): 暂时性失败的重试和退避策略，为None时使用默认策略
+            circuit_breakers (CircuitBreakers): 按站点的熔断器，为None时使用默认配置
+            connection_options (ConnectionOptions): 作为异步上下文管理器使用时，爬虫自有会话的连接池配置
+            catalog (CatalogStore): 本地小说目录，记录获取到的所有元数据、章节列表和列表查询结果，
+                作者和关键词查询按catalog_policy优先在本地回答；为None时不使用本地目录
+            catalog_policy (CatalogPolicy): 何时用本地目录回答查询、何时请求站点，为None时使用默认策略
+            archive_codec (ChapterCodec): 指定后下载的小说保存为逐章压缩、带索引的归档（.nca），
+                可以用NovelArchiveReader随机读取任意一章；为None时保存为纯文本.txt文件
+            metrics (CrawlMetrics): 请求各阶段、解析和写文件的耗时及计数；请求阶段的耗时只在爬虫自有会话上采集。
+                为None时不采集
+            scheduler (RequestScheduler): 全局请求调度器，按优先级类别和小说公平分配请求名额；
+                可以在多个爬虫实例间共享。为None时创建一个默认的调度器。
+                调用方传入的semaphore同样只在单次请求期间持有
+            hedge_policy (HedgePolicy): 对冲请求策略和按接口类型的单次请求超时，请求耗时超过阈值时再发出一个
+                相同的请求，先成功的作为结果；可以在多个爬虫实例间共享。为None时不对冲、不单独设置超时
+            stream_pages (bool): 目录页、标签列表页和作者作品页边下载边用增量解析器解析，不构建整个页面的DOM；
+                下载整本小说时，目录还在下载就开始获取已经解析出的章节。解析出的条目仍然全部保留，
+                内存占用随目录大小增长，只是不再有DOM。这些页面不经过parse_executor，
+                增量解析直接在事件循环中运行，比lxml后端慢
+            file_writer (BulkFileWriter): 纯文本小说交给批量写入器写入，多章合并为一次系统调用，
+                不再每章经过一次线程池；可以在多个爬虫实例间共享，由调用方负责关闭。
+                为None时逐章通过aiofiles写入。对归档（archive_codec）不起作用
+        """
+        super().__init__(connection_options)
+        self.cache = cache
+        self.parse_executor = parse_executor
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breakers = circuit_breakers if circuit_breakers is not None else CircuitBreakers()
+        self.catalog = catalog
+        self.catalog_policy = catalog_policy if catalog_policy is not None else CatalogPolicy()
+        self.archive_codec = archive_codec
+        self.metrics = metrics
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.hedge_policy = hedge_policy
+        self.stream_pages = stream_pages
+        self.file_writer = file_writer
+        self.parser = parser if isinstance(parser, UjPageParser) else create_uj_page_parser(
+            parser, self.base_url, self.encoding)
+
+    def _trace_configs(self) -> list[aiohttp.TraceConfig]:
+        trace_configs = super()._trace_configs()
+        if self.metrics is not None:
+            trace_configs.append(self.metrics.trace_config())
+        return trace_configs
+
+    def _phase(self, phase: str, kind: str):
+        """统计一个阶段的耗时，没有配置metrics时什么也不做"""
+        return self.metrics.phase(phase, kind) if self.metrics is not None else nullcontext()
+
+    def _observe(self, phase: str, kind: str, seconds: float) -> None:
+        if self.metrics is not None:
+            self.metrics.observe(phase, kind, seconds)
+
+    async def close(self) -> None:
+        await super().close()
+        if self.catalog is not None:
+            await asyncio.to_thread(self.catalog.flush)
+
+    async def _record(self, method: str, *args) -> None:
+        """把爬取到的数据写入本地目录，没有配置本地目录时什么也不做"""
+        if self.catalog is not None:
+            await asyncio.to_thread(getattr(self.catalog, method), *args)
+
+    async def _lookup_local(self, kind: str, key: str, wanted: Optional[int], query: Callable, *args):
+        """按catalog_policy判断能否用本地目录回答查询，能时返回本地结果，否则返回None"""
+        if self.catalog is None:
+            return None
+        novels, newest_seen_at = await asyncio.to_thread(query, *args)
+        queried_at = await asyncio.to_thread(self.catalog.queried_at, kind, key, wanted)
+        if not self.catalog_policy.use_local(kind, wanted, len(novels), newest_seen_at, queried_at):
+            return None
+        return novels[:wanted] if wanted else novels
+
+    async def _record_listing(
+            self,
+            kind: str,
+            key: str,
+            novels: list[tuple[str, str, str]],
+            site_tag: str = None,
+            limit: int = None
+    ):
+        """
+        把列表查询的结果写入本地目录，URL按规范化后的形式保存。
+
+        参数:
+            limit (int): 查询只取了前limit个结果；结果少于limit个时站点已经给出了全部结果，按完整的结果记录
+        """
+        if self.catalog is not None:
+            novels = [(title, author, self.normalize_url(url)) for title, author, url in novels]
+            if limit is not None and len(novels) < limit:
+                limit = None
+            await asyncio.to_thread(self.catalog.put_listing, kind, key, novels, site_tag, limit)
 
     async def _prepare_resources(self, session=None, semaphore=None):
         """准备session和semaphore资源"""
         should_close_session = False
 
+        if session is None:
+            session = self.session      # 优先使用爬虫自有的长连接会话
         if session is None:
             session = aiohttp.ClientSession(headers=self.headers)
             should_close_session = True     # 需要最后手动释放session
 
         if semaphore is None:
-            semaphore = asyncio.Semaphore(10)   # 默认并发数
+            semaphore = nullcontext()   # 并发数默认由scheduler统一分配，请求速率由rate_limiter按站点自适应控制
 
         return session, semaphore, should_close_session
 
+    async def _fetch(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            kind: str,
+            data: dict = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> bytes:
+        """
+        所有页面请求的统一入口，返回响应体原始字节。
+
+        配置了缓存时，有效期内的缓存直接返回；过期的缓存携带ETag/Last-Modified发起条件请求，304时沿用缓存。
+        成功的响应在解析之前就写入缓存，调用方应通过_parse_fetched解析，解析失败时删除这条缓存。
+        暂时性失败按retry_policy退避重试，站点连续失败时由熔断器直接拒绝请求。
+
+        参数:
+            session : 异步HTTP会话对象
+            url (str): 请求URL
+            kind (str): 接口类型，决定缓存有效期，例如'metadata'、'catalog'、'chapter'、'tag'、'author'、'search'
+            data (dict): POST请求体，为None时发起GET请求
+            semaphore : 调用方的并发限制，与调度名额一样只在单次请求期间持有，退避等待期间不占用
+
+        异常:
+            TransientFetchError: 重试用尽后仍然暂时性失败
+            PermanentFetchError: 永久性失败，不会重试
+        """
+        method = 'GET' if data is None else 'POST'
+        cache = self.cache
+        key = cached = None
+        request_headers = {}
+        if cache is not None:
+            key = cache.make_key(method, url, data)
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                if cache.is_fresh(cached, kind):
+                    return cached.body
+                request_headers = cached.validators()
+
+        host = URL(url).host
+        breaker = self.circuit_breakers.for_host(host)
+        semaphore = semaphore if semaphore is not None else nullcontext()
+        request = functools.partial(self._request_once, session, method, url, kind, data, request_headers, host,
+                                    semaphore)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                breaker.before_request(url)
+                if self.hedge_policy is not None:
+                    body, etag, last_modified = await self.hedge_policy.run(kind, request)
+                else:
+                    body, etag, last_modified = await request()
+                breaker.record_success()
+                if body is None:
+                    await asyncio.to_thread(cache.refresh, key)
+                    return cached.body
+                break
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                await self._handle_fetch_error(url, e, breaker, attempt)
+            except BaseException:
+                breaker.record_abort()
+                raise
+        if cache is not None:
+            await asyncio.to_thread(cache.put, key, kind, body, etag, last_modified)
+        return body
+
+    async def _discard_cached(self, url: str, data: dict = None) -> None:
+        """删除_fetch为这个请求写入的缓存"""
+        if self.cache is not None:
+            key = self.cache.make_key('GET' if data is None else 'POST', url, data)
+            await asyncio.to_thread(self.cache.delete, key)
+
+    async def _parse_fetched(self, url: str, data: Optional[dict], kind: str, method: str, *args):
+        """
+        解析_fetch返回的响应体，参数同_parse。
+
+        站点对出错的页面也可能返回200，这样的响应体已经写入了缓存；解析失败时删除缓存，
+        否则章节这类永不过期的缓存会让之后的每次重试都直接得到同一个错误的页面。
+        """
+        try:
+            return await self._parse(kind, method, *args)
+        except Exception:
+            await self._discard_cached(url, data)
+            raise
+
+    async def _handle_fetch_error(self, url: str, e: Exception, breaker, attempt: int) -> None:
+        """处理第attempt次请求的异常：永久性失败或重试用尽时抛出对应的FetchError，否则按退避策略等待"""
+        error = self.retry_policy.classify_exception(url, e)
+        if isinstance(error, PermanentFetchError):
+            # 站点有正常响应（例如404），说明站点本身是可用的
+            breaker.record_success()
+            raise error from e
+        if error.status == 429:
+            # 429只是要求降速，由限流器和退避处理，不代表站点不可用
+            breaker.record_abort()
+        else:
+            breaker.record_failure()
+        if attempt >= self.retry_policy.max_attempts:
+            raise error from e
+        await asyncio.sleep(self.retry_policy.backoff(attempt, error.retry_after))
+
+    def _request_options(self, kind: str) -> dict:
+        """单次请求的额外参数，目前只有hedge_policy中按接口类型配置的超时"""
+        timeout = self.hedge_policy.timeout_for(kind) if self.hedge_policy is not None else None
+        return {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+
+    async def _request_once(
+            self,
+            session: aiohttp.ClientSession,
+            method: str,
+            url: str,
+            kind: str,
+            data: Optional[dict],
+            headers: dict,
+            host: str,
+            semaphore
+    ) -> tuple[Optional[bytes], Optional[str], Optional[str]]:
+        """
+        发出一次请求，返回(响应体, ETag, Last-Modified)；携带了缓存验证字段且站点返回304时响应体为None。
+
+        调用方的semaphore、调度名额和限流名额只在单次请求期间持有，退避等待期间让给其他请求；
+        对冲时同一请求会被调用两次。
+        """
+        async with semaphore, self.scheduler.slot(kind), self.rate_limiter.for_host(host).slot() as slot:
+            async with session.request(method, url, data=data, headers=headers,
+                                       trace_request_ctx={'kind': kind}, **self._request_options(kind)) as response:
+                slot.record_status(response.status)
+                if response.status == 304 and headers:
+                    return None, None, None
+                if response.status >= 400:
+                    raise self.retry_policy.classify_status(url, response.status, response.headers)
+                with self._phase('download', kind):
+                    body = await response.read()
+                return body, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    async def _stream_parse(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            kind: str,
+            parser: StreamPageParser,
+            semaphore: asyncio.Semaphore = None
+    ) -> AsyncIterator:
+        """
+        流式请求并解析一个GET页面：响应体按块交给增量解析器，边下载边产出解析出的条目，不构建整个页面的DOM。
+
+        缓存、熔断、限流、调度和重试与_fetch相同。中途失败重试时从头重新解析，跳过已经产出的条目，
+        调用方不会收到重复的条目。不保留整个页面的DOM，但配置了缓存时会保留原始字节写入缓存。
+        解析直接在事件循环中进行，不经过parse_executor。
+        产出条目时仍然持有调用方的semaphore、调度和限流名额，消费条目期间不能等待其他请求，
+        否则名额不足时会互相等待而死锁；对外提供的迭代器应通过ReadAhead在后台任务中读取。
+
+        参数:
+            parser (StreamPageParser): 增量解析器，每次尝试前重置
+            semaphore : 调用方的并发限制，只在请求期间持有
+        """
+        semaphore = semaphore if semaphore is not None else nullcontext()
+        # 解析穿插在下载之间，累计每次喂入的耗时，整个页面记一次parse阶段，与非流式解析可以直接比较
+        parse_seconds = 0.0
+
+        def parse(step, *args) -> list:
+            nonlocal parse_seconds
+            start = time.perf_counter()
+            try:
+                return step(*args)
+            finally:
+                parse_seconds += time.perf_counter() - start
+
+        cache = self.cache
+        key = cached = None
+        request_headers = {}
+        if cache is not None:
+            key = cache.make_key('GET', url, None)
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                if cache.is_fresh(cached, kind):
+                    parser.reset()
+                    items = parse(parser.feed_bytes, cached.body) + parse(parser.close)
+                    self._observe('parse', kind, parse_seconds)
+                    for item in items:
+                        yield item
+                    return
+                request_headers = cached.validators()
+
+        host = URL(url).host
+        breaker = self.circuit_breakers.for_host(host)
+        produced = attempt = 0
+        while True:
+            attempt += 1
+            parser.reset()
+            parsed = 0
+            body = bytearray() if cache is not None else None
+            try:
+                breaker.before_request(url)
+                async with semaphore, self.scheduler.slot(kind), self.rate_limiter.for_host(host).slot() as slot:
+                    async with session.get(url, headers=request_headers, trace_request_ctx={'kind': kind},
+                                           **self._request_options(kind)) as response:
+                        slot.record_status(response.status)
+                        not_modified = response.status == 304 and bool(request_headers)
+                        if response.status >= 400:
+                            raise self.retry_policy.classify_status(url, response.status, response.headers)
+                        if not not_modified:
+                            async for chunk in response.content.iter_chunked(self.stream_chunk_size):
+                                if body is not None:
+                                    body += chunk
+                                for item in parse(parser.feed_bytes, chunk):
+                                    parsed += 1
+                                    if parsed > produced:
+                                        produced = parsed
+                                        yield item
+                            etag = response.headers.get('ETag')
+                            last_modified = response.headers.get('Last-Modified')
+                breaker.record_success()
+                if not_modified:
+                    await asyncio.to_thread(cache.refresh, key)
+                    rest = parse(parser.feed_bytes, cached.body) + parse(parser.close)
+                else:
+                    rest = parse(parser.close)
+                    if cache is not None:
+                        await asyncio.to_thread(cache.put, key, kind, bytes(body), etag, last_modified)
+                self._observe('parse', kind, parse_seconds)
+                for item in rest:
+                    parsed += 1
+                    if parsed > produced:
+                        produced = parsed
+                        yield item
+                return
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                await self._handle_fetch_error(url, e, breaker, attempt)
+            except BaseException:
+                breaker.record_abort()
+                raise
+
+    async def _crawl(
+            self,
+            url: str,
+            kind: str,
+            parse_method: str,
+            parse_args: tuple = (),
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None,
+            data: dict = None
+    ) -> CrawlResult:
+        """
+        请求一个页面并解析，把请求和解析过程中的各种失败统一转换为CrawlResult。
+
+        对同一页面、同一解析方式的并发调用合并为一次请求，parse_args和data需要可哈希。
+        """
+        async def crawl():
+            nonlocal session, semaphore
+            session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
+            try:
+                body = await self._fetch(session, url, kind, data, semaphore)
+                return CrawlResult.success(
+                    await self._parse_fetched(url, data, kind, parse_method, body, *parse_args), url)
+            except TransientFetchError as e:
+                return CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error=str(e), url=url)
+            except PermanentFetchError as e:
+                return CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=str(e), url=url)
+            except Exception as e:
+                # 页面结构不符合预期，解析失败，重试同一个页面也不会成功
+                return CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=f'{type(e).__name__}: {e}', url=url)
+            finally:
+                if should_close_session:
+                    await session.close()
+
+        form = tuple(sorted(data.items())) if data is not None else None
+        result = await self._coalesce((parse_method, parse_args, form), url, crawl)
+        if self.metrics is not None:
+            self.metrics.count_result(kind, result.status.value)
+        return result
+
+    async def _parse(self, kind: str, method: str, *args):
+        """
+        调用解析器的method方法，配置了parse_executor时交给执行器，避免CPU密集的解析阻塞事件循环。
+        耗时按接口类型kind记入parse阶段，与同一接口的请求各阶段使用相同的标签
+        """
+        parse = getattr(self.parser, method)
+        with self._phase('parse', kind):
+            if self.parse_executor is None:
+                return parse(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.parse_executor, parse, *args)
+
     # 请确保输入url为小说详情页的url，如《大丰打更人》的详情页url为：http://www.ujxsw.org/book/1022/
+    async def get_novel_metadata_result_async(
+            self,
+            url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> CrawlResult[NovelMetadata]:
+        # 小说ID取自URL，按规范化后的URL解析，同一页面的不同写法可以合并为一次请求
+        normalized_url = self.normalize_url(url)
+        result = await self._crawl(url, 'metadata', 'parse_metadata', (normalized_url,), session, semaphore)
+        if result.ok:
+            await self._record('put_novel', normalized_url, result.value)
+        return result
+
     async def get_novel_metadata_async(
             self,
             url: str,
             session: aiohttp.ClientSession = None,
             semaphore: asyncio.Semaphore = None
     ) -> NovelMetadata:
-        session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
+        result = await self.get_novel_metadata_result_async(url, session, semaphore)
+        if result.ok:
+            return result.value
+        print(f"获取小说具体信息失败：{result.error}")
+        # 返回默认值
+        detail_info = NovelMetadata(
+            id="",
+            title="",
+            author="",
+            tag="",
+            status="",
+            word_count=0,
+            update_time="",
+            description="",
+            cover_url="",
+            catalog_url=""
+        )
+        return detail_info
+
+    # 请确保输入的章节列表url是目录列表的url，比如《大丰打更人》的目录列表url为：http://www.ujxsw.org/read/1022/
+    async def get_novel_chapters_list_result_async(
+            self,
+            url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> CrawlResult[list[tuple[str, str]]]:
+        if self.stream_pages:
+            session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
+            try:
+                return await self._catalog_result(url, ReadAhead(self._stream_catalog(url, session, semaphore)))
+            finally:
+                if should_close_session:
+                    await session.close()
+        result = await self._crawl(url, 'catalog', 'parse_chapters_list', (), session, semaphore)
+        if result.ok:
+            await self._record('put_chapters_list', self.normalize_url(url), result.value)
+        return result
+
+    def _stream_catalog(
+            self,
+            url: str,
+            session: aiohttp.ClientSession,
+            semaphore: asyncio.Semaphore = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        return self._stream_parse(session, url, 'catalog', CatalogStreamParser(self.base_url, self.encoding), semaphore)
+
+    async def _catalog_result(self, url: str, catalog: ReadAhead) -> CrawlResult[list[tuple[str, str]]]:
+        """等待流式解析的目录读完，把失败统一转换为CrawlResult，成功时写入本地目录"""
         try:
-            novel_id = (url.split('/')[-2] if url.endswith('/') else url.split('/')[-1]).replace('.html', '')
-            async with semaphore:
-                async with session.get(url) as response:
-                    text = await response.text()
-                    novel_info = BeautifulSoup(text, 'html.parser').find('div', id='maininfo').find('div', id='bookinfo')
-                    novel_left = novel_info.find('div', class_='bookleft')
-                    novel_right = novel_info.find('div', class_='bookright')
-                    novel_cover_url = novel_left.find('img')['src']
-                    h1 = novel_right.find('h1')
-                    novel_title = h1.contents[0].strip()
-                    novel_author = h1.find('em').find('a').get_text()
-                    count_div = novel_right.find('div', id='count')
-                    spans = count_div.find_all('span', class_='pd_r')
-                    novel_tag = spans[0].get_text().strip()
-                    clicks = spans[1].get_text().strip()
-                    recommends = spans[2].get_text().strip()
-                    favorites = spans[3].get_text().strip()
-                    novel_word_count = spans[4].get_text().strip()
-                    if 'K' in novel_word_count:
-                        novel_word_count = novel_word_count.replace('K', '')
-                        novel_word_count = int(novel_word_count) * 1000
-                    elif 'W' in novel_word_count:
-                        novel_word_count = novel_word_count.replace('W', '')
-                        novel_word_count = int(novel_word_count) * 10000
-                    else:
-                        novel_word_count = int(novel_word_count)
-                    intro_div = novel_right.find('div', id='bookintro')
-                    intro_lines = [line.strip() for line in intro_div.stripped_strings]
-                    novel_description = ''.join(intro_lines)
-                    latest_div = novel_right.find('div', class_='new')
-                    latest_chapter_tag = latest_div.find('span', class_='new_t').find('a')
-                    latest_chapter_title = latest_chapter_tag.get_text()
-                    latest_chapter_url = latest_chapter_tag['href']
-                    update_span = latest_div.find('span', class_='new_p')
-                    novel_update_time = update_span.get_text().replace('更新时间：', '').strip()
-                    diff_days = datetime.now() - datetime.strptime(novel_update_time, '%Y-%m-%d')
-                    novel_status = '完结' if diff_days.days > 30 else '连载'
-                    novel_catalog_url = novel_right.find('div', class_='motion').find('a', string='目录列表')['href']
-                    detail_info = NovelMetadata(
-                        id=novel_id,
-                        title=novel_title,
-                        author=novel_author,
-                        tag=novel_tag,
-                        status=novel_status,
-                        word_count=novel_word_count,
-                        update_time=novel_update_time,
-                        description=novel_description,
-                        cover_url=novel_cover_url,
-                        catalog_url=self.base_url[:-1] + novel_catalog_url
-                    )
-                    return detail_info
+            result = CrawlResult.success(await catalog.wait(), url)
+        except TransientFetchError as e:
+            result = CrawlResult(CrawlStatus.TRANSIENT_FAILURE, error=str(e), url=url)
+        except PermanentFetchError as e:
+            result = CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=str(e), url=url)
         except Exception as e:
-            print(f"获取小说具体信息失败：{e}")
-            # 返回默认值
-            detail_info = NovelMetadata(
-                id="",
-                title="",
-                author="",
-                tag="",
-                status="",
-                word_count=0,
-                update_time="",
-                description="",
-                cover_url="",
-                catalog_url=""
-            )
-            return detail_info
-        finally:
-            if should_close_session:
-                await session.close()
+            result = CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=f'{type(e).__name__}: {e}', url=url)
+        if self.metrics is not None:
+            self.metrics.count_result('catalog', result.status.value)
+        if result.ok:
+            await self._record('put_chapters_list', self.normalize_url(url), result.value)
+        return result
 
-    # 请确保输入的章节列表url是目录列表的url，比如《大丰打更人》的目录列表url为：http://www.ujxsw.org/read/1022/
-    async def get_novel_chapters_list_async(
+    async def iter_novel_chapters_list_async(
             self,
             url: str,
             session: aiohttp.ClientSession = None,
             semaphore: asyncio.Semaphore = None
-    ) -> list[tuple[str, str]]:
+    ) -> AsyncIterator[tuple[str, str]]:
+        """
+        边下载边解析目录页，依次产出(章节标题, 章节内容URL链接)，不论stream_pages是否开启。
+
+        目录在后台任务中读取，请求名额不会在产出章节时被占用，调用方可以在迭代中用同一个semaphore请求章节；
+        已经解析出的章节保留到迭代结束。失败时抛出TransientFetchError或PermanentFetchError，
+        此前已经产出的章节仍然有效。
+        """
         session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
+        catalog = ReadAhead(self._stream_catalog(url, session, semaphore))
         try:
-            async with semaphore:
-                async with session.get(url) as response:
-                    response.encoding = 'utf-8'
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    chapter_list_ul = soup.find('div', id='readerlist').find('ul')
-                    li_list = chapter_list_ul.find_all('li')
-                    chapters_list = []
-                    for li in li_list:
-                        if li.get('class') and 'fj' in li['class']:
-                            continue
-                        a_tag = li.find('a')
-                        if a_tag:
-                            chapter_title = a_tag.get_text(strip=True)
-                            chapter_url = a_tag['href']
-                            chapter_url = self.base_url[:-1] + chapter_url
-                            chapters_list.append((chapter_title, chapter_url))
-                    return chapters_list
-        except Exception as e:
-            print(f"获取小说章节列表失败：{e}")
-            # 返回默认值
-            return []
+            async with aclosing(catalog.iter_from()) as chapters:
+                async for chapter in chapters:
+                    yield chapter
+            await catalog.wait()
         finally:
+            await catalog.aclose()
             if should_close_session:
                 await session.close()
 
+    async def get_novel_chapters_list_async(
+            self,
+            url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> list[tuple[str, str]]:
+        result = await self.get_novel_chapters_list_result_async(url, session, semaphore)
+        if result.ok:
+            return result.value
+        print(f"获取小说章节列表失败：{result.error}")
+        # 返回默认值
+        return []
+
     # 请确保输入的章节url是章节详情的url，比如《大丰打更人》的某一章节url为：'http://www.ujxsw.org/read/1022/28248683.html'
+    async def get_novel_chapter_content_result_async(
+            self,
+            chapter_url: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> CrawlResult[str]:
+        return await self._crawl(chapter_url, 'chapter', 'parse_chapter_content', (), session, semaphore)
+
     async def get_novel_chapter_content_async(
             self,
             chapter_url: str,
             session: aiohttp.ClientSession = None,
             semaphore: asyncio.Semaphore = None
     ) -> str:
+        result = await self.get_novel_chapter_content_result_async(chapter_url, session, semaphore)
+        if result.ok:
+            return result.value
+        print(f"获取小说章节内容失败：{result.error}")
+        # 返回默认值
+        return ""
+
+    async def _iter_tag_pages(
+            self,
+            tag: str,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None,
+            prefetch: int = None
+    ) -> AsyncIterator[tuple[list[tuple[str, str, str]], list[dict]]]:
+        """按顺序逐页产出标签列表页中的(小说列表, 排序字段)，最多提前预取prefetch页"""
+        if tag not in self.tags_list:
+            raise ValueError(f"{tag} 不在标签列表中")
+        prefetch = prefetch or self.tag_page_prefetch
         session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
         try:
-            async with semaphore:
-                async with session.get(chapter_url) as response:
-                    response.encoding = 'utf-8'
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    content_div = soup.find('div', class_='read-content')
-                    text = content_div.get_text(separator='\n', strip=True)
-                    lines = text.split('\n')
-                    cleaned_content = []
-                    ad_keywords = ['最新网址', '免费小说无弹窗', '悠久小説網', '全集TXT电子书免费下载']
-                    for i, line in enumerate(lines):
-                        if (i <= 3 or i >= (len(lines) - 3)) and any(keyword in line for keyword in ad_keywords):
-                            continue
-                        cleaned_content.append(line)
-                    return '\n'.join(cleaned_content)
-        except Exception as e:
-            print(f"获取小说章节列表失败：{e}")
-            # 返回默认值
-            return ""
+            tag_url = self.base_url + tag + '/'
+
+            async def load_page(page_url):
+                if self.stream_pages:
+                    parser = TagPageStreamParser(self.encoding)
+                    async with aclosing(self._stream_parse(session, page_url, 'tag', parser, semaphore)) as entries:
+                        entries = [entry async for entry in entries]
+                    novels, hints = [novel for novel, _ in entries], [hint for _, hint in entries]
+                    total_pages = parser.total_pages
+                else:
+                    body = await self._fetch(session, page_url, 'tag', semaphore=semaphore)
+                    novels, total_pages, hints = await self._parse_fetched(
+                        page_url, None, 'tag', 'parse_tag_page', body)
+                await self._record_listing('tag', tag, novels, tag)
+                return novels, total_pages, hints
+
+            async def fetch_page(page_url):
+                novels, _, hints = await load_page(page_url)
+                return novels, hints
+
+            # 标签首页就是第1页，同时从中获取总页数
+            first_page_novels, total_pages, first_page_hints = await load_page(tag_url)
+            yield first_page_novels, first_page_hints
+            # 后续分页按顺序获取，调用方停止消费后不再请求新的分页
+            page_urls = [tag_url + str(page) + '/' for page in range(2, total_pages + 1)]
+            async with aclosing(ordered_fetch(page_urls, fetch_page, prefetch)) as pages:
+                async for _, page in pages:
+                    yield page
         finally:
             if should_close_session:
                 await session.close()
 
+    async def iter_novel_list_by_tag_async(
+            self,
+            tag: str,
+            top_n: int = None,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None,
+            prefetch: int = None
+    ) -> AsyncIterator[tuple[str, str, str]]:
+        count = 0
+        async with aclosing(self._iter_tag_pages(tag, session, semaphore, prefetch)) as pages:
+            async for novels, _ in pages:
+                for novel in novels:
+                    yield novel
+                    count += 1
+                    if top_n and count >= top_n:
+                        return
+
     async def get_novel_list_by_tag_async(
             self,
             tag: str,
@@ -191,50 +682,41 @@ class UjNovelCrawler(BaseNovelCrawler):
             sort_method: SortStrategy = None,
             session: aiohttp.ClientSession = None,
             semaphore: asyncio.Semaphore = None
-    ) -> list[tuple[str, str, str]]:    # TODO 按照SortStrategy排序以及返回top_n本小说的逻辑尚未实现
+    ) -> list[tuple[str, str, str]]:
         if tag not in self.tags_list:
             print(f"{tag} 不在标签列表中")
             return []
-        session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
         try:
-            tag_url = self.base_url + tag + '/'
-            novel_links = []
-            # 异步获取所有分页链接
-            async with session.get(tag_url) as response:
-                # 先获取总页数
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-                page_link_div = soup.find('div', id='pagelink')
-                match = re.search(r'第\s*\d+\s*/\s*(\d+)\s*页', page_link_div.get_text() if page_link_div else '')
-                total_pages = int(match.group(1)) if match else 0
-
-                async def fetch_with_delay(fetch_session, url):
-                    async with semaphore:   # 这里使用外层的semaphore控制并发数量
-                        async with fetch_session.get(url) as rsp:
-                            fetch_content = await rsp.text()
-                            await asyncio.sleep(random.uniform(0.01, 0.15))
-                            return fetch_content
-
-                # 异步获取所有分页搜索结果页面内容，TODO 此处total_pages可能太多，需要考虑分页？
-                tasks = [fetch_with_delay(session, tag_url + str(page) + '/') for page in
-                         range(1, total_pages + 1)]
-                pages_content = await asyncio.gather(*tasks)
-                # 解析所有页面内容，提取小说链接
-                for content in pages_content:
-                    soup = BeautifulSoup(content, 'html.parser')
-                    for dl in soup.select('div#sitembox dl'):
-                        a_tag = dl.select_one('dd h3 a')
-                        if a_tag:
-                            novel_title = a_tag.get_text(strip=True)
-                            novel_detail_url = a_tag['href']
-                            author_tag = dl.select_one('dd.book_other span a')
-                            author = author_tag.get_text(strip=True) if author_tag else '佚名'
-                            novel_links.append((novel_title, author, novel_detail_url))
-                return novel_links
-
+            if sort_method is None:
+                async with aclosing(self.iter_novel_list_by_tag_async(tag, top_n, session, semaphore)) as novels:
+                    return [novel async for novel in novels]
+            return [novel for novel, _ in await self._select_top_n_by_tag(tag, top_n, sort_method, session, semaphore)]
         except Exception as e:
             print(f"获取标签相关的小说列表失败：{e}")
             return []
+
+    async def _select_top_n_by_tag(
+            self,
+            tag: str,
+            top_n: int,
+            sort_method: SortStrategy,
+            session: aiohttp.ClientSession = None,
+            semaphore: asyncio.Semaphore = None
+    ) -> list[tuple[tuple[str, str, str], NovelMetadata]]:
+        """按sort_method选出标签下排名前top_n的小说，只为可能进入前top_n的候选获取详情页"""
+        session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
+        try:
+            async def candidates():
+                async with aclosing(self._iter_tag_pages(tag, session, semaphore)) as pages:
+                    async for novels, hints in pages:
+                        for novel, hint in zip(novels, hints):
+                            yield novel, hint
+
+            async def fetch_metadata(novel):
+                result = await self.get_novel_metadata_result_async(novel[2], session, semaphore)
+                return result.value if result.ok else None
+
+            return await sort_method.select_top_n(candidates(), top_n, fetch_metadata)
         finally:
             if should_close_session:
                 await session.close()
@@ -248,26 +730,23 @@ class UjNovelCrawler(BaseNovelCrawler):
         search_url = self.base_url + 'author/' + author
         session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
         try:
-            async with semaphore:
-                async with session.get(search_url) as response:
-                    text = await response.text()
-                    if response.status != 200:
-                        raise ValueError('请求失败')
-                    if text is None or text == '':
-                        print("获取到的内容为空，请换一个作者试试")
-                        return []
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('table.booklists tbody tr')
-                    result = []
-                    for row in rows:
-                        title_cell = row.find_all('td')[1]
-                        title_link = title_cell.find('a')
-                        if not title_link:
-                            continue
-                        title = title_link.get_text(strip=True)
-                        url = title_link['href']
-                        result.append((title, author, url))
-                    return result
+            if self.catalog is not None:
+                local = await self._lookup_local('author', author, None, self.catalog.find_by_author, author)
+                if local is not None:
+                    return local
+            if self.stream_pages:
+                parser = AuthorPageStreamParser(author, self.encoding)
+                async with aclosing(self._stream_parse(session, search_url, 'author', parser, semaphore)) as entries:
+                    novels = [novel async for novel in entries]
+            else:
+                body = await self._fetch(session, search_url, 'author', semaphore=semaphore)
+                if not body:
+                    await self._discard_cached(search_url)
+                    print("获取到的内容为空，请换一个作者试试")
+                    return []
+                novels = await self._parse_fetched(search_url, None, 'author', 'parse_author_page', body, author)
+            await self._record_listing('author', author, novels)
+            return novels
         except Exception as e:
             print(f"获取作者相关小说列表失败：{e}")
             return []
@@ -289,26 +768,14 @@ class UjNovelCrawler(BaseNovelCrawler):
         result = []
         session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
         try:
-            async with semaphore:
-                async with session.post(search_url, data=req_body) as response:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    novel_items = soup.select('div.shulist ul')
-                    if not novel_items:
-                        raise ValueError('未找到相关小说')
-                    for i, ul in enumerate(novel_items):
-                        if i >= top_n:
-                            break
-                        # 提取书名和详情页链接
-                        novel_title_tag = ul.select_one('li.three a')
-                        if not novel_title_tag:
-                            continue
-                        novel_title = novel_title_tag.get_text(strip=True)
-                        detail_url = self.base_url[:-1] + novel_title_tag['href']
-                        author_tag = ul.select_one('li.four a')
-                        author = author_tag.get_text(strip=True) if author_tag else '佚名'
-                        result.append((novel_title, author, detail_url))
-                    return result
+            if self.catalog is not None:
+                local = await self._lookup_local('search', keyword, top_n, self.catalog.search, keyword, top_n)
+                if local is not None:
+                    return local
+            body = await self._fetch(session, search_url, 'search', data=req_body, semaphore=semaphore)
+            novels = await self._parse_fetched(search_url, req_body, 'search', 'parse_keyword_page', body, top_n)
+            await self._record_listing('search', keyword, novels, limit=top_n or None)
+            return novels
         except Exception as e:
             print(f"获取作者相关小说列表失败：{e}")
             return []
@@ -316,38 +783,174 @@ class UjNovelCrawler(BaseNovelCrawler):
             if should_close_session:
                 await session.close()
 
+    @asynccontextmanager
+    async def _open_chapter_writer(self, novel_file_path: str, manifest: NovelManifest):
+        """
+        截断清单没有记录的内容，产出追加一章的异步函数：参数为(章节标题, 章节内容)，返回写入文件的字节
+        """
+        if self.archive_codec is None and self.file_writer is not None:
+            # 章节先进入写入线程的缓冲，关闭时才保证全部写出，清单文件在这之后保存；
+            # 中途定期保存的清单可能领先于文件，下次运行时由manifest.verify丢弃没有写出的章节
+            async with self.file_writer.open(novel_file_path, truncate=manifest.end_offset) as f:
+
+                async def write_chapter(title, content):
+                    data = f"{title}\n{content}\n\n".encode('utf-8')
+                    with self._phase('write', 'chapter'):
+                        await f.write(data)
+                    return data
+
+                yield write_chapter
+            return
+        if self.archive_codec is None:
+            async with aiofiles.open(novel_file_path, 'ab') as f:
+                await f.truncate(manifest.end_offset)
+
+                async def write_chapter(title, content):
+                    data = f"{title}\n{content}\n\n".encode('utf-8')
+                    with self._phase('write', 'chapter'):
+                        await f.write(data)
+                        await f.flush()     # 下载过程中文件已写入的部分即可直接阅读
+                    return data
+
+                yield write_chapter
+            return
+        # 压缩是CPU密集的，和文件写入一起放到线程中执行
+        archive = await asyncio.to_thread(NovelArchiveWriter, novel_file_path, self.archive_codec)
+        try:
+            await asyncio.to_thread(archive.truncate, len(manifest.chapters), manifest.end_offset)
+
+            async def write_chapter(title, content):
+                with self._phase('write', 'chapter'):
+                    return await asyncio.to_thread(archive.append, title, content)
+
+            yield write_chapter
+        finally:
+            await asyncio.to_thread(archive.close)
+
     async def write_novel_content_to_file(
             self,
             url: str,
             file_path: str,
             session: aiohttp.ClientSession = None,
-            semaphore: asyncio.Semaphore = None
-    ):
+            semaphore: asyncio.Semaphore = None,
+            chapter_source: ChapterSource = None,
+            metadata: NovelMetadata = None
+    ) -> CrawlResult[str]:
         session, semaphore, should_close_session = await self._prepare_resources(session, semaphore)
+        catalog_stream = None
         try:
-            async with semaphore:
-                novel_detail = await self.get_novel_metadata_async(url, session, semaphore)
+            # 不在整个下载期间持有semaphore，嵌套的请求各自在请求期间占用名额，小的并发上限也不会死锁；
+            # 这本小说的所有请求归入同一个流，与同时下载的其他小说公平分配名额
+            with self.scheduler.flow(self.normalize_url(url)):
+                novel_detail = metadata
+                if novel_detail is None:
+                    metadata_result = await self.get_novel_metadata_result_async(url, session, semaphore)
+                    if not metadata_result.ok:
+                        print(f"无法获取小说详情：{metadata_result.error}")
+                        return metadata_result
+                    novel_detail = metadata_result.value
+                suffix = '.txt' if self.archive_codec is None else ARCHIVE_SUFFIX
+                novel_file_path = file_path + novel_detail.tag + '/' + novel_detail.title + '_' + novel_detail.author + suffix
+                manifest_path = NovelManifest.path_for(novel_file_path)
+                manifest = await NovelManifest.load(manifest_path)
+                if (manifest.complete and manifest.update_time == novel_detail.update_time
+                        and manifest.word_count == novel_detail.word_count
+                        and os.path.exists(novel_file_path) and os.path.getsize(novel_file_path) == manifest.end_offset):
+                    # 小说自上次完整下载后没有更新，只需要一次详情页请求
+                    return CrawlResult.success(novel_file_path, url)
                 novel_catalog_url = novel_detail.catalog_url
-                novel_chapters_list = await self.get_novel_chapters_list_async(novel_catalog_url, session, semaphore)
-                get_chapter_content_tasks = [self.get_novel_chapter_content_async(chapter_url, session, semaphore)
-                                             for chapter_title, chapter_url in novel_chapters_list]
-                chapters_content_list = await asyncio.gather(*get_chapter_content_tasks)
-
-                async def create_file_if_not_exists(path):
-                    from pathlib import Path
-                    _file_path = Path(path)
-                    if not _file_path.exists():
-                        _file_path.parent.mkdir(parents=True, exist_ok=True)
-                        async with aiofiles.open(_file_path, 'w', encoding='utf-8') as f:
-                            pass
-                novel_file_path = file_path + novel_detail.tag + '/' + novel_detail.title + '_' + novel_detail.author + '.txt'
-                await create_file_if_not_exists(novel_file_path)
-                async with aiofiles.open(novel_file_path, 'a', encoding='utf-8') as f:
-                    for (novel_chapter_title, _), chapter_content in zip(novel_chapters_list, chapters_content_list):
-                        await f.write(f"{novel_chapter_title}\n{chapter_content}\n\n")
+                catalog_stream = chapters_result = None
+                if self.stream_pages and chapter_source is None:
+                    # 目录边下载边解析，已经解析出的章节立即开始获取，不必等整个目录下载完
+                    catalog_stream = ReadAhead(self._stream_catalog(novel_catalog_url, session, semaphore))
+                else:
+                    chapters_result = await self.get_novel_chapters_list_result_async(
+                        novel_catalog_url, session, semaphore)
+                    if not chapters_result.ok:
+                        print(f"无法获取小说目录：{chapters_result.error}")
+                        return chapters_result
+                    novel_chapters_list = chapters_result.value
+
+                # 只保留与最新目录一致、且文件内容校验通过的章节，其余部分截断后重新下载
+                manifest.url = url
+                manifest.complete = False
+                if catalog_stream is None:
+                    manifest.reconcile(novel_chapters_list)
+                    await manifest.verify(novel_file_path)
+                    missing_chapters = novel_chapters_list[len(manifest.chapters):]
+                else:
+                    # 对齐和校验都只截掉末尾的记录，顺序可以交换；先校验文件，同时目录在后台下载
+                    await manifest.verify(novel_file_path)
+                    kept = 0
+                    async with aclosing(catalog_stream.iter_from()) as chapters:
+                        async for _, chapter_url in chapters:
+                            if kept == len(manifest.chapters) or manifest.chapters[kept].url != chapter_url:
+                                break
+                            kept += 1
+                        else:
+                            # 目录在对齐完成之前就结束了，读取失败时不能截断已经下载的章节
+                            chapters_result = await self._catalog_result(novel_catalog_url, catalog_stream)
+                            if not chapters_result.ok:
+                                print(f"无法获取小说目录：{chapters_result.error}")
+                                return chapters_result
+                    manifest.truncate(kept)
+                    missing_chapters = catalog_stream.iter_from(kept)
+                Path(novel_file_path).parent.mkdir(parents=True, exist_ok=True)
+
+                window = self.chapter_window
+                if chapter_source is not None and missing_chapters:
+                    await chapter_source.prepare(novel_detail, novel_chapters_list)
+                    fetch_chapter = chapter_source.fetch
+                    window = chapter_source.window or window
+                else:
+                    async def fetch_chapter(chapter):
+                        # 暂时性失败的章节单独再重试几轮，不影响窗口内其他章节的下载
+                        chapter_result = await self.get_novel_chapter_content_result_async(
+                            chapter[1], session, semaphore)
+                        for _ in range(self.chapter_retry_rounds):
+                            if not chapter_result.retryable:
+                                break
+                            chapter_result = await self.get_novel_chapter_content_result_async(
+                                chapter[1], session, semaphore)
+                        return chapter_result
+
+                result = CrawlResult.success(novel_file_path, url)
+                try:
+                    # 流式写入：章节并发获取，但按目录顺序逐章落盘，整本书不会同时驻留在内存中
+                    async with self._open_chapter_writer(novel_file_path, manifest) as write_chapter, aclosing(
+                            ordered_fetch(missing_chapters, fetch_chapter, window)) as chapters:
+                        async for (novel_chapter_title, chapter_url), chapter_result in chapters:
+                            if not chapter_result.ok:
+                                # 章节获取失败时停在这里，已写入的部分记录在清单中，下次运行只需要从这一章继续
+                                print(f"章节获取失败，下载中断：{novel_chapter_title} {chapter_result.error}")
+                                result = CrawlResult(chapter_result.status, error=f"章节 {novel_chapter_title} 获取失败："
+                                                     f"{chapter_result.error}", url=chapter_url)
+                                break
+                            data = await write_chapter(novel_chapter_title, chapter_result.value)
+                            manifest.append(chapter_url, novel_chapter_title, data)
+                            if len(manifest.chapters) % self.manifest_save_interval == 0:
+                                await manifest.save(manifest_path)
+                        else:
+                            if catalog_stream is not None and chapters_result is None:
+                                # 目录中途读取失败时，已经写入的章节仍然有效，但这次下载并不完整
+                                chapters_result = await self._catalog_result(novel_catalog_url, catalog_stream)
+                                if not chapters_result.ok:
+                                    print(f"无法获取小说目录：{chapters_result.error}")
+                                    result = chapters_result
+                            if result.ok:
+                                manifest.update_time = novel_detail.update_time
+                                manifest.word_count = novel_detail.word_count
+                                manifest.complete = True
+                finally:
+                    # 即使中途出错，也把已经写入的章节记录下来，下次运行从断点继续
+                    await manifest.save(manifest_path)
+                return result
         except Exception as e:
             print(f"写入小说内容到文件失败：{e}")
+            return CrawlResult(CrawlStatus.PERMANENT_FAILURE, error=f'{type(e).__name__}: {e}', url=url)
         finally:
+            if catalog_stream is not None:
+                await catalog_stream.aclose()
             if should_close_session:
                 await session.close()
 
@@ -0,0 +1,372 @@
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+from novel_crawler.NovelCrawlerFactory import NovelMetadata
+
+try:
+    import lxml.html
+except ImportError:     # lxml是可选依赖，只有使用lxml解析后端时才需要
+    lxml = None
+
+
+AD_KEYWORDS = ['最新网址', '免费小说无弹窗', '悠久小説網', '全集TXT电子书免费下载']
+
+
+def parse_word_count(text: str) -> int:
+    """解析形如'123K'、'45W'、'6789'的字数"""
+    if 'K' in text:
+        return int(text.replace('K', '')) * 1000
+    elif 'W' in text:
+        return int(text.replace('W', '')) * 10000
+    return int(text)
+
+
+def clean_chapter_lines(lines: list[str]) -> str:
+    """去掉章节开头和结尾几行中的广告"""
+    cleaned_content = []
+    for i, line in enumerate(lines):
+        if (i <= 3 or i >= (len(lines) - 3)) and any(keyword in line for keyword in AD_KEYWORDS):
+            continue
+        cleaned_content.append(line)
+    return '\n'.join(cleaned_content)
+
+
+def novel_id_from_url(url: str) -> str:
+    return (url.split('/')[-2] if url.endswith('/') else url.split('/')[-1]).replace('.html', '')
+
+
+def novel_status_from_update_time(update_time: str) -> str:
+    diff_days = datetime.now() - datetime.strptime(update_time, '%Y-%m-%d')
+    return '完结' if diff_days.days > 30 else '连载'
+
+
+def parse_listing_hints(text: str) -> dict:
+    """
+    从列表页中一本小说的文本里提取能直接拿到的排序字段，作为排序时的剪枝上界。
+
+    目前支持'字数：123K'和形如'2024-01-31'的更新时间，页面上没有的字段不会出现在结果中。
+    """
+    hints = {}
+    match = re.search(r'字数[:：]\s*(\d+[KW]?)', text)
+    if match:
+        hints['word_count'] = parse_word_count(match.group(1))
+    match = re.search(r'\d{4}-\d{2}-\d{2}', text)
+    if match:
+        hints['update_time'] = match.group(0)
+    return hints
+
+
+def parse_total_pages(text: str) -> int:
+    """从分页栏文本'第 1 / 50 页'中解析总页数"""
+    match = re.search(r'第\s*\d+\s*/\s*(\d+)\s*页', text)
+    return int(match.group(1)) if match else 0
+
+
+class UjPageParser(ABC):
+    """
+    悠久小说网页面解析器的基类。
+
+    所有解析方法都直接接收响应体原始字节，并按站点已知的编码解析，不需要再猜测编码。
+    解析结果只包含元组、字符串和NovelMetadata等普通对象，解析器本身也可以被pickle，
+    因此可以放到进程池中执行。不同解析后端对同一页面必须给出完全相同的结果。
+    """
+    name = ''
+
+    def __init__(self, base_url: str, encoding: str = 'utf-8'):
+        self.base_url = base_url
+        self.encoding = encoding
+
+    @abstractmethod
+    def parse_metadata(self, body: bytes, url: str) -> NovelMetadata:
+        """解析小说详情页"""
+        pass
+
+    @abstractmethod
+    def parse_chapters_list(self, body: bytes) -> list[tuple[str, str]]:
+        """解析小说目录页，返回(章节标题, 章节内容URL链接)"""
+        pass
+
+    @abstractmethod
+    def parse_chapter_content(self, body: bytes) -> str:
+        """解析章节内容页，返回去掉广告后的正文"""
+        pass
+
+    @abstractmethod
+    def parse_tag_page(self, body: bytes) -> tuple[list[tuple[str, str, str]], int, list[dict]]:
+        """
+        解析标签列表页，返回(该页的小说列表, 总页数, 每本小说在列表页上的排序字段)。
+
+        小说信息为(书名, 作者, 详情页URL链接)，排序字段见parse_listing_hints。
+        """
+        pass
+
+    @abstractmethod
+    def parse_author_page(self, body: bytes, author: str) -> list[tuple[str, str, str]]:
+        """解析作者作品列表页"""
+        pass
+
+    @abstractmethod
+    def parse_keyword_page(self, body: bytes, top_n: int) -> list[tuple[str, str, str]]:
+        """解析关键词搜索结果页，最多返回top_n条，没有结果时抛出ValueError"""
+        pass
+
+    def _build_metadata(self, url, title, author, tag, word_count, update_time, description, cover_url,
+                        catalog_url, clicks, recommends, favorites) -> NovelMetadata:
+        return NovelMetadata(
+            id=novel_id_from_url(url),
+            title=title,
+            author=author,
+            tag=tag,
+            status=novel_status_from_update_time(update_time),
+            word_count=parse_word_count(word_count),
+            update_time=update_time,
+            description=description,
+            cover_url=cover_url,
+            catalog_url=self.base_url[:-1] + catalog_url,
+            clicks=parse_word_count(clicks),
+            recommends=parse_word_count(recommends),
+            favorites=parse_word_count(favorites)
+        )
+
+
+class Bs4UjPageParser(UjPageParser):
+    """基于BeautifulSoup的解析后端，兼容性最好，默认使用html.parser"""
+    name = 'bs4'
+
+    def __init__(self, base_url: str, encoding: str = 'utf-8', features: str = 'html.parser'):
+        super().__init__(base_url, encoding)
+        self.features = features
+
+    def _soup(self, body: bytes) -> BeautifulSoup:
+        return BeautifulSoup(body, self.features, from_encoding=self.encoding)
+
+    def parse_metadata(self, body: bytes, url: str) -> NovelMetadata:
+        novel_info = self._soup(body).find('div', id='maininfo').find('div', id='bookinfo')
+        novel_left = novel_info.find('div', class_='bookleft')
+        novel_right = novel_info.find('div', class_='bookright')
+        h1 = novel_right.find('h1')
+        spans = novel_right.find('div', id='count').find_all('span', class_='pd_r')
+        intro_div = novel_right.find('div', id='bookintro')
+        latest_div = novel_right.find('div', class_='new')
+        update_span = latest_div.find('span', class_='new_p')
+        return self._build_metadata(
+            url=url,
+            title=h1.contents[0].strip(),
+            author=h1.find('em').find('a').get_text(),
+            tag=spans[0].get_text().strip(),
+            word_count=spans[4].get_text().strip(),
+            update_time=update_span.get_text().replace('更新时间：', '').strip(),
+            description=''.join(line.strip() for line in intro_div.stripped_strings),
+            cover_url=novel_left.find('img')['src'],
+            catalog_url=novel_right.find('div', class_='motion').find('a', string='目录列表')['href'],
+            clicks=spans[1].get_text().strip(),
+            recommends=spans[2].get_text().strip(),
+            favorites=spans[3].get_text().strip()
+        )
+
+    def parse_chapters_list(self, body: bytes) -> list[tuple[str, str]]:
+        chapter_list_ul = self._soup(body).find('div', id='readerlist').find('ul')
+        chapters_list = []
+        for li in chapter_list_ul.find_all('li'):
+            if li.get('class') and 'fj' in li['class']:
+                continue
+            a_tag = li.find('a')
+            if a_tag:
+                chapters_list.append((a_tag.get_text(strip=True), self.base_url[:-1] + a_tag['href']))
+        return chapters_list
+
+    def parse_chapter_content(self, body: bytes) -> str:
+        content_div = self._soup(body).find('div', class_='read-content')
+        return clean_chapter_lines(content_div.get_text(separator='\n', strip=True).split('\n'))
+
+    def parse_tag_page(self, body: bytes) -> tuple[list[tuple[str, str, str]], int, list[dict]]:
+        soup = self._soup(body)
+        page_link_div = soup.find('div', id='pagelink')
+        total_pages = parse_total_pages(page_link_div.get_text() if page_link_div else '')
+        novel_links = []
+        hints = []
+        for dl in soup.select('div#sitembox dl'):
+            a_tag = dl.select_one('dd h3 a')
+            if a_tag:
+                author_tag = dl.select_one('dd.book_other span a')
+                author = author_tag.get_text(strip=True) if author_tag else '佚名'
+                novel_links.append((a_tag.get_text(strip=True), author, a_tag['href']))
+                hints.append(parse_listing_hints(dl.get_text()))
+        return novel_links, total_pages, hints
+
+    def parse_author_page(self, body: bytes, author: str) -> list[tuple[str, str, str]]:
+        result = []
+        for row in self._soup(body).select('table.booklists tbody tr'):
+            title_link = row.find_all('td')[1].find('a')
+            if not title_link:
+                continue
+            result.append((title_link.get_text(strip=True), author, title_link['href']))
+        return result
+
+    def parse_keyword_page(self, body: bytes, top_n: int) -> list[tuple[str, str, str]]:
+        novel_items = self._soup(body).select('div.shulist ul')
+        if not novel_items:
+            raise ValueError('未找到相关小说')
+        result = []
+        for ul in novel_items[:top_n]:
+            # 提取书名和详情页链接
+            novel_title_tag = ul.select_one('li.three a')
+            if not novel_title_tag:
+                continue
+            author_tag = ul.select_one('li.four a')
+            author = author_tag.get_text(strip=True) if author_tag else '佚名'
+            result.append((novel_title_tag.get_text(strip=True), author, self.base_url[:-1] + novel_title_tag['href']))
+        return result
+
+
+# BeautifulSoup的get_text不包含注释以及这些标签里的文本
+_SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+def _strings(element):
+    """按BeautifulSoup的规则遍历元素内的所有文本片段"""
+    if not isinstance(element.tag, str) or element.tag in _SKIPPED_TEXT_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _get_text(element, strip: bool = False, separator: str = '') -> str:
+    """等价于BeautifulSoup的Tag.get_text"""
+    if strip:
+        return separator.join(s.strip() for s in _strings(element) if s.strip())
+    return separator.join(_strings(element))
+
+
+def _has_class(name: str) -> str:
+    """XPath中匹配class列表包含name的条件"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class LxmlUjPageParser(UjPageParser):
+    """基于lxml（libxml2）的快速解析后端，直接在原始字节上按站点编码解析"""
+    name = 'lxml'
+
+    def __init__(self, base_url: str, encoding: str = 'utf-8'):
+        if lxml is None:
+            raise ImportError('使用lxml解析后端需要先安装lxml')
+        super().__init__(base_url, encoding)
+
+    def _tree(self, body: bytes):
+        return lxml.html.fromstring(body, parser=lxml.html.HTMLParser(encoding=self.encoding))
+
+    @staticmethod
+    def _first(element, xpath: str):
+        found = element.xpath(xpath)
+        if not found:
+            raise ValueError(f'页面中未找到节点：{xpath}')
+        return found[0]
+
+    def parse_metadata(self, body: bytes, url: str) -> NovelMetadata:
+        novel_info = self._first(self._tree(body), "//div[@id='maininfo']//div[@id='bookinfo']")
+        novel_left = self._first(novel_info, f".//div[{_has_class('bookleft')}]")
+        novel_right = self._first(novel_info, f".//div[{_has_class('bookright')}]")
+        h1 = self._first(novel_right, './/h1')
+        count_div = self._first(novel_right, ".//div[@id='count']")
+        spans = count_div.xpath(f".//span[{_has_class('pd_r')}]")
+        intro_div = self._first(novel_right, ".//div[@id='bookintro']")
+        latest_div = self._first(novel_right, f".//div[{_has_class('new')}]")
+        update_span = self._first(latest_div, f".//span[{_has_class('new_p')}]")
+        motion_div = self._first(novel_right, f".//div[{_has_class('motion')}]")
+        return self._build_metadata(
+            url=url,
+            title=h1.text.strip(),
+            author=_get_text(self._first(self._first(h1, './/em'), './/a')),
+            tag=_get_text(spans[0]).strip(),
+            word_count=_get_text(spans[4]).strip(),
+            update_time=_get_text(update_span).replace('更新时间：', '').strip(),
+            description=_get_text(intro_div, strip=True),
+            cover_url=self._first(novel_left, './/img').get('src'),
+            catalog_url=self._first(motion_div, ".//a[.='目录列表']").get('href'),
+            clicks=_get_text(spans[1]).strip(),
+            recommends=_get_text(spans[2]).strip(),
+            favorites=_get_text(spans[3]).strip()
+        )
+
+    def parse_chapters_list(self, body: bytes) -> list[tuple[str, str]]:
+        chapter_list_ul = self._first(self._tree(body), "//div[@id='readerlist']//ul")
+        chapters_list = []
+        for li in chapter_list_ul.iter('li'):
+            if 'fj' in (li.get('class') or '').split():
+                continue
+            a_tags = li.xpath('.//a')
+            if a_tags:
+                chapters_list.append((_get_text(a_tags[0], strip=True), self.base_url[:-1] + a_tags[0].get('href')))
+        return chapters_list
+
+    def parse_chapter_content(self, body: bytes) -> str:
+        content_div = self._first(self._tree(body), f"//div[{_has_class('read-content')}]")
+        return clean_chapter_lines(_get_text(content_div, strip=True, separator='\n').split('\n'))
+
+    def parse_tag_page(self, body: bytes) -> tuple[list[tuple[str, str, str]], int, list[dict]]:
+        tree = self._tree(body)
+        page_link_divs = tree.xpath("//div[@id='pagelink']")
+        total_pages = parse_total_pages(_get_text(page_link_divs[0]) if page_link_divs else '')
+        novel_links = []
+        hints = []
+        for dl in tree.xpath("//div[@id='sitembox']//dl"):
+            a_tags = dl.xpath('.//dd//h3//a')
+            if a_tags:
+                author_tags = dl.xpath(f".//dd[{_has_class('book_other')}]//span//a")
+                author = _get_text(author_tags[0], strip=True) if author_tags else '佚名'
+                novel_links.append((_get_text(a_tags[0], strip=True), author, a_tags[0].get('href')))
+                hints.append(parse_listing_hints(_get_text(dl)))
+        return novel_links, total_pages, hints
+
+    def parse_author_page(self, body: bytes, author: str) -> list[tuple[str, str, str]]:
+        result = []
+        for row in self._tree(body).xpath(f"//table[{_has_class('booklists')}]//tbody//tr"):
+            title_links = list(row.iter('td'))[1].xpath('.//a')
+            if not title_links:
+                continue
+            result.append((_get_text(title_links[0], strip=True), author, title_links[0].get('href')))
+        return result
+
+    def parse_keyword_page(self, body: bytes, top_n: int) -> list[tuple[str, str, str]]:
+        novel_items = self._tree(body).xpath(f"//div[{_has_class('shulist')}]//ul")
+        if not novel_items:
+            raise ValueError('未找到相关小说')
+        result = []
+        for ul in novel_items[:top_n]:
+            # 提取书名和详情页链接
+            novel_title_tags = ul.xpath(f".//li[{_has_class('three')}]//a")
+            if not novel_title_tags:
+                continue
+            author_tags = ul.xpath(f".//li[{_has_class('four')}]//a")
+            author = _get_text(author_tags[0], strip=True) if author_tags else '佚名'
+            result.append((_get_text(novel_title_tags[0], strip=True), author,
+                           self.base_url[:-1] + novel_title_tags[0].get('href')))
+        return result
+
+
+PARSER_BACKENDS = {
+    Bs4UjPageParser.name: Bs4UjPageParser,
+    LxmlUjPageParser.name: LxmlUjPageParser,
+}
+
+
+def create_uj_page_parser(backend: str, base_url: str, encoding: str = 'utf-8') -> UjPageParser:
+    """
+    按名称创建解析后端。
+
+    参数:
+        backend (str): 解析后端名称，'bs4'或'lxml'
+        base_url (str): 站点根URL，用于拼接相对链接
+        encoding (str): 站点页面编码
+    """
+    parser_class = PARSER_BACKENDS.get(backend)
+    if parser_class is None:
+        raise ValueError(f"未知的解析后端 '{backend}'，可选：{', '.join(PARSER_BACKENDS)}")
+    return parser_class(base_url, encoding)
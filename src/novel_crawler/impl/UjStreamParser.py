@@ -0,0 +1,324 @@
+import codecs
+from html.parser import HTMLParser
+
+from novel_crawler.impl.UjPageParser import parse_listing_hints, parse_total_pages
+
+# 没有结束标签的元素
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+# BeautifulSoup的get_text不包含这些标签里的文本
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+def has_class(attrs: dict, name: str) -> bool:
+    return name in (attrs.get('class') or '').split()
+
+
+def join_stripped(strings: list[str]) -> str:
+    """等价于BeautifulSoup的get_text(strip=True)"""
+    return ''.join(s.strip() for s in strings)
+
+
+class StreamPageParser(HTMLParser):
+    """
+    增量页面解析器的基类，基于标准库的html.parser，不需要额外依赖。
+
+    响应体按块喂入feed_bytes，每次返回这一块中新解析出的完整条目；解析器不构建DOM，
+    只保留当前打开的元素栈和正在解析的条目，省下的是整个页面的DOM；产出的条目由调用方保存，
+    目录、标签页和作者页最终仍然会得到完整的列表。解析在调用方的线程中进行（爬虫中即事件循环），
+    纯Python实现，比lxml后端慢，CPU开销并不比非流式解析小。
+    文本按BeautifulSoup的规则处理：相邻的文本片段合并为一个字符串，注释会打断字符串，
+    script、style和template中的文本被忽略。结果与UjPageParser对同一页面的解析结果一致。
+
+    子类实现start_element、end_element、text和finish，用emit产出条目。
+    """
+
+    def __init__(self, encoding: str = 'utf-8'):
+        self.encoding = encoding
+        super().__init__(convert_charrefs=True)
+
+    def reset(self) -> None:
+        """回到初始状态，可以重新解析一个页面"""
+        super().reset()
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        self._stack: list[tuple[str, dict]] = []    # 打开的元素(标签, 属性)，深度从1开始
+        self._strings: list[str] = []
+        self._items: list = []
+
+    def feed_bytes(self, chunk: bytes) -> list:
+        """喂入一块响应体，返回其中新解析出的条目；多字节字符被切断在块边界上也没有关系"""
+        self.feed(self._decoder.decode(chunk))
+        return self._take()
+
+    def close(self) -> list:
+        """页面结束，返回剩余的条目；页面结构不符合预期时抛出ValueError"""
+        self.feed(self._decoder.decode(b'', final=True))
+        super().close()
+        self._flush_text()
+        while self._stack:
+            self._pop()
+        self.finish()
+        return self._take()
+
+    def emit(self, item) -> None:
+        self._items.append(item)
+
+    def ancestors_match(self, start: int, selectors: tuple[tuple[str, str], ...]) -> bool:
+        """
+        深度大于start的祖先元素（不含当前元素）中，是否依次有符合selectors的元素，相当于CSS的后代选择器。
+
+        参数:
+            start (int): 只查看比这个深度更深的祖先
+            selectors : (标签, class)的序列，class为None时不限
+        """
+        matched = 0
+        for tag, attrs in self._stack[start:-1]:
+            if matched == len(selectors):
+                break
+            wanted_tag, wanted_class = selectors[matched]
+            if tag == wanted_tag and (wanted_class is None or has_class(attrs, wanted_class)):
+                matched += 1
+        return matched == len(selectors)
+
+    def start_element(self, tag: str, attrs: dict, depth: int) -> None:
+        pass
+
+    def end_element(self, tag: str, depth: int) -> None:
+        pass
+
+    def text(self, text: str) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        self._stack.append((tag, dict(attrs)))
+        self.start_element(tag, self._stack[-1][1], len(self._stack))
+        if tag in VOID_ELEMENTS:
+            self._pop()
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        self._stack.append((tag, dict(attrs)))
+        self.start_element(tag, self._stack[-1][1], len(self._stack))
+        self._pop()
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        # 与BeautifulSoup一样，结束标签关闭最近的同名元素及其中没有关闭的元素，没有对应的开始标签时忽略
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                while len(self._stack) > i:
+                    self._pop()
+                return
+
+    def handle_data(self, data):
+        if self._stack and self._stack[-1][0] in SKIPPED_TEXT_TAGS:
+            return
+        self._strings.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def _flush_text(self) -> None:
+        if self._strings:
+            text = ''.join(self._strings)
+            self._strings = []
+            self.text(text)
+
+    def _pop(self) -> None:
+        depth = len(self._stack)
+        tag, _ = self._stack.pop()
+        self.end_element(tag, depth)
+
+    def _take(self) -> list:
+        items, self._items = self._items, []
+        return items
+
+
+class CatalogStreamParser(StreamPageParser):
+    """目录页的增量解析，产出(章节标题, 章节内容URL链接)，与parse_chapters_list的结果一致"""
+
+    def __init__(self, base_url: str, encoding: str = 'utf-8'):
+        self.base_url = base_url
+        super().__init__(encoding)
+
+    def reset(self) -> None:
+        super().reset()
+        self._list_depth = None     # div#readerlist
+        self._ul_depth = None       # 其中的第一个ul
+        self._li_depth = None
+        self._a_depth = None
+        self._done = False
+        self._li_wanted = False     # 当前li还没有取到第一个链接，且不是分组标题（class="fj"）
+        self._href = None
+        self._title: list[str] = []
+
+    def start_element(self, tag, attrs, depth):
+        if self._done:
+            return
+        if self._list_depth is None:
+            if tag == 'div' and attrs.get('id') == 'readerlist':
+                self._list_depth = depth
+        elif self._ul_depth is None:
+            if tag == 'ul':
+                self._ul_depth = depth
+        elif tag == 'li':
+            if self._li_depth is None:
+                self._li_depth = depth
+                self._li_wanted = not has_class(attrs, 'fj')
+        elif tag == 'a' and self._li_wanted:
+            self._li_wanted = False
+            self._a_depth = depth
+            self._href = attrs.get('href')
+            self._title = []
+
+    def text(self, text):
+        if self._a_depth is not None:
+            self._title.append(text)
+
+    def end_element(self, tag, depth):
+        if depth == self._a_depth:
+            self._a_depth = None
+            if self._href is None:
+                raise ValueError('章节链接缺少href')
+            self.emit((join_stripped(self._title), self.base_url[:-1] + self._href))
+        elif depth == self._li_depth:
+            self._li_depth = None
+        elif depth == self._ul_depth or depth == self._list_depth:
+            self._done = True
+
+    def finish(self):
+        if self._ul_depth is None:
+            raise ValueError('页面中未找到目录列表')
+
+
+class TagPageStreamParser(StreamPageParser):
+    """
+    标签列表页的增量解析，产出((书名, 作者, 详情页URL链接), 排序字段)，与parse_tag_page的结果一致。
+
+    分页栏在页面末尾，页面读完后total_pages为总页数。
+    """
+
+    def reset(self) -> None:
+        super().reset()
+        self.total_pages = 0
+        self._box_depth = None      # div#sitembox
+        self._box_done = False
+        self._pagelink_depth = None
+        self._pagelink_done = False
+        self._pagelink_text: list[str] = []
+        self._dl_depth = None
+        self._title_depth = self._author_depth = None
+        self._reset_novel()
+
+    def _reset_novel(self) -> None:
+        self._dl_text: list[str] = []
+        self._title: list[str] = []
+        self._author: list[str] = []
+        self._href = None
+        self._title_found = self._author_found = False
+
+    def start_element(self, tag, attrs, depth):
+        if tag == 'div' and self._pagelink_depth is None and not self._pagelink_done and attrs.get('id') == 'pagelink':
+            self._pagelink_depth = depth
+        if self._box_depth is None:
+            if tag == 'div' and not self._box_done and attrs.get('id') == 'sitembox':
+                self._box_depth = depth
+        elif self._dl_depth is None:
+            if tag == 'dl':
+                self._dl_depth = depth
+                self._reset_novel()
+        elif tag == 'a':
+            if not self._title_found and self.ancestors_match(self._dl_depth, (('dd', None), ('h3', None))):
+                self._title_found = True
+                self._title_depth = depth
+                self._href = attrs.get('href')
+            elif not self._author_found and self.ancestors_match(self._dl_depth,
+                                                                 (('dd', 'book_other'), ('span', None))):
+                self._author_found = True
+                self._author_depth = depth
+
+    def text(self, text):
+        if self._pagelink_depth is not None:
+            self._pagelink_text.append(text)
+        if self._dl_depth is not None:
+            self._dl_text.append(text)
+            if self._title_depth is not None:
+                self._title.append(text)
+            if self._author_depth is not None:
+                self._author.append(text)
+
+    def end_element(self, tag, depth):
+        if depth == self._pagelink_depth:
+            self._pagelink_depth = None
+            self._pagelink_done = True
+            self.total_pages = parse_total_pages(''.join(self._pagelink_text))
+        if depth == self._title_depth:
+            self._title_depth = None
+        elif depth == self._author_depth:
+            self._author_depth = None
+        elif depth == self._dl_depth:
+            self._dl_depth = None
+            if self._title_found:
+                if self._href is None:
+                    raise ValueError('小说链接缺少href')
+                author = join_stripped(self._author) if self._author_found else '佚名'
+                self.emit(((join_stripped(self._title), author, self._href),
+                           parse_listing_hints(''.join(self._dl_text))))
+        elif depth == self._box_depth:
+            self._box_depth = None
+            self._box_done = True
+
+
+class AuthorPageStreamParser(StreamPageParser):
+    """作者作品列表页的增量解析，产出(书名, 作者, 详情页URL链接)，与parse_author_page的结果一致"""
+
+    def __init__(self, author: str, encoding: str = 'utf-8'):
+        self.author = author
+        super().__init__(encoding)
+
+    def reset(self) -> None:
+        super().reset()
+        self._tr_depth = None
+        self._tds = 0
+        self._title_td_depth = None     # 每行第二个单元格是书名
+        self._a_depth = None
+        self._link_found = False
+        self._href = None
+        self._title: list[str] = []
+
+    def start_element(self, tag, attrs, depth):
+        if self._tr_depth is None:
+            if tag == 'tr' and self.ancestors_match(0, (('table', 'booklists'), ('tbody', None))):
+                self._tr_depth = depth
+                self._tds = 0
+                self._link_found = False
+        elif tag == 'td':
+            self._tds += 1
+            if self._tds == 2:
+                self._title_td_depth = depth
+        elif tag == 'a' and self._title_td_depth is not None and not self._link_found:
+            self._link_found = True
+            self._a_depth = depth
+            self._href = attrs.get('href')
+            self._title = []
+
+    def text(self, text):
+        if self._a_depth is not None:
+            self._title.append(text)
+
+    def end_element(self, tag, depth):
+        if depth == self._a_depth:
+            self._a_depth = None
+        elif depth == self._title_td_depth:
+            self._title_td_depth = None
+        elif depth == self._tr_depth:
+            self._tr_depth = None
+            if self._tds < 2:
+                raise ValueError('作品列表的行中缺少书名列')
+            if self._link_found:
+                if self._href is None:
+                    raise ValueError('作品链接缺少href')
+                self.emit((join_stripped(self._title), self.author, self._href))